@@ -3,3 +3,5 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 """CLI Package."""
+
+__version__ = "2.0.1"
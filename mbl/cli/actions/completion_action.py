@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Completion action handler."""
+
+from mbl.cli.utils import completion
+
+
+def execute(args):
+    """Print the shell completion script.
+
+    Enable completion with `eval "$(mbl-cli completion bash)"`.
+    """
+    print(completion.BASH_SCRIPT.strip())
@@ -5,17 +5,22 @@
 
 """Delete certificate argument handler."""
 
-from mbl.cli.utils import cloudapi
-from mbl.cli.utils.store import Store
+from mbl.cli.utils import cloudapi, completion, output
+from mbl.cli.utils.store import get_store
 
 
 def execute(args):
     """Handle delete certificate actions."""
-    key = Store("user").api_key
-    api = cloudapi.DevCredentialsAPI(key)
-    if args.name in api.existing_cert_names:
-        print("Deleting certificate from Device Management.")
+    api = cloudapi.DevCredentialsAPI.from_store(get_store("user"))
+    try:
         api.delete_developer_certificate(args.name)
-    print("Deleting certificate locally.")
-    Store("team").delete_certificate(args.name)
-    print("Certificate '{}' was deleted.".format(args.name))
+    except ValueError:
+        # Not in Device Management, it may still be in the local store.
+        pass
+    else:
+        output.echo("Deleted certificate from Device Management.")
+        completion.forget_certificate(args.name)
+    output.echo("Deleting certificate locally.")
+    get_store("team").delete_certificate(args.name)
+    output.echo("Certificate '{}' was deleted.".format(args.name))
+    output.emit("certificate_deleted", name=args.name)
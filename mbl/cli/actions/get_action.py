@@ -5,7 +5,7 @@
 
 """Get action handler."""
 
-from mbl.cli.utils import ssh
+from mbl.cli.utils import output, ssh
 
 from . import utils
 
@@ -13,14 +13,15 @@ from . import utils
 def execute(args):
     """Entry point for the get cli command."""
     dev = utils.create_device(args.address, args.config_hostname)
-    print("Getting {} from device.\n".format(args.src_path))
+    output.echo("Getting {} from device.\n".format(args.src_path))
     ssh.SUPPRESS_PROGRESS = args.quiet
 
     with ssh.SSHSession(dev) as ssh_session:
-        ssh_session.get(
+        summary = ssh_session.get(
             remote_path=args.src_path,
             local_path=args.dst_path,
             recursive=args.recursive,
         )
 
-    print("\n\nTransfer completed.")
+    output.echo("\n\nTransfer completed.")
+    utils.emit_transfer("get", args.src_path, args.dst_path, dev, summary)
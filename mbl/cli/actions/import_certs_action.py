@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Entry point for the import-certificates command."""
+
+import pathlib
+
+from mbl.cli.utils import cert_bundle, cloudapi, output
+from mbl.cli.utils.store import get_store
+
+
+def execute(args):
+    """Import certificate files into the team store in one transaction."""
+    certificates = dict()
+    for path in args.files:
+        path = pathlib.Path(path)
+        name = path.stem
+        if name in certificates:
+            raise ValueError(
+                "More than one certificate file is named '{}'.".format(name)
+            )
+        certificates[name] = _read_certificate(path)
+    # All the files are parsed before the store is changed, and the batch
+    # saves all the certificates or none of them.
+    team_store = get_store("team")
+    with team_store.batch():
+        for name, certificate in certificates.items():
+            team_store.add_certificate(name, certificate)
+    for name, path in zip(certificates, args.files):
+        output.emit("certificate_imported", name=name, path=path)
+    output.echo("Imported certificates:\n{}".format("\n".join(certificates)))
+
+
+def _read_certificate(path):
+    if cert_bundle.is_bundle(path):
+        return cert_bundle.read(path)
+    return cloudapi.parse_existing_cert(str(path))
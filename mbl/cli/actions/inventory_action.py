@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Inventory action handler."""
+
+import concurrent.futures
+import datetime
+import time
+
+from mbl.cli.utils import device, inventory, output, resolve
+
+# Maximum number of devices to connect to at once when pinging devices.
+PING_JOBS = 16
+
+
+def execute(args):
+    """Entry point for the inventory action."""
+    if args.inventory_command == "add":
+        _add(args)
+    elif args.inventory_command == "remove":
+        with inventory.edit() as devices:
+            devices.remove(args.name)
+    elif args.inventory_command == "ping":
+        _ping(args)
+    else:
+        _list(args)
+
+
+def _add(args):
+    # Check the address can be used now rather than when the device is.
+    addresses = resolve.resolve(args.device_address)
+    with inventory.edit() as devices:
+        devices.add(
+            args.name,
+            args.device_address,
+            hostname=args.hostname,
+            tags=args.tags,
+            groups=args.groups,
+        )
+        devices.record_resolved(args.name, addresses)
+        dev = devices.get(args.name)
+    _show(dev)
+
+
+def _list(args):
+    devices = inventory.load()
+    shown = devices.with_tag(args.tag) if args.tag else list(devices)
+    if not shown:
+        output.echo("There are no devices in the inventory.")
+    for dev in shown:
+        _show(dev)
+
+
+def _ping(args):
+    devices = inventory.load()
+    if args.names:
+        targets = [devices.get(name) for name in args.names]
+    elif args.group:
+        targets = devices.in_group(args.group)
+    else:
+        targets = list(devices)
+    if not targets:
+        raise ValueError("There are no devices to ping.")
+    resolved = resolve.resolve_all(dev.address for dev in targets)
+    with concurrent.futures.ThreadPoolExecutor(PING_JOBS) as pool:
+        latencies = list(
+            pool.map(
+                lambda dev: _connect_time(resolved[dev.address], args),
+                targets,
+            )
+        )
+    with inventory.edit() as devices:
+        for dev, latency_s in zip(targets, latencies):
+            devices.record_resolved(dev.name, resolved[dev.address])
+            if latency_s is not None:
+                devices.record_seen(dev.name, latency_s=latency_s)
+        seen = [devices.get(dev.name) for dev in targets]
+    for dev in seen:
+        _show(dev)
+    unreachable = [
+        dev.name
+        for dev, latency_s in zip(targets, latencies)
+        if latency_s is None
+    ]
+    if unreachable:
+        raise IOError(
+            "Couldn't connect to {} of {} devices: {}".format(
+                len(unreachable), len(targets), ", ".join(unreachable)
+            )
+        )
+
+
+def _connect_time(addresses, args):
+    """Return the time taken to connect to a device, None on failure."""
+    # Import here so the other inventory commands don't import paramiko.
+    from mbl.cli.utils import ssh
+
+    start_time = time.monotonic()
+    try:
+        with ssh.SSHSession(
+            device.create_device(
+                args.config_hostname, addresses[0], addresses=addresses
+            )
+        ) as session:
+            # The session gives up without raising if every retry failed.
+            if not session.is_active():
+                return None
+            return time.monotonic() - start_time
+    except Exception:
+        return None
+
+
+def _show(dev):
+    if dev.last_seen is None:
+        seen = "never seen"
+    else:
+        seen = "seen {:%Y-%m-%d %H:%M}".format(
+            datetime.datetime.fromtimestamp(dev.last_seen)
+        )
+        if dev.latency_s is not None:
+            seen += ", {:.0f} ms to connect".format(dev.latency_s * 1000)
+    output.echo(
+        "{}: {} [{}] ({})".format(
+            dev.name,
+            dev.address,
+            ", ".join(
+                ["tag:" + t for t in dev.tags]
+                + ["group:" + g for g in dev.groups]
+            ),
+            seen,
+        )
+    )
+    output.emit("inventory_device", **dev._asdict())
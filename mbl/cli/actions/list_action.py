@@ -5,21 +5,100 @@
 
 """List action handler."""
 
+import threading
+import time
 
-from mbl.cli.utils import discovery, text_list
+from mbl.cli.utils import (
+    completion,
+    discovery,
+    inventory,
+    output,
+    text_list,
+)
 
 
 def execute(args):
     """Entry point for the list action."""
-    print(
+    if getattr(args, "live", False):
+        return _execute_live()
+    output.echo(
         "Discovering devices. "
         "This will take up to {} seconds.".format(discovery.TIMEOUT)
     )
     indexed_list = text_list.IndexedTextList()
-    discovery.do_discovery(indexed_list.append)
+    start_time = time.monotonic()
+
+    def _on_device_found(dev):
+        indexed_list.append(dev)
+        _emit_device(dev, start_time)
+
+    discovery.do_discovery(_on_device_found)
 
     if not indexed_list:
         raise IOError("No devices found!")
     else:
-        print(indexed_list)
+        remember_devices(indexed_list)
+        output.echo(indexed_list)
         return indexed_list
+
+
+def _execute_live():
+    output.echo(
+        "Discovering devices for {} seconds. "
+        "Press Ctrl+C to stop.".format(discovery.TIMEOUT)
+    )
+    live_list = LiveList()
+    try:
+        discovery.do_discovery(live_list, stop=threading.Event())
+    except KeyboardInterrupt:
+        pass
+    devices = live_list.devices
+    if not devices:
+        raise IOError("No devices found!")
+    remember_devices(devices)
+    return devices
+
+
+class LiveList:
+    """Discovery listener which shows each device as soon as it's found.
+
+    Devices are numbered in the order they are found, so the numbers shown
+    don't change as more devices are found.
+    """
+
+    def __init__(self):
+        """Start timing discovery."""
+        self._start_time = time.monotonic()
+        self._lock = threading.Lock()
+        self._devices = []
+
+    def __call__(self, dev):
+        """Show a device found by discovery, with its number."""
+        with self._lock:
+            self._devices.append(dev)
+            number = len(self._devices)
+        output.echo("{}: {}".format(number, text_list.format_device(dev)))
+        _emit_device(dev, self._start_time)
+
+    @property
+    def devices(self):
+        """Return a list of the devices found so far, in number order."""
+        with self._lock:
+            return list(self._devices)
+
+
+def remember_devices(devices):
+    """Record discovered devices for completion and in the inventory."""
+    completion.remember_devices([dev.address for dev in devices])
+    inventory.record_discovered(
+        [(dev.hostname, dev.address) for dev in devices]
+    )
+
+
+def _emit_device(dev, start_time):
+    output.emit(
+        "device",
+        hostname=dev.hostname,
+        address=dev.address,
+        elapsed_s=time.monotonic() - start_time,
+    )
@@ -5,22 +5,30 @@
 
 """List certificate argument handler."""
 
-from mbl.cli.utils import cloudapi, store
+from mbl.cli.utils import cloudapi, completion, output, store
 
 
 def execute(args):
     """Entry point for the 'list-dev-cert' command."""
-    key = store.Store("user").api_key
-    api = cloudapi.DevCredentialsAPI(key)
-    print(
+    user_store = store.get_store("user")
+    cache = cloudapi.CertificateCache(user_store, user_store.api_key)
+    if args.refresh:
+        cache.invalidate()
+    api = cloudapi.DevCredentialsAPI(user_store.api_key, cache=cache)
+    pelion_cert_names = api.existing_cert_names
+    completion.remember_certificates(pelion_cert_names, replace=True)
+    for name in pelion_cert_names:
+        output.emit("certificate", name=name, location="pelion")
+    output.echo(
         "Developer certificates in Pelion Device Management: "
-        "\n{}".format("\n".join(api.existing_cert_names)),
+        "\n{}".format("\n".join(pelion_cert_names)),
         end="\n\n",
     )
-    print(
+    local_cert_names = list(store.get_store("team").certificate_paths.keys())
+    for name in local_cert_names:
+        output.emit("certificate", name=name, location="local")
+    output.echo(
         "Developer and update certificates in local storage:\n"
-        "{}".format(
-            "\n".join(list(store.Store("team").certificate_paths.keys()))
-        ),
+        "{}".format("\n".join(local_cert_names)),
         end="\n\n",
     )
@@ -7,6 +7,7 @@
 
 import shlex
 
+from mbl.cli.utils import output
 from mbl.cli.utils.ssh import SSHCallError, SSHSession
 
 from . import utils
@@ -17,7 +18,7 @@ def execute(args):
     device = utils.create_device(args.address, args.config_hostname)
     with SSHSession(device) as ssh:
         try:
-            output = ssh.run_cmd(
+            cmd_output = ssh.run_cmd(
                 "{} --get-pelion-status".format(
                     shlex.quote(utils.PROVISIONING_UTIL_PATH)
                 ),
@@ -31,9 +32,16 @@ def execute(args):
                 "provision-pelion command."
             )
         else:
-            remote_stdout = output[1]
+            remote_stdout = cmd_output[1]
             if remote_stdout.readable():
-                print(remote_stdout.read().decode())
+                status = remote_stdout.read().decode()
+                output.echo(status)
+                output.emit(
+                    "pelion_status",
+                    address=device.address,
+                    configured=True,
+                    status=status,
+                )
 
 
 class PelionConfigurationError(Exception):
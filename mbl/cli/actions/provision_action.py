@@ -7,18 +7,23 @@
 
 import os
 import shlex
+import tempfile
+import time
 
 from mbl.cli.utils.cloudapi import (
     DevCredentialsAPI,
     parse_existing_update_cert,
 )
-from mbl.cli.utils.store import Store
+from mbl.cli.utils import cert_bundle, completion, metrics, output
+from mbl.cli.utils.store import get_store
 
 from . import utils
 
 
+@metrics.timed("mbl_cli_provision_seconds")
 def execute(args):
     """Handle the provision-pelion command."""
+    start_time = time.monotonic()
     dev_cert_name = args.dev_cert_name
     update_cert_name = args.update_cert_name
     if args.update_cert_path:
@@ -28,25 +33,23 @@ def execute(args):
 
     if args.create_dev_cert:
         # Create a dev cert using the Pelion Service API and save it.
-        dev_cert_data = _create_certificate(_get_api_key(), dev_cert_name)
+        dev_cert_data = _create_certificate(dev_cert_name)
         _save_certificate(dev_cert_name, dev_cert_data)
+        completion.remember_certificates([dev_cert_name])
 
-    # get the parsed certificate data file paths from the store
+    # get the parsed certificate data from the store
     try:
-        dev_cert_paths = _get_certificate_path_from_store(dev_cert_name)
+        dev_cert_data = _get_certificate_from_store(dev_cert_name)
     except ValueError:
-        print(
+        output.echo(
             "Developer certificate not found in the local store. Trying to "
             "find a certificate with the given name in Pelion Device "
             "Management"
         )
-        dev_cert_data = _get_certificate_from_pelion(
-            _get_api_key(), dev_cert_name
-        )
+        dev_cert_data = _get_certificate_from_pelion(dev_cert_name)
         _save_certificate(dev_cert_name, dev_cert_data)
-        dev_cert_paths = _get_certificate_path_from_store(dev_cert_name)
 
-    update_cert_paths = _get_certificate_path_from_store(update_cert_name)
+    update_cert_data = _get_certificate_from_store(update_cert_name)
     # transfer the certificates to the device and provision it
     # by calling an on-device module.
     target_dir = "/scratch/provisioning-certs"
@@ -57,8 +60,7 @@ def execute(args):
     )
     try:
         _transfer_certs_to_device(
-            dev_cert_paths=dev_cert_paths,
-            update_cert_paths=update_cert_paths,
+            certificate=dict(dev_cert_data, **update_cert_data),
             remote_target_dir=target_dir,
             address=args.address,
             hostname=args.config_hostname,
@@ -70,38 +72,37 @@ def execute(args):
             address=args.address,
             hostname=args.config_hostname,
         )
+    output.emit(
+        "provisioned",
+        dev_cert_name=dev_cert_name,
+        update_cert_name=update_cert_name,
+        duration_s=time.monotonic() - start_time,
+    )
 
 
-def _get_api_key():
-    store_handle = Store("user")
-    key = store_handle.api_key
-    if not key:
+def _get_dev_credentials_api():
+    store_handle = get_store("user")
+    if not store_handle.api_key:
         raise ValueError("You have not added an API key to the store.")
-    return key
+    return DevCredentialsAPI.from_store(store_handle)
 
 
-def _get_certificate_path_from_store(cert_name):
-    sh = Store("team")
-    try:
-        return sh.certificate_paths[cert_name]
-    except KeyError:
-        raise ValueError(
-            "Certificate '{}' not found in the store.".format(cert_name)
-        )
+def _get_certificate_from_store(cert_name):
+    return get_store("team").get_certificate(cert_name)
 
 
-def _get_certificate_from_pelion(api_key, cert_name):
-    dev_creds_api = DevCredentialsAPI(api_key)
+def _get_certificate_from_pelion(cert_name):
+    dev_creds_api = _get_dev_credentials_api()
     return dev_creds_api.get_dev_credentials(cert_name)
 
 
-def _create_certificate(api_key, cert_name):
-    credentials_api = DevCredentialsAPI(api_key)
+def _create_certificate(cert_name):
+    credentials_api = _get_dev_credentials_api()
     return credentials_api.create_dev_credentials(cert_name)
 
 
 def _save_certificate(cert_name, cert_data):
-    team_store_handle = Store("team")
+    team_store_handle = get_store("team")
     team_store_handle.add_certificate(cert_name, cert_data)
 
 
@@ -117,34 +118,29 @@ def _prepare_remote_dir(target_dir, ssh=None, address=None, hostname=None):
 
 @utils.ssh_session
 def _transfer_certs_to_device(
-    dev_cert_paths,
-    update_cert_paths,
-    remote_target_dir,
-    ssh=None,
-    address=None,
-    hostname=None,
+    certificate, remote_target_dir, ssh=None, address=None, hostname=None
 ):
-    local_dev_dir = os.path.dirname(dev_cert_paths[0])
-    local_update_dir = os.path.dirname(update_cert_paths[0])
-    # transfer the certificate payloads to the device
-    ssh.put(local_dev_dir, remote_target_dir, recursive=True)
-    ssh.put(local_update_dir, remote_target_dir, recursive=True)
-    # move all files to the `target_dir` root for pelion-provisioning-util
-    remote_dev_tmpdir = "/".join(
-        [remote_target_dir, os.path.basename(local_dev_dir)]
-    )
-    ssh.run_cmd(
-        "mv {}/* {}".format(
-            shlex.quote(remote_dev_tmpdir), shlex.quote(remote_target_dir)
-        ),
-        check=True,
-    )
-    remote_update_tmpdir = "/".join(
-        [remote_target_dir, os.path.basename(local_update_dir)]
+    # transfer the certificates to the device as a single bundle
+    remote_bundle = "/".join(
+        [remote_target_dir, "provisioning" + cert_bundle.SUFFIX]
     )
+    fd, local_bundle = tempfile.mkstemp(suffix=cert_bundle.SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as bfile:
+            bfile.write(cert_bundle.pack(certificate))
+        ssh.put(local_bundle, remote_bundle)
+    finally:
+        os.remove(local_bundle)
+    # unpack the bundle into the `target_dir` root for
+    # pelion-provisioning-util, check the checksums, then remove the
+    # bundle metadata.
     ssh.run_cmd(
-        "mv {}/* {}".format(
-            shlex.quote(remote_update_tmpdir), shlex.quote(remote_target_dir)
+        "cd {dir} && tar -x -f {bundle} && sha256sum -c {sums} >/dev/null"
+        " && rm -f {bundle} {sums} {manifest}".format(
+            dir=shlex.quote(remote_target_dir),
+            bundle=shlex.quote(remote_bundle),
+            sums=cert_bundle.CHECKSUMS_NAME,
+            manifest=cert_bundle.MANIFEST_NAME,
         ),
         check=True,
     )
@@ -160,5 +156,5 @@ def _provision_device(ssh=None, address=None, hostname=None):
     ssh.run_cmd(
         "{} --provision".format(shlex.quote(utils.PROVISIONING_UTIL_PATH)),
         check=True,
-        writeout=True,
+        writeout=not output.is_json(),
     )
@@ -5,23 +5,27 @@
 
 """Put action handler."""
 
-
-from mbl.cli.utils import ssh
+from mbl.cli.utils import output, ssh
 
 from . import utils
 
 
 def execute(args):
     """Entry point for the put action."""
-    dev = utils.create_device(args.address, args.config_hostname)
-    print("Putting {} on device.\n".format(args.src_path))
     ssh.SUPPRESS_PROGRESS = args.quiet
+    utils.for_each_device(
+        utils.target_devices(args), lambda dev: _put(dev, args)
+    )
+
 
+def _put(dev, args):
+    output.echo("Putting {} on device.\n".format(args.src_path))
     with ssh.SSHSession(dev) as ssh_session:
-        ssh_session.put(
+        summary = ssh_session.put(
             local_path=args.src_path,
             remote_path=args.dst_path,
             recursive=args.recursive,
         )
 
-    print("\n\nTransfer completed.")
+    output.echo("\n\nTransfer completed.")
+    utils.emit_transfer("put", args.src_path, args.dst_path, dev, summary)
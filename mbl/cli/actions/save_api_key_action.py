@@ -5,13 +5,13 @@
 
 """Entry point for save-api-key action."""
 
-from mbl.cli.utils.store import Store
+from mbl.cli.utils.store import get_store
 from mbl.cli.utils.cloudapi import valid_api_key
 
 
 def execute(args):
     """Execute the save-api-key action."""
-    store_handle = Store("user")
+    store_handle = get_store("user")
     if not valid_api_key(args.key):
         raise ValueError("API key not recognised by Pelion Device Management.")
     store_handle.api_key = args.key
@@ -6,23 +6,59 @@
 """Select action handler."""
 
 
-from mbl.cli.utils import device, file_handler
+from mbl.cli.utils import (
+    device,
+    discovery,
+    file_handler,
+    inventory,
+    output,
+    resolve,
+)
 
 from . import list_action
 
 
 def execute(args):
     """Entry point for the select command."""
-    list_of_devices = list_action.execute(args)
-    user_input = input("\nSelect a device from the list: ")
+    if getattr(args, "name", None):
+        dev = inventory.load().get(args.name)
+        addresses = resolve.resolve(dev.address)
+        # Recorded so `which` can name the device without a lookup.
+        with inventory.edit() as devices:
+            devices.record_resolved(dev.name, addresses)
+        file_handler.save_device_info(
+            device.create_device(
+                dev.hostname, addresses[0], addresses=addresses
+            )
+        )
+        return
+    output.echo(
+        "Discovering devices for up to {} seconds. Devices are shown as "
+        "they are found.".format(discovery.TIMEOUT)
+    )
+    live_list = list_action.LiveList()
+
+    def _on_finished():
+        # input() is still waiting, tell the user there is nothing more.
+        if live_list.devices:
+            output.echo("Discovery finished.")
+        else:
+            output.echo("No devices found! Press Enter to exit.")
+
+    with discovery.BackgroundDiscovery(live_list, on_finished=_on_finished):
+        user_input = input(
+            "Enter the number of a device to select it at any time:\n"
+        )
+    list_of_devices = live_list.devices
+    if not list_of_devices:
+        raise IOError("No devices found!")
+    list_action.remember_devices(list_of_devices)
     try:
         user_input = int(user_input)
         if user_input <= 0:
             raise ValueError
-        selected_device = list_of_devices[user_input - 1]
-        name, addr = selected_device.split(": ")
+        dev = list_of_devices[user_input - 1]
     except (ValueError, IndexError):
         raise IndexError("Enter a valid device index as shown in the list.")
     else:
-        dev = device.create_device(name, addr)
         file_handler.save_device_info(dev)
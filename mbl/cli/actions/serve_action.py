@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Serve action handler."""
+
+import os
+
+from mbl.cli import api, server
+from mbl.cli.utils import metrics, output
+
+
+def execute(args):
+    """Entry point for the serve action."""
+    socket_path = args.socket or server.DEFAULT_SOCKET_PATH
+    with api.Client(args.config_hostname) as client:
+        rpc_server = server.create_server(
+            client, socket_path=socket_path, port=args.port
+        )
+        location = (
+            "localhost:{}".format(args.port) if args.port else socket_path
+        )
+        output.echo("Serving on {}. Press Ctrl+C to stop.".format(location))
+        if rpc_server.token_path:
+            output.echo(
+                "Requests must hold the token in {}.".format(
+                    rpc_server.token_path
+                )
+            )
+        output.emit("serving", location=location)
+        try:
+            with metrics.write_periodically(
+                args.metrics_file, args.metrics_format
+            ):
+                rpc_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            rpc_server.server_close()
+            if args.port is None:
+                os.unlink(socket_path)
+            else:
+                os.unlink(rpc_server.token_path)
@@ -5,22 +5,81 @@
 
 """Shell action handler."""
 
+import time
 
-from mbl.cli.utils import ssh
+from mbl.cli.utils import output, ssh
 
 from . import utils
 
 
 def execute(args):
     """Entry point for the shell action."""
-    dev = utils.create_device(args.address, args.config_hostname)
+    devices = utils.target_devices(args)
+    if len(devices) > 1 and not (args.script or args.cmd):
+        raise ValueError(
+            "An interactive shell can't be started on a group of devices. "
+            "Give a command or a script to run."
+        )
+    utils.for_each_device(devices, lambda dev: _shell(dev, args))
 
+
+def _shell(dev, args):
     with ssh.SSHSession(dev) as ssh_session:
-        if args.cmd:
+        if args.script:
+            cmds = read_script(args.script)
+            if not args.quiet:
+                output.echo(
+                    "Running {} commands on the device...".format(len(cmds))
+                )
+            _run_batch(ssh_session, cmds, args.jobs, args.quiet)
+        elif args.cmd:
+            if output.is_json():
+                # Run the command as a batch of one so we get its output and
+                # exit code back as a structured result.
+                _run_batch(ssh_session, [args.cmd], 1, args.quiet)
+                return
             if not args.quiet:
-                print("Running a command on the device...")
+                output.echo("Running a command on the device...")
             ssh_session.run_cmd(args.cmd, check=True, writeout=not args.quiet)
         else:
+            if output.is_json():
+                raise ValueError(
+                    "An interactive shell can't be started when the output "
+                    "format is json. Give a command or a script to run."
+                )
             if not args.quiet:
-                print("Starting an interactive shell...")
+                output.echo("Starting an interactive shell...")
             ssh_session.start_shell()
+
+
+def read_script(path):
+    """Read a script file, return a list of the commands it contains.
+
+    Each non-empty line is a command. Lines starting with '#' are ignored.
+    """
+    with open(path) as script_file:
+        lines = (line.strip() for line in script_file)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+def _run_batch(ssh_session, cmds, jobs, quiet):
+    """Run a batch of commands, raise if any of the commands failed."""
+    start_time = time.monotonic()
+    results = ssh_session.run_batch(cmds, jobs=jobs)
+    duration = time.monotonic() - start_time
+    for result in results:
+        if not quiet:
+            output.echo("$ {}".format(result.cmd))
+            output.echo(result.stdout, end="")
+            output.echo(result.stderr, end="")
+        output.emit("command", batch_duration_s=duration, **result._asdict())
+    failed = [r for r in results if r.exit_code != 0]
+    if failed:
+        # A command which never completed has no exit code of its own.
+        raise ssh.SSHCallError(
+            "{} of {} commands returned a non-zero exit code. "
+            "First failure: `{}`".format(
+                len(failed), len(results), failed[0].cmd
+            ),
+            code=failed[0].exit_code or 255,
+        )
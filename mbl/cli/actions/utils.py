@@ -8,7 +8,7 @@
 import functools
 import socket
 
-from mbl.cli.utils import device, file_handler, ssh
+from mbl.cli.utils import device, file_handler, inventory, output, resolve
 
 
 # The path to the "pelion-provisioning-util" utility on the target.
@@ -29,6 +29,9 @@ def ssh_session(func):
     # retain metadata from the 'wrapped' function 'object'.
     @functools.wraps(func)
     def wrapper(**kwargs):
+        # Import here so commands which don't use ssh don't import paramiko.
+        from mbl.cli.utils import ssh
+
         with ssh.SSHSession(
             create_device(kwargs["address"], kwargs["hostname"])
         ) as session:
@@ -37,16 +40,95 @@ def ssh_session(func):
     return wrapper
 
 
+def emit_transfer(direction, src_path, dst_path, dev, summary):
+    """Emit a record describing a completed get or put transfer.
+
+    :param direction str: "get" or "put".
+    :param summary TransferSummary: summary returned by the transfer.
+    """
+    output.emit(
+        "transfer",
+        direction=direction,
+        src_path=src_path,
+        dst_path=dst_path,
+        address=dev.address,
+        files=summary.files,
+        bytes=summary.bytes,
+        duration_s=summary.duration_s,
+    )
+
+
+def target_devices(args):
+    """Return the devices a command targets.
+
+    These are the devices in the inventory group given with --group, or
+    the device given with --address, or the selected device.
+
+    :param args Namespace: args from the cli parser.
+    :returns list: a DeviceInfo for each device.
+    """
+    if not getattr(args, "group", None):
+        return [create_device(args.address, args.config_hostname)]
+    members = inventory.load().in_group(args.group)
+    if not members:
+        raise ValueError(
+            "There are no devices in the group '{}'.".format(args.group)
+        )
+    resolved = resolve.resolve_all(member.address for member in members)
+    return [
+        device.create_device(
+            args.config_hostname,
+            resolved[member.address][0],
+            addresses=resolved[member.address],
+        )
+        for member in members
+    ]
+
+
+def for_each_device(devices, func):
+    """Call func(dev) for each device, continuing if a device fails.
+
+    With more than one device, a heading is written before each device's
+    output, and an IOError is raised after all the devices are done if
+    any of them failed.
+    """
+    if len(devices) == 1:
+        func(devices[0])
+        return
+    failed = []
+    for dev in devices:
+        output.echo("\n== {} ==".format(dev.address))
+        try:
+            func(dev)
+        except Exception as error:
+            output.echo("Failed: {}".format(error))
+            output.emit("error", address=dev.address, message=str(error))
+            failed.append(dev.address)
+    if failed:
+        raise IOError(
+            "{} of {} devices failed: {}".format(
+                len(failed), len(devices), ", ".join(failed)
+            )
+        )
+
+
 def create_device(address=None, hostname=None):
     """Create a device from either a file or args, depending on args.
 
-    :param args Namespace: args from the cli parser.
+    :param address str: an IPv4 or IPv6 address, or a hostname to resolve.
+    Use the selected device if None.
+    :param hostname str: the hostname to look up in ~/.ssh/config.
     """
     if address:
         if is_valid_ipv4_address(address) or is_valid_ipv6_address(address):
             data = {"hostname": "", "address": address}
         else:
-            raise ValueError("Invalid address given.")
+            addresses = resolve.resolve(address)
+            data = {
+                "hostname": "",
+                "address": addresses[0],
+                "addresses": addresses,
+            }
     else:
         data = file_handler.read_device_file()
     data["hostname"] = hostname
@@ -5,6 +5,8 @@
 
 """Which action handler."""
 
+from mbl.cli.utils import inventory, output
+
 from . import utils
 
 
@@ -12,4 +14,29 @@ def execute(args):
     """Entry point for which action."""
     args.address = None
     device = utils.create_device(args.address)
-    print("{} ({})".format(device.hostname, device.address))
+    name = _inventory_name(device)
+    output.echo(
+        "{}{} ({})".format(
+            "{}: ".format(name) if name else "",
+            device.hostname,
+            device.address,
+        )
+    )
+    output.emit(
+        "device", hostname=device.hostname, address=device.address, name=name
+    )
+
+
+def _inventory_name(device):
+    """Return the inventory name of a device, or None if it has none.
+
+    Devices stored by hostname are matched by the addresses recorded when
+    they were last added, selected or pinged. Names aren't resolved, so
+    `which` never waits for the network.
+    """
+    devices = inventory.load()
+    for address in device.addresses:
+        named = devices.by_address(address)
+        if named is not None:
+            return named.name
+    return None
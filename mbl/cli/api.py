@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Python API for the Mbed Linux OS CLI.
+
+Provides the operations available through the command line as methods on
+a `Client` object, so they can be used in-process without spawning a new
+interpreter for every operation.
+
+The `Client` keeps state between calls: SSH sessions stay open for each
+device address, discovered devices are kept until a refresh is asked for,
+and Pelion API clients are created once per API key.
+Call `Client.close` (or use the client as a context manager) to close the
+SSH sessions.
+
+Return values are plain dicts and lists so they can be serialised to JSON.
+
+Example:
+----
+    with Client() as client:
+        for dev in client.list_devices():
+            print(client.run(dev["address"], "uname -a")["stdout"])
+"""
+
+import shlex
+import threading
+
+from mbl.cli.actions import utils
+from mbl.cli.utils import cloudapi, device, discovery, ssh, store
+
+
+class Client:
+    """Stateful entry point for MBL CLI operations."""
+
+    # Methods which may be called remotely by the server.
+    RPC_METHODS = (
+        "list_devices",
+        "selected_device",
+        "run",
+        "run_batch",
+        "put",
+        "get",
+        "pelion_status",
+        "list_certificates",
+        "disconnect",
+    )
+
+    def __init__(self, config_hostname="mbl-device"):
+        """:param config_hostname str: hostname used in ~/.ssh/config."""
+        self.config_hostname = config_hostname
+        self._sessions = dict()
+        self._sessions_lock = threading.Lock()
+        self._connect_locks = dict()
+        self._devices = device.DeviceRegistry()
+        self._discovery_lock = threading.Lock()
+
+    def __enter__(self):
+        """Enter the context, return self."""
+        return self
+
+    def __exit__(self, *exception_info):
+        """Exit the context, close all SSH sessions."""
+        self.close()
+        return False
+
+    def close(self):
+        """Close all open SSH sessions."""
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.__exit__(None, None, None)
+
+    def list_devices(self, refresh=False):
+        """Discover devices on the network.
+
+        The devices found are kept, and returned by later calls without
+        browsing again until some are found or `refresh` is True.
+
+        :param refresh bool: discover devices again.
+        :returns list: {"hostname": str, "address": str} for each device.
+        """
+        with self._discovery_lock:
+            if refresh or not self._devices:
+                devices = device.DeviceRegistry()
+                discovery.do_discovery(devices.add)
+                self._devices = devices
+            found = list(self._devices)
+        return [
+            dict(hostname=dev.hostname, address=dev.address) for dev in found
+        ]
+
+    def selected_device(self):
+        """Return the device saved by the select command."""
+        dev = utils.create_device(None, self.config_hostname)
+        return dict(hostname=dev.hostname, address=dev.address)
+
+    def run(self, address, cmd):
+        """Run a command on a device.
+
+        Methods taking an `address` use the selected device if it is None.
+
+        :returns dict: The command's stdout, stderr and exit_code.
+        """
+        return self.run_batch(address, [cmd])[0]
+
+    def run_batch(self, address, cmds, jobs=1):
+        """Run several commands on a device using a single channel.
+
+        See `SSHSession.run_batch`.
+
+        :returns list: The stdout, stderr and exit_code of each command.
+        """
+        results = self._session(address).run_batch(cmds, jobs=jobs)
+        return [r._asdict() for r in results]
+
+    def put(self, address, local_path, remote_path, recursive=False):
+        """Put a file or directory on a device.
+
+        :returns dict: The number of files and bytes sent, and the duration.
+        """
+        summary = self._session(address).put(
+            local_path=local_path, remote_path=remote_path, recursive=recursive
+        )
+        return summary._asdict()
+
+    def get(self, address, remote_path, local_path, recursive=False):
+        """Get a file or directory from a device.
+
+        :returns dict: The number of files and bytes received, and the
+        duration.
+        """
+        summary = self._session(address).get(
+            remote_path=remote_path, local_path=local_path, recursive=recursive
+        )
+        return summary._asdict()
+
+    def pelion_status(self, address):
+        """Get the Pelion Device Management status of a device.
+
+        :returns dict: "configured" is True if the device is provisioned,
+        "status" holds the output of the provisioning utility.
+        """
+        result = self.run(
+            address,
+            "{} --get-pelion-status".format(
+                shlex.quote(utils.PROVISIONING_UTIL_PATH)
+            ),
+        )
+        return dict(
+            configured=result["exit_code"] == 0, status=result["stdout"]
+        )
+
+    def list_certificates(self):
+        """List certificates in Pelion Device Management and the team store.
+
+        :returns dict: certificate names under "pelion" and "local".
+        """
+        # The SDK clients are shared, so this is cheap to create per call.
+        api = cloudapi.DevCredentialsAPI.from_store(store.get_store("user"))
+        return dict(
+            pelion=api.existing_cert_names,
+            local=list(store.get_store("team").certificate_paths.keys()),
+        )
+
+    def disconnect(self, address):
+        """Close the SSH session to a device, if one is open."""
+        address = utils.create_device(address, self.config_hostname).address
+        with self._sessions_lock:
+            session = self._sessions.pop(address, None)
+        if session is not None:
+            session.__exit__(None, None, None)
+
+    def _session(self, address):
+        """Return an open SSH session for address, connect if necessary.
+
+        If address is None the session is for the selected device.
+        """
+        dev = utils.create_device(address, self.config_hostname)
+        with self._sessions_lock:
+            connect_lock = self._connect_locks.setdefault(
+                dev.address, threading.Lock()
+            )
+        # Only hold the lock for this address while connecting, so one slow
+        # device doesn't hold up operations on other devices.
+        with connect_lock:
+            session = self._sessions.get(dev.address)
+            if session is None or not session.is_active():
+                if session is not None:
+                    # Close the lost connection's client and transport.
+                    session.__exit__(None, None, None)
+                session = ssh.SSHSession(dev).__enter__()
+                with self._sessions_lock:
+                    self._sessions[dev.address] = session
+            return session
@@ -6,26 +6,37 @@
 """Parser for the cli."""
 
 import argparse
+import importlib
 import sys
 import os
 
-from mbl.cli.actions import (
-    get_action,
-    list_action,
-    put_action,
-    select_action,
-    shell_action,
-    which_action,
-    provision_action,
-    save_api_key_action,
-    pelion_status_action,
-    delete_cert_action,
-    list_certs_action,
-)
+from mbl.cli.utils import metrics, output
 
 
 def parse_args(description):
     """Parse the command line args."""
+    parser = build_parser(description)
+    args_namespace = parser.parse_args()
+
+    # We want to fail gracefully, with a consistent
+    # help message, in the no argument case.
+    # So here's an obligatory hasattr hack.
+    if not hasattr(args_namespace, "func") and not args_namespace.version:
+        parser.error("No arguments given!")
+    elif args_namespace.group and not getattr(
+        args_namespace, "group_command", False
+    ):
+        parser.error("--group can't be used with this command.")
+    else:
+        return args_namespace
+
+
+def build_parser(description=None):
+    """Build the argument parser for the cli.
+
+    Arguments whose values can be completed from the completion index have
+    a `completer` attribute naming the kind of value they take.
+    """
     parser = ArgumentParserWithDefaultHelp(
         description=description,
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -40,8 +51,16 @@ def parse_args(description):
         "-a",
         "--address",
         help="The ipv4/6 address or hostname of the device"
-        " you want to communicate with. ",
-    )
+        " you want to communicate with. Hostnames, including mDNS .local"
+        " names, are resolved and cached for a few minutes.",
+    ).completer = "devices"
+    parser.add_argument(
+        "-g",
+        "--group",
+        help="Run the command on each device in this group of the device "
+        "inventory. Only the put, shell and inventory ping commands accept "
+        "a group.",
+    ).completer = "groups"
     parser.add_argument(
         "-c",
         "--config-hostname",
@@ -57,6 +76,38 @@ def parse_args(description):
         help="Stop messages from remote commands.",
         action="store_true",
     )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Output format. 'json' writes each result as a line of JSON "
+        "as soon as it is available.",
+        choices=output.FORMATS,
+        default=output.TEXT,
+    )
+    parser.add_argument(
+        "--profile",
+        help="Print the time spent in each phase of the command, such as "
+        "discovery, SSH connection and Pelion API requests, to stderr.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile-trace",
+        metavar="FILE",
+        help="Write the phases of the command to FILE in the Chrome trace "
+        "format, which chrome://tracing and Perfetto can display.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="FILE",
+        help="Write metrics of SSH connections, transfers and provisioning "
+        "to FILE when the command ends, and periodically while serving.",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        help="Format of the metrics file.",
+        choices=metrics.FORMATS,
+        default=metrics.PROMETHEUS,
+    )
 
     command_group = parser.add_subparsers(
         title="mbl-cli supports the following commands",
@@ -64,13 +115,26 @@ def parse_args(description):
     )
 
     lister = command_group.add_parser("list")
-    lister.set_defaults(func=list_action.execute)
+    lister.add_argument(
+        "-l",
+        "--live",
+        action="store_true",
+        help="Show each device as soon as it's found, and keep looking for "
+        "devices until the discovery timeout or Ctrl+C.",
+    )
+    lister.set_defaults(func=_lazy_action("list_action"))
 
     select = command_group.add_parser("select")
-    select.set_defaults(func=select_action.execute)
+    select.add_argument(
+        "name",
+        nargs="?",
+        help="Select the device with this name in the device inventory, "
+        "without discovering devices.",
+    ).completer = "inventory"
+    select.set_defaults(func=_lazy_action("select_action"))
 
     which = command_group.add_parser("which")
-    which.set_defaults(func=which_action.execute)
+    which.set_defaults(func=_lazy_action("which_action"))
 
     get = command_group.add_parser("get")
     get.add_argument(
@@ -87,7 +151,7 @@ def parse_args(description):
         action="store_true",
         help="Get the contents of a directory recursively.",
     )
-    get.set_defaults(func=get_action.execute)
+    get.set_defaults(func=_lazy_action("get_action"))
 
     put = command_group.add_parser("put")
     put.add_argument(
@@ -104,21 +168,108 @@ def parse_args(description):
         action="store_true",
         help="Put the contents of a directory recursively.",
     )
-    put.set_defaults(func=put_action.execute)
+    put.set_defaults(func=_lazy_action("put_action"), group_command=True)
 
     shell = command_group.add_parser("shell")
-    shell.add_argument(
+    shell_input = shell.add_mutually_exclusive_group()
+    shell_input.add_argument(
         "cmd",
         nargs="?",
         help="Run a command on the device. "
         "If the command contains spaces, "
         "enclose in single quotes. Example: 'ls -la'",
     )
-    shell.set_defaults(func=shell_action.execute)
+    shell_input.add_argument(
+        "-s",
+        "--script",
+        help="Run each line of a script file as a separate command on the "
+        "device, using a single connection. Lines starting with '#' are "
+        "ignored.",
+        metavar="SCRIPT_PATH",
+    )
+    shell.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of commands from the script to run concurrently. "
+        "Only use this if the commands are independent of each other.",
+    )
+    shell.set_defaults(func=_lazy_action("shell_action"), group_command=True)
+
+    inventory = command_group.add_parser("inventory")
+    inventory_commands = inventory.add_subparsers(
+        title="inventory commands", dest="inventory_command"
+    )
+    # After add_subparsers, so the default isn't replaced by its None.
+    # Without a command, the list command's arguments are needed too.
+    inventory.set_defaults(
+        func=_lazy_action("inventory_action"),
+        inventory_command="list",
+        tag=None,
+    )
+    inventory_list = inventory_commands.add_parser(
+        "list", help="List the devices in the inventory."
+    )
+    inventory_list.add_argument(
+        "-t", "--tag", help="Only list the devices with this tag."
+    )
+    inventory_add = inventory_commands.add_parser(
+        "add",
+        help="Add a device to the inventory, or change the address of a "
+        "device and add tags and groups to it.",
+    )
+    inventory_add.add_argument("name", help="Name of the device.")
+    inventory_add.add_argument(
+        "device_address",
+        metavar="address",
+        help="The ipv4/6 address or hostname of the device.",
+    ).completer = "devices"
+    inventory_add.add_argument(
+        "--hostname",
+        default="",
+        help="The hostname the device is discovered with, so discovery "
+        "updates its address.",
+    )
+    inventory_add.add_argument(
+        "-t",
+        "--tag",
+        action="append",
+        default=[],
+        dest="tags",
+        help="Tag the device. Can be given more than once.",
+    )
+    inventory_add.add_argument(
+        "--in-group",
+        action="append",
+        default=[],
+        dest="groups",
+        metavar="GROUP",
+        help="Add the device to a group. Can be given more than once.",
+    )
+    inventory_remove = inventory_commands.add_parser(
+        "remove", help="Remove a device from the inventory."
+    )
+    inventory_remove.add_argument(
+        "name", help="Name of the device."
+    ).completer = "inventory"
+    inventory_ping = inventory_commands.add_parser(
+        "ping",
+        help="Connect to devices in the inventory, and record whether they "
+        "were seen and how long connecting took.",
+    )
+    inventory_ping.add_argument(
+        "names",
+        nargs="*",
+        metavar="name",
+        help="Names of the devices. Default: the devices in the --group "
+        "group, or all the devices.",
+    ).completer = "inventory"
+    inventory_ping.set_defaults(group_command=True)
 
     save_api_key = command_group.add_parser("save-api-key")
     save_api_key.add_argument("key", help="The API key to store.")
-    save_api_key.set_defaults(func=save_api_key_action.execute)
+    save_api_key.set_defaults(func=_lazy_action("save_api_key_action"))
 
     provision = command_group.add_parser("provision-pelion")
     provision.add_argument(
@@ -127,14 +278,14 @@ def parse_args(description):
         "if -c is also given). "
         "Certificates can only be fetched if they've already been added "
         "to the Team Store.",
-    )
+    ).completer = "certificates"
     provision.add_argument(
         "update_cert_name",
         help="Name of the update certificate to fetch (or parse from an "
         "update_default_resources.c file and store if -p is given). "
         "Certificates can only be fetched if they've already been added "
         "to the Team Store.",
-    )
+    ).completer = "certificates"
     provision.add_argument(
         "-p",
         "--parse-update-cert",
@@ -149,29 +300,82 @@ def parse_args(description):
         action="store_true",
         help="Create a new developer certificate.",
     )
-    provision.set_defaults(func=provision_action.execute)
+    provision.set_defaults(func=_lazy_action("provision_action"))
 
     query_pelion = command_group.add_parser("get-pelion-status")
-    query_pelion.set_defaults(func=pelion_status_action.execute)
+    query_pelion.set_defaults(func=_lazy_action("pelion_status_action"))
 
     delete_cert = command_group.add_parser("delete-certificate")
     delete_cert.add_argument(
         "name", help="Name of the developer certificate to delete"
-    )
-    delete_cert.set_defaults(func=delete_cert_action.execute)
+    ).completer = "certificates"
+    delete_cert.set_defaults(func=_lazy_action("delete_cert_action"))
 
     list_certs = command_group.add_parser("list-certificates")
-    list_certs.set_defaults(func=list_certs_action.execute)
+    list_certs.add_argument(
+        "-r",
+        "--refresh",
+        action="store_true",
+        help="List the certificates in Pelion Device Management even if "
+        "they were listed recently.",
+    )
+    list_certs.set_defaults(func=_lazy_action("list_certs_action"))
 
-    args_namespace = parser.parse_args()
+    import_certs = command_group.add_parser("import-certificates")
+    import_certs.add_argument(
+        "files",
+        nargs="+",
+        metavar="FILE",
+        help="Developer or update certificate files (C source files or "
+        ".mblcert bundles). Each certificate is named after its file, "
+        "without the extension.",
+    )
+    import_certs.set_defaults(func=_lazy_action("import_certs_action"))
 
-    # We want to fail gracefully, with a consistent
-    # help message, in the no argument case.
-    # So here's an obligatory hasattr hack.
-    if not hasattr(args_namespace, "func") and not args_namespace.version:
-        parser.error("No arguments given!")
-    else:
-        return args_namespace
+    serve = command_group.add_parser("serve")
+    serve_location = serve.add_mutually_exclusive_group()
+    serve_location.add_argument(
+        "-s",
+        "--socket",
+        help="Path of the Unix socket to listen on. "
+        "Default: ~/.mbl-cli.sock",
+    )
+    serve_location.add_argument(
+        "-p",
+        "--port",
+        type=int,
+        help="Listen on this localhost TCP port instead of a Unix socket. "
+        "Requests must hold the token written to ~/.mbl-cli.token.",
+    )
+    serve.set_defaults(func=_lazy_action("serve_action"))
+
+    completion = command_group.add_parser("completion")
+    completion.add_argument(
+        "shell",
+        nargs="?",
+        choices=["bash"],
+        default="bash",
+        help="The shell to print a completion script for.",
+    )
+    completion.set_defaults(func=_lazy_action("completion_action"))
+
+    return parser
+
+
+def _lazy_action(module_name):
+    """Return a function which imports an action module and executes it.
+
+    The action modules import heavy dependencies (paramiko, zeroconf,
+    mbed_cloud), so we only import the module for the command being run.
+    """
+
+    def execute(args):
+        action = importlib.import_module(
+            "mbl.cli.actions.{}".format(module_name)
+        )
+        return action.execute(args)
+
+    return execute
 
 
 class ArgumentParserWithDefaultHelp(argparse.ArgumentParser):
@@ -10,9 +10,10 @@ A toolbox for managing target devices running Mbed Linux OS.
 
 import enum
 import sys
-import traceback
-import pkg_resources
+
+from mbl.cli import __version__
 from mbl.cli.args import parser
+from mbl.cli.utils import metrics, output, trace
 
 
 class ExitCode(enum.Enum):
@@ -23,12 +24,26 @@ class ExitCode(enum.Enum):
 
 
 def _print_version():
-    print(pkg_resources.get_distribution("mbl-cli").version)
+    print(__version__)
     return ExitCode.SUCCESS.value
 
 
 def _run(args):
-    args.func(args)
+    if args.profile or args.profile_trace:
+        trace.enable()
+    try:
+        args.func(args)
+    finally:
+        _report_profile(args)
+        if args.metrics_file:
+            metrics.write(args.metrics_file, args.metrics_format)
+
+
+def _report_profile(args):
+    if args.profile:
+        print(trace.format_summary(), file=sys.stderr)
+    if args.profile_trace:
+        trace.write_chrome_trace(args.profile_trace)
 
 
 def _set_error_code(error):
@@ -39,19 +54,44 @@ def _set_error_code(error):
 
 
 def _print_error_message(msg, verbose=False):
+    output.emit("error", message=str(msg))
     if verbose:
+        # Imported here as it's slow to import and rarely needed.
+        import traceback
+
         traceback.print_exc()
     else:
         print(msg, file=sys.stderr)
 
 
+def _complete(line, point):
+    # Imported here, completion is only needed by the __complete command.
+    from mbl.cli.utils import completion
+
+    try:
+        point = int(point)
+    except (TypeError, ValueError):
+        # Complete the whole line if the shell gave no usable cursor.
+        point = len(line)
+    for candidate in completion.complete(line[:point]):
+        print(candidate)
+    return ExitCode.SUCCESS.value
+
+
 def _main():
+    # Shell completion calls `mbl-cli __complete LINE POINT`. Handle it
+    # before parsing the args, as a partial command line won't parse.
+    if sys.argv[1:2] == ["__complete"] and len(sys.argv) == 4:
+        return _complete(*sys.argv[2:])
+
     try:
         args = parser.parse_args(description=__doc__)
 
         if args.version:
             return _print_version()
 
+        output.FORMAT = args.output
+
         # Run a command
         _run(args)
 
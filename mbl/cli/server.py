@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""JSON-RPC server for the Python API.
+
+`mbl-cli serve` runs a long-lived process holding a single `api.Client`,
+so SSH sessions, discovery results and Pelion API clients are kept between
+operations. Controllers connect to a local socket and call the methods
+listed in `api.Client.RPC_METHODS`.
+
+The protocol is JSON-RPC 2.0. Each request is a JSON object on its own
+line and each response is written back on its own line. A connection can
+be used for any number of requests. Example request:
+
+    {"jsonrpc": "2.0", "id": 1, "method": "run",
+     "params": {"address": "169.254.1.2", "cmd": "uptime"}}
+
+The Unix socket is only accessible by the user running the server. Any
+local user can connect to a localhost port, so a server on a port writes
+a random token to TOKEN_FILE_PATH, which only that user can read, and
+every request must hold the token in a "token" member:
+
+    {"jsonrpc": "2.0", "id": 1, "method": "run", "token": "...",
+     "params": {"address": "169.254.1.2", "cmd": "uptime"}}
+
+* `create_server` builds a server for a Unix socket or a localhost port.
+* `Connection` is a minimal client for the server.
+"""
+
+import hmac
+import inspect
+import json
+import os
+import pathlib
+import secrets
+import socket
+import socketserver
+import stat
+
+DEFAULT_SOCKET_PATH = str(pathlib.Path().home() / ".mbl-cli.sock")
+
+# File holding the token for a server listening on a port.
+TOKEN_FILE_PATH = str(pathlib.Path().home() / ".mbl-cli.token")
+
+# JSON-RPC 2.0 error codes.
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+UNAUTHORIZED = -32001
+
+
+def handle_request(client, request, token=None):
+    """Call a client method as described by a JSON-RPC request.
+
+    :param client Client: the api.Client handling the request.
+    :param request dict: the decoded request.
+    :param token str: if given, the token the request must hold.
+    :returns dict: the response, or None if the request was a notification.
+    """
+    if not isinstance(request, dict) or not isinstance(
+        request.get("method"), str
+    ):
+        return _error_response(None, INVALID_REQUEST, "Invalid request.")
+    req_id = request.get("id")
+    if token is not None:
+        given = request.get("token")
+        if not isinstance(given, str) or not hmac.compare_digest(
+            given.encode(), token.encode()
+        ):
+            # Answer even notifications, so the client knows why nothing
+            # happened.
+            return _error_response(
+                req_id, UNAUTHORIZED, "Missing or invalid token."
+            )
+    method = request["method"]
+    params = request.get("params", {})
+    if method not in client.RPC_METHODS:
+        response = _error_response(
+            req_id, METHOD_NOT_FOUND, "Method '{}' not found.".format(method)
+        )
+    else:
+        response = _call(getattr(client, method), req_id, params)
+    return response if "id" in request else None
+
+
+def _call(func, req_id, params):
+    args, kwargs = (params, {}) if isinstance(params, list) else ((), params)
+    try:
+        inspect.signature(func).bind(*args, **kwargs)
+    except TypeError as err:
+        return _error_response(req_id, INVALID_PARAMS, str(err))
+    try:
+        result = func(*args, **kwargs)
+    except Exception as err:
+        return _error_response(
+            req_id,
+            SERVER_ERROR,
+            str(err),
+            data=dict(
+                exception=type(err).__name__,
+                return_code=getattr(err, "return_code", None),
+            ),
+        )
+    return dict(jsonrpc="2.0", id=req_id, result=result)
+
+
+def _error_response(req_id, code, message, data=None):
+    error = dict(code=code, message=message)
+    if data is not None:
+        error["data"] = data
+    return dict(jsonrpc="2.0", id=req_id, error=error)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handle newline-delimited JSON-RPC requests on a connection."""
+
+    def handle(self):
+        """Answer requests until the client closes the connection."""
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode())
+            except ValueError:
+                response = _error_response(None, PARSE_ERROR, "Parse error.")
+            else:
+                response = handle_request(
+                    self.server.client, request, token=self.server.token
+                )
+            if response is not None:
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+                self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socket, "AF_UNIX"):
+
+    class _UnixServer(
+        socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+    ):
+        daemon_threads = True
+
+
+def create_server(
+    client,
+    socket_path=DEFAULT_SOCKET_PATH,
+    port=None,
+    token_path=TOKEN_FILE_PATH,
+):
+    """Create a server which handles requests using `client`.
+
+    Listen on a Unix socket at `socket_path`, or on localhost:`port` if a
+    port is given. The Unix socket is only accessible by the current user.
+    On a port, requests must hold the token written to `token_path`, the
+    server's `token_path` attribute, which the caller should remove when
+    the server stops.
+    Call `serve_forever` on the returned server to handle requests.
+    """
+    if port is not None:
+        server = _TCPServer(("127.0.0.1", port), _RequestHandler)
+        server.token = secrets.token_hex(32)
+        server.token_path = token_path
+        try:
+            _write_token(token_path, server.token)
+        except OSError:
+            server.server_close()
+            raise
+    else:
+        _remove_stale_socket(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            server = _UnixServer(socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        server.token = None
+        server.token_path = None
+    server.client = client
+    return server
+
+
+def _write_token(token_path, token):
+    """Write the token to a file only the current user can read."""
+    # Replace any old file, so a file made readable by others isn't reused.
+    try:
+        os.unlink(token_path)
+    except FileNotFoundError:
+        pass
+    fd = os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as token_file:
+        token_file.write(token)
+
+
+def _remove_stale_socket(socket_path):
+    """Remove a socket left behind by a server which is no longer running."""
+    try:
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            return
+    except FileNotFoundError:
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            os.unlink(socket_path)
+        else:
+            raise OSError(
+                "A server is already listening on {}.".format(socket_path)
+            )
+
+
+class Connection:
+    """Connection to a running server.
+
+    Example:
+    ----
+        with Connection() as conn:
+            print(conn.call("run", address="169.254.1.2", cmd="uptime"))
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, port=None, token=None):
+        """Connect to a Unix socket, or to localhost:`port` if given.
+
+        :param token str: the server's token, for a port. Read from
+        TOKEN_FILE_PATH if None.
+        """
+        self._token = None
+        if port is not None:
+            if token is None:
+                with open(TOKEN_FILE_PATH) as token_file:
+                    token = token_file.read().strip()
+            self._token = token
+            self._sock = socket.create_connection(("127.0.0.1", port))
+        else:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(socket_path)
+        self._file = self._sock.makefile("rwb")
+        self._next_id = 0
+
+    def __enter__(self):
+        """Enter the context, return self."""
+        return self
+
+    def __exit__(self, *exception_info):
+        """Exit the context, close the connection."""
+        self.close()
+        return False
+
+    def close(self):
+        """Close the connection."""
+        self._file.close()
+        self._sock.close()
+
+    def call(self, method, *args, **kwargs):
+        """Call a method on the server and return the result.
+
+        :raises RemoteCallError: the server returned an error.
+        """
+        self._next_id += 1
+        request = dict(
+            jsonrpc="2.0",
+            id=self._next_id,
+            method=method,
+            params=list(args) if args else kwargs,
+        )
+        if self._token is not None:
+            request["token"] = self._token
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise IOError("The server closed the connection.")
+        response = json.loads(line.decode())
+        if "error" in response:
+            raise RemoteCallError(response["error"])
+        return response["result"]
+
+
+class RemoteCallError(Exception):
+    """The server returned an error response."""
+
+    def __init__(self, error):
+        """Initialise the exception from a JSON-RPC error object."""
+        self.code = error["code"]
+        self.data = error.get("data")
+        self.return_code = (self.data or {}).get("return_code")
+        super().__init__(error["message"])
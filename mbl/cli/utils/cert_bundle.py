@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Certificate bundles, a single file holding a parsed certificate.
+
+A bundle is an uncompressed tar archive. It starts with an index,
+MANIFEST.json, which lists the size and SHA-256 checksum of every
+certificate field. Next is SHA256SUMS, the same checksums in the
+`sha256sum` format, so a device can verify a bundle after extracting it
+with standard tools. Each certificate field follows as `<field>.bin`,
+which is the layout pelion-provisioning-util expects.
+"""
+
+import hashlib
+import io
+import json
+import tarfile
+
+from . import file_handler
+
+SUFFIX = ".mblcert"
+MANIFEST_NAME = "MANIFEST.json"
+CHECKSUMS_NAME = "SHA256SUMS"
+FORMAT_VERSION = 1
+
+
+def is_bundle(path):
+    """Return True if path names a certificate bundle file."""
+    return str(path).endswith(SUFFIX)
+
+
+def pack(certificate):
+    """Pack a certificate into a bundle.
+
+    Bundles are reproducible: packing the same certificate twice gives the
+    same bytes.
+
+    :param dict certificate: certificate field names and their bytes.
+    :returns bytes: the bundle.
+    """
+    fields = dict()
+    checksums = []
+    for field in sorted(certificate):
+        data = certificate[field]
+        digest = hashlib.sha256(data).hexdigest()
+        fields[field] = dict(
+            file=_field_file_name(field), size=len(data), sha256=digest
+        )
+        checksums.append("{}  {}\n".format(digest, _field_file_name(field)))
+    manifest = dict(version=FORMAT_VERSION, fields=fields)
+    buffer = io.BytesIO()
+    with tarfile.open(
+        fileobj=buffer, mode="w", format=tarfile.USTAR_FORMAT
+    ) as tar:
+        _add_member(tar, MANIFEST_NAME, json.dumps(manifest).encode())
+        _add_member(tar, CHECKSUMS_NAME, "".join(checksums).encode())
+        for field in sorted(certificate):
+            _add_member(tar, _field_file_name(field), certificate[field])
+    return buffer.getvalue()
+
+
+def unpack(bundle):
+    """Unpack a bundle, verifying its contents against the manifest.
+
+    :param bytes bundle: the bundle.
+    :returns dict: certificate field names and their bytes.
+    """
+    try:
+        with tarfile.open(fileobj=io.BytesIO(bundle), mode="r") as tar:
+            manifest = json.loads(_read_member(tar, MANIFEST_NAME).decode())
+            if manifest.get("version") != FORMAT_VERSION:
+                raise ValueError(
+                    "Unsupported certificate bundle version: {}".format(
+                        manifest.get("version")
+                    )
+                )
+            certificate = dict()
+            for field, entry in manifest["fields"].items():
+                data = _read_member(tar, entry["file"])
+                if (
+                    len(data) != entry["size"]
+                    or hashlib.sha256(data).hexdigest() != entry["sha256"]
+                ):
+                    raise ValueError(
+                        "Certificate bundle is corrupt, the checksum of "
+                        "'{}' does not match.".format(field)
+                    )
+                certificate[field] = data
+    except (tarfile.TarError, KeyError) as err:
+        raise ValueError("Invalid certificate bundle: {}".format(err))
+    return certificate
+
+
+def write(path, certificate):
+    """Write a certificate to a bundle file in one atomic operation.
+
+    :param Path path: the bundle file to write.
+    :param dict certificate: certificate field names and their bytes.
+    """
+    file_handler.to_binary_file(path, pack(certificate))
+
+
+def read(path):
+    """Read and verify a certificate bundle file.
+
+    :param Path path: the bundle file to read.
+    :returns dict: certificate field names and their bytes.
+    """
+    with open(str(path), "rb") as bfile:
+        return unpack(bfile.read())
+
+
+def _field_file_name(field):
+    return "{}.bin".format(field)
+
+
+def _add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o600
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _read_member(tar, name):
+    member = tar.getmember(name)
+    if not member.isfile():
+        raise ValueError("Invalid certificate bundle member: {}".format(name))
+    return tar.extractfile(member).read()
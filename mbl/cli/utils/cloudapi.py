@@ -5,18 +5,128 @@
 
 """Wrappers for the mbed-cloud-sdk."""
 
-import array
+import collections
+import concurrent.futures
+import hashlib
+import re
+import threading
+import time
 
 from mbed_cloud import AccountManagementAPI, CertificatesAPI
 from mbed_cloud.exceptions import CloudApiException
 
+from . import trace
+
+# The last preprocessor statement and the variable name prefix of the
+# developer and update certificate headers, see _parse_cert_header.
+DEV_CERT_HEADER = ("#include <inttypes.h>", "MBED_CLOUD_DEV_")
+UPDATE_CERT_HEADER = ("#include <stdint.h>", "arm_uc_")
+
+# Maximum number of keep-alive connections kept open to each host.
+POOL_MAXSIZE = 8
+
+# Timings of the most recent HTTP requests made by the SDK clients.
+RequestTiming = collections.namedtuple(
+    "RequestTiming", "method url status duration_s"
+)
+REQUEST_TIMINGS = collections.deque(maxlen=1000)
+
+_clients = dict()
+_sessions = dict()
+_clients_lock = threading.Lock()
+
+
+def get_client(api_class, api_key, host=None):
+    """Return the shared SDK client of `api_class` for an API key and host.
+
+    Clients are created once per process. All the clients for an API key
+    and host send their requests through one keep-alive connection pool,
+    so TLS connections are reused between clients and commands.
+
+    :param type api_class: SDK API class, e.g. CertificatesAPI.
+    :param str api_key: Pelion Device Management API key.
+    :param str host: API host URL, or None for the SDK default.
+    """
+    key = (api_class, api_key, host)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            params = dict(api_key=api_key)
+            if host is not None:
+                params["host"] = host
+            with trace.span("cloudapi.create_client", "http"):
+                client = api_class(params)
+            for api_client in client.api_clients.values():
+                rest_client = api_client.rest_client
+                session_key = (api_key, api_client.configuration.host)
+                if session_key not in _sessions:
+                    _sessions[session_key] = _HTTPSession(
+                        rest_client.pool_manager
+                    )
+                rest_client.pool_manager = _sessions[session_key]
+            _clients[key] = client
+        return client
+
+
+def close_clients():
+    """Forget the shared clients and close their connection pools."""
+    with _clients_lock:
+        _clients.clear()
+        for session in _sessions.values():
+            session.clear()
+        _sessions.clear()
+
+
+class _HTTPSession:
+    """Keep-alive connection pool shared by SDK clients.
+
+    Stands in for the urllib3 PoolManager of the SDK REST clients, and
+    records the timing of each request in REQUEST_TIMINGS.
+    """
+
+    def __init__(self, pool_manager):
+        """Wrap a pool manager, allowing POOL_MAXSIZE connections per host.
+
+        :param urllib3.PoolManager pool_manager: pool manager to share.
+        """
+        # Pools are created on first use with these arguments.
+        pool_manager.connection_pool_kw["maxsize"] = POOL_MAXSIZE
+        self._pool_manager = pool_manager
+
+    def request(self, method, url, *args, **kwargs):
+        """Make a request, recording how long it took."""
+        status = None
+        start = time.monotonic()
+        try:
+            response = self._pool_manager.request(method, url, *args, **kwargs)
+            status = response.status
+            return response
+        finally:
+            end = time.monotonic()
+            REQUEST_TIMINGS.append(
+                RequestTiming(method, url, status, end - start)
+            )
+            trace.add(
+                "cloudapi.request",
+                "http",
+                start,
+                end,
+                method=method,
+                url=url,
+                status=status,
+            )
+
+    def clear(self):
+        """Close all the pooled connections."""
+        self._pool_manager.clear()
+
 
 def valid_api_key(api_key):
     """Call the Pelion Account Management API to validate an API key.
 
     :param str api_key: API key to validate.
     """
-    api = AccountManagementAPI({"api_key": api_key})
+    api = get_client(AccountManagementAPI, api_key)
     try:
         # We need to make a call to the api for the key to be validated.
         api.get_account()
@@ -31,17 +141,38 @@ class DevCredentialsAPI:
     Wrap the CertificatesAPI. Creates/gets and parses developer certificates.
     """
 
-    def __init__(self, api_key):
-        """Initialise the API."""
-        self._cert_api = CertificatesAPI(dict(api_key=api_key))
+    # Number of certificates to request per page when listing certificates.
+    # This is the largest page size accepted by the service.
+    PAGE_SIZE = 1000
+
+    # Maximum number of certificate details to fetch concurrently.
+    MAX_WORKERS = 8
+
+    def __init__(self, api_key, cache=None):
+        """Initialise the API.
+
+        :param str api_key: Pelion Device Management API key.
+        :param CertificateCache cache: cache of certificate metadata to use
+        to avoid API calls, or None to always call the API.
+        """
+        self._cert_api = get_client(CertificatesAPI, api_key)
+        self._cache = cache
+
+    @classmethod
+    def from_store(cls, user_store):
+        """Create an API using the API key and cache in the user store."""
+        api_key = user_store.api_key
+        return cls(api_key, cache=CertificateCache(user_store, api_key))
 
     @property
     def existing_cert_names(self):
         """List all existing certificate names known to the Pelion account."""
-        return [
-            self._cert_api.get_certificate(c.id).name
-            for c in self._cert_api.list_certificates()
-        ]
+        if self._cache_is_fresh():
+            return self._cache.names
+        certs = self._list_certificates()
+        if self._cache is not None:
+            self._cache.replace(certs)
+        return [c.name for c in certs]
 
     def get_dev_credentials(self, name):
         """Get an existing developer certificate from Pelion.
@@ -50,13 +181,20 @@ class DevCredentialsAPI:
 
         :param str name: name of the developer certificate to create.
         """
-        for cert in self._cert_api.list_certificates():
-            this_cert = self._cert_api.get_certificate(cert.id)
-            if this_cert.name == name:
+        try:
+            certs = self._get_certificates(self._find_certificate_ids(name))
+        except CloudApiException:
+            if not self._cache_is_fresh():
+                raise
+            # The cached id is out of date, ask the service instead.
+            self._cache.invalidate()
+            certs = self._get_certificates(self._find_certificate_ids(name))
+        for this_cert in certs:
+            if this_cert.header_file:
+                if self._cache is not None:
+                    self._cache.update(this_cert)
                 return _parse_cert_header(
-                    this_cert.header_file,
-                    "#include <inttypes.h>",
-                    "MBED_CLOUD_DEV_",
+                    this_cert.header_file, *DEV_CERT_HEADER
                 )
         raise ValueError(
             "The developer certificate does not exist. "
@@ -72,9 +210,9 @@ class DevCredentialsAPI:
         """
         try:
             cert = self._cert_api.add_developer_certificate(name=name)
-            return _parse_cert_header(
-                cert.header_file, "#include <inttypes.h>", "MBED_CLOUD_DEV_"
-            )
+            if self._cache is not None:
+                self._cache.update(cert)
+            return _parse_cert_header(cert.header_file, *DEV_CERT_HEADER)
         except CloudApiException as err:
             if err.reason != "Conflict":
                 raise
@@ -85,22 +223,209 @@ class DevCredentialsAPI:
 
     def delete_developer_certificate(self, name):
         """Delete an existing developer certificate from device management."""
-        for cert in self._cert_api.list_certificates():
-            if cert.name == name:
-                self._cert_api.delete_certificate(cert.id)
-                return
-        raise ValueError(
-            "Certificate '{}' was not found in Device Management.".format(name)
+        try:
+            deleted = self._delete_certificate(name)
+        except CloudApiException as err:
+            if err.status != 404 or not self._cache_is_fresh():
+                raise
+            # The cached id is out of date, ask the service instead.
+            self._cache.invalidate()
+            deleted = self._delete_certificate(name)
+        if not deleted:
+            raise ValueError(
+                "Certificate '{}' was not found in Device Management.".format(
+                    name
+                )
+            )
+        if self._cache is not None:
+            self._cache.remove(name)
+
+    def _delete_certificate(self, name):
+        """Delete the first certificate called `name`, False if none."""
+        for cert_id in self._find_certificate_ids(name):
+            self._cert_api.delete_certificate(cert_id)
+            return True
+        return False
+
+    def _cache_is_fresh(self):
+        return self._cache is not None and self._cache.fresh
+
+    def _find_certificate_ids(self, name):
+        """Return the ids of the certificates called `name`.
+
+        Use the cache if it is fresh and knows the name, otherwise ask the
+        service.
+        """
+        if self._cache_is_fresh():
+            entry = self._cache.get(name)
+            if entry is not None:
+                return [entry["id"]]
+        return [c.id for c in self._list_certificates(name)]
+
+    def _list_certificates(self, name=None):
+        """List certificates, optionally only those called `name`.
+
+        The name is filtered on by the service, the list results hold the
+        name and id of each certificate but not the certificate data.
+        """
+        kwargs = dict(page_size=self.PAGE_SIZE)
+        if name is not None:
+            kwargs["filter"] = dict(name=name)
+        return [
+            c
+            for c in self._cert_api.list_certificates(**kwargs)
+            if name is None or c.name == name
+        ]
+
+    def _get_certificates(self, cert_ids):
+        """Fetch the full certificate objects for a list of certificate ids.
+
+        The requests are made concurrently, results are in `cert_ids` order.
+        """
+        if len(cert_ids) < 2:
+            return [self._cert_api.get_certificate(c) for c in cert_ids]
+        workers = min(len(cert_ids), self.MAX_WORKERS)
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(self._cert_api.get_certificate, cert_ids))
+
+
+class CertificateCache:
+    """Pelion certificate metadata cached in the user store.
+
+    Holds the id, creation time and header hash of each certificate in the
+    Pelion account, keyed by name, so commands can find certificates
+    without listing them all again. The cache belongs to one API key, and
+    is considered stale `TTL_S` seconds after the certificates were last
+    listed. Entries are updated when certificates are fetched, created or
+    deleted through the DevCredentialsAPI.
+    """
+
+    TTL_S = 300
+
+    def __init__(self, user_store, api_key):
+        """Load the cache from the user store, reset it for a new API key.
+
+        :param Store user_store: the store holding the cache.
+        :param str api_key: the API key the cached data belongs to.
+        """
+        self._store = user_store
+        key_id = hashlib.sha256(api_key.encode()).hexdigest()
+        if self._data.get("key_id") != key_id:
+            self._data.clear()
+            self._data.update(key_id=key_id, listed_at=0, certificates={})
+
+    @property
+    def _data(self):
+        # Not kept, the store replaces its config when it is reloaded.
+        return self._store.pelion_cert_cache
+
+    @property
+    def fresh(self):
+        """True if the certificates were listed less than TTL_S ago."""
+        return 0 <= time.time() - self._data["listed_at"] < self.TTL_S
+
+    @property
+    def names(self):
+        """Names of the cached certificates."""
+        return list(self._data["certificates"])
+
+    def get(self, name):
+        """Return the cached metadata for a certificate, or None."""
+        return self._data["certificates"].get(name)
+
+    def replace(self, certs):
+        """Replace the cache contents with a full certificate listing."""
+        old_entries = self._data["certificates"]
+        self._data["certificates"] = {
+            c.name: _cert_metadata(c, old_entries.get(c.name)) for c in certs
+        }
+        self._data["listed_at"] = time.time()
+        self._store.save()
+
+    def update(self, cert):
+        """Add or update the entry for a certificate object."""
+        certificates = self._data["certificates"]
+        certificates[cert.name] = _cert_metadata(
+            cert, certificates.get(cert.name)
         )
+        self._store.save()
+
+    def remove(self, name):
+        """Remove the entry for a certificate."""
+        if self._data["certificates"].pop(name, None) is not None:
+            self._store.save()
+
+    def invalidate(self):
+        """Mark the cache as stale, so the next lookup calls the API."""
+        self._data["listed_at"] = 0
+        self._store.save()
+
+
+def _cert_metadata(cert, old_entry=None):
+    """Build a cache entry for a certificate object.
+
+    Keep the header hash from `old_entry` if the certificate is unchanged
+    and `cert` doesn't hold the header (list results don't).
+    """
+    created_at = getattr(cert, "created_at", None)
+    entry = dict(
+        id=cert.id,
+        created_at=created_at.isoformat() if created_at else None,
+        header_sha256=None,
+    )
+    header = getattr(cert, "header_file", None)
+    if header:
+        entry["header_sha256"] = hashlib.sha256(header.encode()).hexdigest()
+    elif old_entry is not None and old_entry.get("id") == cert.id:
+        entry["header_sha256"] = old_entry.get("header_sha256")
+    return entry
 
 
 def parse_existing_update_cert(update_cert_header_path):
     """Open an existing certificate file and push it through the parser."""
     with open(update_cert_header_path) as hfile:
         update_cert_header = hfile.read()
-    return _parse_cert_header(
-        update_cert_header, "#include <stdint.h>", "arm_uc_"
+    return _parse_cert_header(update_cert_header, *UPDATE_CERT_HEADER)
+
+
+def parse_existing_cert(cert_header_path):
+    """Open a developer or update certificate file and parse it.
+
+    The kind of certificate is detected from the header contents.
+    """
+    with open(cert_header_path) as hfile:
+        cert_header = hfile.read()
+    for header_format in (DEV_CERT_HEADER, UPDATE_CERT_HEADER):
+        match_str_pre, match_str_var = header_format
+        if match_str_pre in cert_header and match_str_var in cert_header:
+            return _parse_cert_header(cert_header, *header_format)
+    raise ValueError(
+        "'{}' is not a developer or update certificate file.".format(
+            cert_header_path
+        )
+    )
+
+
+# Single pass tokenizer for the C certificate headers. Comments and
+# preprocessor lines are matched as tokens so their contents are skipped.
+_C_TOKEN = re.compile(
+    r"""
+    (?P<comment> // [^\n]* | /\*.*?\*/ | \# [^\n]* )
+  | (?P<name>\w+) \s* (?:\[\s*\w*\s*\])? \s* = \s*
+    (?:
+        \{ (?P<array> (?: [^}/]+ | //[^\n]* | /\*.*?\*/ | / )* ) \}
+      | (?P<string> (?: "(?:[^"\\\n]|\\.)*" \s* )+ )
+      | sizeof \s* \( [^)]* \)
+      | (?P<scalar> [^;]+ )
     )
+    \s* ;
+    """,
+    re.DOTALL | re.VERBOSE,
+)
+_C_COMMENT = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+_C_STRING = re.compile(r'"((?:[^"\\\n]|\\.)*)"')
+# bytes.fromhex accepts spaces between values.
+_C_SEPARATORS_TO_SPACES = str.maketrans(",\t\r\n", "    ")
 
 
 def _parse_cert_header(cert_header, match_str_pre, match_str_var):
@@ -110,59 +435,64 @@ def _parse_cert_header(cert_header, match_str_pre, match_str_var):
     dictionary.
 
     `match_str_pre` is used to split the include statements from the
-    header body. It should be the last preprocessor statement at the top
-    of the header. (`match_str_pre` is passed directly to str.find. This is
-    not a RE!)
+    header body. Declarations after its first occurrence are parsed.
+    (`match_str_pre` is passed directly to str.partition. This is not a
+    RE!)
+
+    `match_str_var` is the prefix of the variable names (all variables in
+    these certs have a consistent naming scheme). A ValueError is raised
+    for variables without the prefix.
 
-    `match_str_var` is used to match the variable names (all variables in
-    these certs have a consistent naming scheme, `match_str_var` is passed
-    directly to str.find. This is not a RE!)
+    Comments and preprocessor lines are ignored. Hexadecimal byte arrays
+    are converted to bytes, strings and scalar values to their encoded
+    text. `sizeof` variables are skipped.
 
     :param str cert_header: The certificate header to parse.
     :param str match_str_pre: The last preprocessor statement to split on.
-    :param str match_str_var: The variable match to find.
+    :param str match_str_var: The variable prefix to match.
 
     :return dict: credentials object
     """
-    cert_header = cert_header.strip()
-    _, body = cert_header.split(match_str_pre)
-    cpp_statements = body.split(";")
+    _, found, body = cert_header.partition(match_str_pre)
+    if not found:
+        raise ValueError("{} not found in header.".format(match_str_pre))
     out_map = dict()
-    for statement in cpp_statements:
-        statement = statement.replace("\n", "")
-        # skip statements that aren't var assignments
-        if "=" not in statement:
-            continue
-        var_name_and_type, raw_val = statement.split(" = ")
-        # ignore sizeof variables
-        if "sizeof(" in raw_val:
+    for decl in _C_TOKEN.finditer(body):
+        name = decl.group("name")
+        if name is None:
             continue
-        # slice out the variable type before the name
-        var_name_begin = var_name_and_type.find(match_str_var)
-        if var_name_begin is -1:
+        if not name.startswith(match_str_var):
             raise ValueError("{} var match not found.".format(match_str_var))
-        processed_name = (
-            var_name_and_type[var_name_begin:].replace(r"[]", "").strip()
-        )
-        # remove unwanted characters from the variable value string.
-        # if replace or strip fail they do it silently, so this covers
-        # all the "unwanted character" cases in these headers.
-        processed_value = (
-            raw_val.replace(r" '", "")  # 'c' -> c
-            .replace(r'"', "")  # "bootstrapServer" -> bootstrapServer
-            .replace(" ", "")  # 0x7f_ -> 0x7f (_ represents whitespace)
-            .strip(r"{} \r")  # {0x7f}\r -> 0x7f
-        )
-        # try to split on commas, the resulting list will be of length 1
-        # if this value is a single string or int. If it's an array then
-        # we'll get a list with len > 1.
-        values = processed_value.split(",")
-        if len(values) > 1:
-            # is an array of hexadecimal values
-            fmt_arr = [int(av, 16) for av in values]
-            out_val = array.array("B", fmt_arr).tobytes()
-        else:
-            # is a single string or int/uint value
-            out_val = values[0].encode()
-        out_map[processed_name] = out_val
+        if decl.group("array") is not None:
+            out_map[name] = _c_array_to_bytes(decl.group("array"))
+        elif decl.group("string") is not None:
+            out_map[name] = "".join(
+                _C_STRING.findall(decl.group("string"))
+            ).encode()
+        elif decl.group("scalar") is not None:
+            out_map[name] = decl.group("scalar").strip().encode()
     return out_map
+
+
+def _c_array_to_bytes(values):
+    """Convert the values in a C array initializer to bytes.
+
+    Arrays of two digit hex values are converted in bulk, other arrays a
+    value at a time.
+    """
+    if "/" in values:
+        values = _C_COMMENT.sub(" ", values)
+    values = values.strip().rstrip(",")
+    if not values:
+        return b""
+    if values.count("0x") == values.count(",") + 1:
+        try:
+            return bytes.fromhex(
+                values.replace("0x", "").translate(_C_SEPARATORS_TO_SPACES)
+            )
+        except ValueError:
+            pass  # Not all two digit values.
+    return bytes(
+        int(value, 16 if value[:2] in ("0x", "0X") else 10)
+        for value in values.replace(",", " ").split()
+    )
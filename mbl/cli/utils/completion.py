@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Shell tab completion for mbl-cli.
+
+Completion must be fast, so candidates only come from local files:
+
+* Subcommands and options are read from the argument parser (building
+  the parser doesn't import any action modules).
+* Device addresses come from the selected device file and the completion
+  index, which records the addresses of discovered devices.
+* Certificate names come from the team store config and the completion
+  index, which caches the certificate names last listed from Pelion
+  Device Management.
+* Device names and groups come from the device inventory.
+
+The completion index is a JSON file updated by the commands which learn
+about devices and certificates. Completion never touches the network.
+"""
+
+import argparse
+import json
+import pathlib
+
+from mbl.cli.args import parser as cli_parser
+
+from . import file_handler, inventory, store
+
+INDEX_FILE_PATH = pathlib.Path().home() / ".mbl-completion.json"
+
+# Maximum number of discovered device addresses to remember.
+MAX_DEVICES = 100
+
+BASH_SCRIPT = r"""
+_mbl_cli_complete() {
+    local IFS=$'\n'
+    COMPREPLY=($(mbl-cli __complete "$COMP_LINE" "$COMP_POINT" 2>/dev/null))
+    # Bash splits words on ':', so trim the part of the current word
+    # before the last ':' from ipv6 address candidates.
+    local cur=${COMP_LINE:0:COMP_POINT}
+    cur=${cur##* }
+    if [[ "$cur" == *:* && "$COMP_WORDBREAKS" == *:* ]]; then
+        local prefix=${cur%"${cur##*:}"}
+        local i
+        for i in "${!COMPREPLY[@]}"; do
+            COMPREPLY[$i]=${COMPREPLY[$i]#"$prefix"}
+        done
+    fi
+}
+complete -o default -F _mbl_cli_complete mbl-cli
+"""
+
+
+def complete(line):
+    """Return completion candidates for a partial mbl-cli command line.
+
+    :param line str: The command line up to the cursor, including the
+    program name.
+    :returns list: candidates for the word under the cursor.
+    """
+    words = line.split()[1:]
+    current = "" if not words or line[-1:].isspace() else words.pop()
+    command_parser = cli_parser.build_parser()
+    subparsers = _subparsers(command_parser)
+    positionals = []
+    expecting = None
+    for word in words:
+        if expecting is not None:
+            expecting = None
+        elif word.startswith("-"):
+            expecting = _takes_value(command_parser, word)
+        elif not positionals and word in subparsers:
+            # Commands can have commands of their own, e.g. inventory add.
+            command_parser = subparsers[word]
+            subparsers = _subparsers(command_parser)
+        else:
+            positionals.append(word)
+
+    if expecting is not None:
+        candidates = _values_for(expecting)
+    elif current.startswith("-"):
+        candidates = [
+            opt for a in command_parser._actions for opt in a.option_strings
+        ]
+    elif subparsers and not positionals:
+        candidates = list(subparsers)
+    else:
+        candidates = _positional_values(command_parser, len(positionals))
+    return sorted(c for c in set(candidates) if c.startswith(current))
+
+
+def remember_devices(addresses):
+    """Add device addresses to the completion index."""
+    index = read_index()
+    devices = [a for a in index["devices"] if a not in addresses]
+    index["devices"] = (list(addresses) + devices)[:MAX_DEVICES]
+    _write_index(index)
+
+
+def remember_certificates(names, replace=False):
+    """Add certificate names to the completion index.
+
+    :param replace bool: Replace the names already in the index.
+    """
+    index = read_index()
+    known = set() if replace else set(index["certificates"])
+    index["certificates"] = sorted(known | set(names))
+    _write_index(index)
+
+
+def forget_certificate(name):
+    """Remove a certificate name from the completion index."""
+    index = read_index()
+    if name in index["certificates"]:
+        index["certificates"].remove(name)
+        _write_index(index)
+
+
+def read_index():
+    """Read the completion index, return an empty one if it can't be read."""
+    index = dict(devices=[], certificates=[])
+    index.update(_read_json(INDEX_FILE_PATH))
+    return index
+
+
+def _write_index(index):
+    file_handler.to_json(INDEX_FILE_PATH, **index)
+
+
+def _subparsers(arg_parser):
+    for action in arg_parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            return action.choices
+    return dict()
+
+
+def _takes_value(command_parser, option):
+    """Return the action for an option if it takes a value."""
+    for action in command_parser._actions:
+        if option in action.option_strings and action.nargs != 0:
+            return action
+    return None
+
+
+def _positional_values(command_parser, position):
+    positionals = [a for a in command_parser._actions if not a.option_strings]
+    if position < len(positionals):
+        return _values_for(positionals[position])
+    if positionals and positionals[-1].nargs in ("*", "+"):
+        return _values_for(positionals[-1])
+    return []
+
+
+def _values_for(action):
+    if action.choices:
+        return list(action.choices)
+    completer = getattr(action, "completer", None)
+    if completer == "devices":
+        return _device_addresses()
+    if completer == "certificates":
+        return _certificate_names()
+    if completer == "inventory":
+        return list(_inventory_devices())
+    if completer == "groups":
+        return [
+            group
+            for fields in _inventory_devices().values()
+            for group in fields.get("groups", ())
+        ]
+    return []
+
+
+def _device_addresses():
+    addresses = list(read_index()["devices"])
+    selected = _read_json(pathlib.Path(file_handler.DEVICE_FILE_PATH))
+    if selected.get("address"):
+        addresses.append(selected["address"])
+    return addresses
+
+
+def _certificate_names():
+    locations = _read_json(
+        store.StoreLocationsRecord.STORE_LOCATIONS_FILE_PATH
+    )
+    team_path = locations.get("team", store.DEFAULT_STORE_RECORD["team"])
+    team_config = _read_json(pathlib.Path(team_path, "config.json"))
+    return list(team_config.get("dev_certs", {})) + list(
+        read_index()["certificates"]
+    )
+
+
+def _inventory_devices():
+    devices = _read_json(inventory.INVENTORY_FILE_PATH).get("devices")
+    return devices if isinstance(devices, dict) else dict()
+
+
+def _read_json(path):
+    """Read a JSON object from a file without creating or locking it."""
+    try:
+        with open(str(path)) as jfile:
+            data = json.load(jfile)
+    except (OSError, ValueError):
+        return dict()
+    return data if isinstance(data, dict) else dict()
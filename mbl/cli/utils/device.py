@@ -5,38 +5,136 @@
 
 """Classes and functions related to the device abstraction."""
 
-from collections import namedtuple
+from collections import OrderedDict
 
 
-def create_device(hostname, address, username="root", password=""):
+def create_device(
+    hostname, address, username="root", password="", addresses=()
+):
     """Create and return a DeviceInfo struct."""
-    return DeviceInfo(hostname, address, username, password)
+    return DeviceInfo(hostname, address, username, password, addresses)
 
 
-class DeviceInfo(namedtuple("Device", "hostname address username password")):
-    """Data structure which holds information pertinent to the device."""
+class DeviceInfo:
+    """Data structure which holds information pertinent to the device.
+
+    A device is identified by its hostname and address: devices with the
+    same hostname and address are equal and have the same hash, whatever
+    their username and password. DeviceInfo objects are immutable.
+
+    A device may have more than one address, for example an IPv4 and a
+    link-local IPv6 address. `addresses` holds all of them, starting with
+    `address`.
+    """
+
+    __slots__ = ("hostname", "address", "username", "password", "addresses")
+
+    def __init__(
+        self, hostname, address, username="root", password="", addresses=()
+    ):
+        """Create a device.
+
+        :param hostname str: the device's hostname.
+        :param address str: the device's IPv4 or IPv6 address.
+        :param username str: user to log in as.
+        :param password str: password to log in with, empty for none.
+        :param addresses iterable: other addresses of the device.
+        """
+        object.__setattr__(self, "hostname", hostname)
+        object.__setattr__(self, "address", address)
+        object.__setattr__(self, "username", username)
+        object.__setattr__(self, "password", password)
+        object.__setattr__(
+            self,
+            "addresses",
+            (address,) + tuple(a for a in addresses if a != address),
+        )
+
+    def __setattr__(self, name, value):
+        """Prevent changes, which would change the hash."""
+        raise AttributeError("DeviceInfo objects can't be changed.")
 
     def __eq__(self, other):
         """== operator."""
-        if other.__class__ is self.__class__:
-            return (self.hostname == other.hostname) and (
-                self.address == other.address
-            )
-        else:
-            raise TypeError(
-                "Both objects must be of type"
-                " {} or they can't be compared.".format(self.__class__)
-            )
-
-    def __ne__(self, other):
-        """!= operator."""
-        if other.__class__ is self.__class__:
-            return not (
-                self.hostname == other.hostname
-                and self.address == other.address
-            )
-        else:
-            raise TypeError(
-                "Both objects must be of type "
-                "{} or they can't be compared.".format(self.__class__)
-            )
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (
+            self.hostname == other.hostname and self.address == other.address
+        )
+
+    def __hash__(self):
+        """Hash the hostname and address, as compared by ==."""
+        return hash((self.hostname, self.address))
+
+    def __repr__(self):
+        """Show the hostname and address, but not the password."""
+        return "DeviceInfo(hostname={!r}, address={!r})".format(
+            self.hostname, self.address
+        )
+
+    def _asdict(self):
+        """Return the device's fields as a dict."""
+        return dict(
+            hostname=self.hostname,
+            address=self.address,
+            username=self.username,
+            password=self.password,
+            addresses=list(self.addresses),
+        )
+
+
+class DeviceRegistry:
+    """A set of devices, indexed by address and by hostname.
+
+    Iterating over the registry gives the devices in the order they were
+    added.
+    """
+
+    def __init__(self, devices=()):
+        """:param devices iterable: DeviceInfo objects to add."""
+        self._devices = OrderedDict()
+        self._by_address = dict()
+        self._by_hostname = dict()
+        for dev in devices:
+            self.add(dev)
+
+    def add(self, dev):
+        """Add a device, return False if it was already in the registry."""
+        if dev in self._devices:
+            return False
+        self._devices[dev] = dev
+        self._by_address.setdefault(dev.address, []).append(dev)
+        self._by_hostname.setdefault(dev.hostname, []).append(dev)
+        return True
+
+    def remove(self, dev):
+        """Remove a device, raise KeyError if it isn't in the registry."""
+        del self._devices[dev]
+        for index, key in (
+            (self._by_address, dev.address),
+            (self._by_hostname, dev.hostname),
+        ):
+            index[key].remove(dev)
+            if not index[key]:
+                del index[key]
+
+    def by_address(self, address):
+        """Return the first device added with an address, or None."""
+        devices = self._by_address.get(address)
+        return devices[0] if devices else None
+
+    def by_hostname(self, hostname):
+        """Return a list of the devices with a hostname."""
+        return list(self._by_hostname.get(hostname, ()))
+
+    def __contains__(self, dev):
+        """Return True if the device is in the registry."""
+        return dev in self._devices
+
+    def __iter__(self):
+        """Iterate over the devices in the order they were added."""
+        return iter(self._devices)
+
+    def __len__(self):
+        """Return the number of devices."""
+        return len(self._devices)
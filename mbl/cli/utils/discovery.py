@@ -7,26 +7,85 @@
 
 import socket
 import subprocess
+import threading
 import time
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 from enum import Enum
 
 import zeroconf
 
-from mbl.cli.utils import device, events
+from mbl.cli.utils import device, events, trace
 
 MBL_ID = b"mblos"
 TIMEOUT = 30
 SLEEP_TIME = 0.5
 
 
-def do_discovery(listener):
-    """Browse for mblos devices for up to TIMEOUT seconds."""
+def do_discovery(listener, stop=None):
+    """Browse for mblos devices for up to TIMEOUT seconds.
+
+    Without a stop event, return as soon as devices have been found.
+
+    :param listener callable: called with a DeviceInfo for each device.
+    :param stop threading.Event: keep browsing for more devices until this
+    is set or TIMEOUT has passed.
+    """
     discovery_notifier = DeviceDiscoveryNotifier()
     discovery_notifier.add_listener(listener)
 
     with DeviceGetter() as dev_getter:
-        dev_getter.discover_all(discovery_notifier)
+        dev_getter.discover_all(discovery_notifier, stop=stop)
+
+
+class BackgroundDiscovery:
+    """Browse for mblos devices in a thread while the context is active.
+
+    The listener is called from the discovery thread as soon as each
+    device is found, so the caller can show and use devices before
+    discovery has finished. Leaving the context stops discovery, waits
+    for the thread and raises any error it had.
+    """
+
+    THREAD_NAME = "mbl-discovery"
+
+    def __init__(self, listener, on_finished=None):
+        """Create the discovery thread.
+
+        :param listener callable: called with a DeviceInfo per device.
+        :param on_finished callable: called with no arguments from the
+        discovery thread if discovery ends before the context is left.
+        """
+        self._listener = listener
+        self._on_finished = on_finished
+        self._stop = threading.Event()
+        self._error = None
+        self.finished = threading.Event()
+        self._thread = threading.Thread(
+            target=self._discover, name=self.THREAD_NAME, daemon=True
+        )
+
+    def __enter__(self):
+        """Start discovery, return self."""
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exception_info):
+        """Stop discovery and wait for the thread to finish."""
+        self._stop.set()
+        self._thread.join()
+        if self._error is not None and exception_info[0] is None:
+            raise self._error
+        return False
+
+    def _discover(self):
+        try:
+            do_discovery(self._listener, stop=self._stop)
+        except Exception as error:
+            self._error = error
+        finally:
+            self.finished.set()
+        if self._on_finished is not None and not self._stop.is_set():
+            self._on_finished()
 
 
 class DeviceDiscoveryNotifier(events.Notifier):
@@ -35,29 +94,47 @@ class DeviceDiscoveryNotifier(events.Notifier):
     Propagates notifications on to listeners when a new device is added.
     """
 
-    devices = list()
+    def __init__(self):
+        """Initialise an empty registry of discovered devices."""
+        super().__init__()
+        self.devices = device.DeviceRegistry()
 
     def add_service(self, zeroconf, service_type, name):
-        """Add a Mbed Linux Zeroconf service to a list of services.
+        """Add a Mbed Linux Zeroconf service to the registry of devices.
 
         Called when a new zeroconf service is discovered.
         Ensure it's an 'mbed linux device', notify listeners if it is.
+        Listeners are given a DeviceInfo with the service's instance name
+        as the hostname.
+
+        Devices are registered by service name, so a service is only
+        reported once however the order of its addresses changes. Services
+        which couldn't be resolved, or have no addresses, are skipped.
         """
-        info = zeroconf.get_service_info(service_type, name)
+        if self.devices.by_hostname(name):
+            return
+        with trace.span("discovery.resolve", "discovery", service=name):
+            info = zeroconf.get_service_info(service_type, name)
+        if info is None:
+            return
         try:
             info.properties[MBL_ID]
         except KeyError:
             return
         else:
-            try:
-                inet_addr = socket.inet_ntoa(info.address)
-            except (OSError, TypeError):
-                inet_addr = info.address
-            new_dev = device.create_device(name, inet_addr)
-            if new_dev not in self.devices:
-                self.devices.append(new_dev)
-                name = name.split(".{}".format(service_type))
-                self.notify("{}: {}".format(name[0], new_dev.address))
+            addresses = _service_addresses(info)
+            if not addresses:
+                return
+            new_dev = device.create_device(
+                name, addresses[0], addresses=addresses
+            )
+            self.devices.add(new_dev)
+            name = name.split(".{}".format(service_type))
+            self.notify(
+                device.create_device(
+                    name[0], new_dev.address, addresses=addresses
+                )
+            )
 
     def remove_service(self, zeroconf, type, name):
         """Remove services from the list.
@@ -66,6 +143,38 @@ class DeviceDiscoveryNotifier(events.Notifier):
         """
         pass
 
+    def update_service(self, zeroconf, type, name):
+        """Ignore updates to services, newer zeroconf versions call this."""
+        pass
+
+
+def _service_addresses(info):
+    """Return a list of all the addresses of a service, as strings.
+
+    zeroconf before 0.23 gives a single packed IPv4 address, later versions
+    a list of packed IPv4 and IPv6 addresses, and from 0.32 the addresses
+    can be formatted with their IPv6 scope ID. avahi services are given as
+    strings.
+    """
+    try:
+        return info.parsed_scoped_addresses()
+    except AttributeError:
+        pass
+    packed_addresses = getattr(info, "addresses", None) or [
+        getattr(info, "address", None)
+    ]
+    addresses = []
+    for packed in packed_addresses:
+        if packed is None:
+            continue
+        if isinstance(packed, str):
+            addresses.append(packed)
+        elif len(packed) == 16:
+            addresses.append(socket.inet_ntop(socket.AF_INET6, packed))
+        else:
+            addresses.append(socket.inet_ntoa(packed))
+    return addresses
+
 
 class DeviceGetter:
     """Browse for ssh services on the local network."""
@@ -75,6 +184,7 @@ class DeviceGetter:
     def __init__(self):
         """Initialise Zeroconf."""
         self.zconf = zeroconf.Zeroconf()
+        self.browser = None
 
     def __enter__(self):
         """Enter the context, return self."""
@@ -85,24 +195,41 @@ class DeviceGetter:
         self.zconf.close()
         return False
 
-    def discover_all(self, listener):
-        """Browse for ssh services on the network."""
-        end_time = time.time() + TIMEOUT
-        while not listener.devices and (time.time() < end_time):
-            time.sleep(SLEEP_TIME)
-            try:
-                raw_output = _avahi_browse()
-            except FileNotFoundError:
-                self.browser = zeroconf.ServiceBrowser(
-                    self.zconf, self.ADDR, listener
-                )
-            else:
-                for src_info in _parse_avahi_output(raw_output):
-                    listener.add_service(
-                        AvahiZeroconf(**src_info),
-                        "local",
-                        src_info["name"].decode(),
-                    )
+    def discover_all(self, listener, stop=None):
+        """Browse for ssh services on the network.
+
+        Return when devices have been found, or if a stop event is given,
+        when it is set. Give up after TIMEOUT seconds.
+
+        :param stop threading.Event: keep browsing until this is set.
+        """
+        with trace.span("discovery.discover_all", "discovery") as span:
+            end_time = time.time() + TIMEOUT
+            while time.time() < end_time:
+                try:
+                    with trace.span("discovery.avahi_browse", "discovery"):
+                        raw_output = _avahi_browse()
+                except FileNotFoundError:
+                    # The browser notifies the listener from its own
+                    # thread, and keeps browsing until zeroconf is closed.
+                    if self.browser is None:
+                        self.browser = zeroconf.ServiceBrowser(
+                            self.zconf, self.ADDR, listener
+                        )
+                else:
+                    for src_info in _parse_avahi_output(raw_output):
+                        listener.add_service(
+                            AvahiZeroconf(**src_info),
+                            "local",
+                            src_info["name"].decode(),
+                        )
+                if stop is None:
+                    if listener.devices:
+                        break
+                    time.sleep(SLEEP_TIME)
+                elif stop.wait(SLEEP_TIME):
+                    break
+            span.set(devices=len(listener.devices))
 
 
 class AvahiZeroconf:
@@ -112,7 +239,7 @@ class AvahiZeroconf:
     class when using avahi for discovery.
     """
 
-    ServiceInfo = namedtuple("ServiceInfo", "name properties address")
+    ServiceInfo = namedtuple("ServiceInfo", "name properties addresses")
 
     def __init__(self, **kwargs):
         """:param kwargs dict: data to pass into ServiceInfo."""
@@ -156,31 +283,32 @@ def _avahi_browse():
 def _parse_avahi_output(raw_output):
     """Pack avahi output data into a data struct.
 
-    Yield the data structs for each service.
+    avahi lists a service once for each address it was resolved to. Yield
+    a data struct for each service, holding all of its addresses in the
+    order they were listed.
     """
-    hostname = "name"
-    address = "address"
-    properties = "properties"
-    known_device_cache = list()
-    output = dict()
+    services = OrderedDict()
 
     for txt_line in raw_output.split(b"\n"):
         if txt_line.startswith(b"="):
             tokens = txt_line.split(b";")
-            if tokens[ServiceData.name.value] in known_device_cache:
-                continue
-            output[hostname] = tokens[ServiceData.name.value]
             if tokens[ServiceData.family.value].decode().lower() == "ipv6":
-                output[address] = "{}%{}".format(
+                address = "{}%{}".format(
                     tokens[ServiceData.ip.value].decode(),
                     tokens[ServiceData.interface.value].decode(),
                 )
             else:
-                output[address] = tokens[ServiceData.ip.value].decode()
-            output[properties] = {
-                tokens[ServiceData.prop.value].strip(b'"'): False
-            }
-        if len(output) == 3:
-            yield output
-            known_device_cache.append(output[hostname])
-            output.clear()
+                address = tokens[ServiceData.ip.value].decode()
+            service = services.setdefault(
+                tokens[ServiceData.name.value],
+                dict(
+                    name=tokens[ServiceData.name.value],
+                    properties={
+                        tokens[ServiceData.prop.value].strip(b'"'): False
+                    },
+                    addresses=[],
+                ),
+            )
+            if address not in service["addresses"]:
+                service["addresses"].append(address)
+    return iter(services.values())
@@ -5,14 +5,26 @@
 
 """Handle data files."""
 
+import contextlib
 import json
 import os
 import pathlib
-import shutil
-import tempfile
+import stat
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, file locking isn't supported.
+    fcntl = None
 
 DEVICE_FILE_PATH = str(pathlib.Path().home() / ".mbl-dev.json")
 
+_TEMP_FILE_FLAGS = (
+    os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+)
+
 
 def read_device_file(path=DEVICE_FILE_PATH):
     """Read the json file and return some data."""
@@ -33,24 +45,29 @@ def save_device_info(device, path=DEVICE_FILE_PATH):
 
 def to_text_file(file_path, data):
     """Write data to a text file."""
-    _write_with_copy_modify_move(file_path, data)
+    _write_atomically(file_path, data)
 
 
 def to_binary_file(file_path, data):
     """Write data to a binary file."""
-    _write_with_copy_modify_move(file_path, data, mode="wb")
+    _write_atomically(file_path, data, mode="wb")
 
 
 def from_json(config_file_path):
     """Read data from a json file.
 
-    Check the file exists and create it if not.
+    Check the file exists and create it if not. An existing file is never
+    touched, so reading doesn't change its modification time.
     We want to return an empty dict and not fail if the file contains no data.
 
     :param config_file_path Path: Path representing the file-to-read.
     :returns dict: config data (or an empty dict if there was no data).
     """
-    config_file_path.touch(exist_ok=True)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+    try:
+        os.close(os.open(str(config_file_path), flags, 0o666))
+    except FileExistsError:
+        pass
     try:
         with open(str(config_file_path.resolve()), "r") as dfile:
             return json.load(dfile)
@@ -66,32 +83,119 @@ def to_json(config_file_path, **store_conf_data):
     :param config_file_path Path: Path object representing the file-to-write.
     """
     json_fmt_data = json.dumps(store_conf_data)
-    _write_with_copy_modify_move(config_file_path, json_fmt_data)
+    _write_atomically(config_file_path, json_fmt_data)
+
+
+def lock_path_for(path):
+    """Return the path of the hidden lock file for a file.
+
+    The lock file is next to the file, named after it with a leading dot
+    unless the name already has one, e.g. config.json and .config.json
+    are both locked with .config.json.lock.
+    """
+    path = pathlib.Path(path)
+    name = path.name if path.name.startswith(".") else "." + path.name
+    return path.with_name(name + ".lock")
+
+
+@contextlib.contextmanager
+def lock_file(lock_path, timeout):
+    """Hold an exclusive advisory lock on a lock file.
 
+    The lock is taken with flock, so it is released if the process dies.
+    It excludes other processes and other threads which lock the same
+    file. Lock files are created if needed and never removed. This does
+    nothing on platforms without fcntl.
 
-def _write_with_copy_modify_move(file_path, data, mode="w"):
+    :param Path lock_path: the lock file.
+    :param float timeout: seconds to wait for the lock before raising a
+    TimeoutError.
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(str(lock_path), os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(
+                        "Timed out waiting for the lock on {}. Another "
+                        "mbl-cli process is using it.".format(lock_path)
+                    )
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        yield
+    finally:
+        # Closing the file releases the lock.
+        os.close(fd)
+
+
+def _write_atomically(file_path, data, mode="w"):
     """Write data to a file safely.
 
-    Check the file exists and create it if not.
-    Use copy-modify-move when writing to avoid corrupting the config_file.
+    Write the data to a temporary file in the same directory, flush it to
+    disk and rename it over the file, so the file is never left partly
+    written. The file keeps its permission bits, a new file is created
+    with the default permissions.
 
     :param file_path Path: Path object representing the file-to-write.
     :param data: The data to write to the file.
     :param mode str: file mode. "w" and "wb" are the only sensible values.
     """
-    file_path.touch(exist_ok=True)
-    # copy the config file to a tmp file
-    tmp_dir = tempfile.mkdtemp(dir=str(file_path.parent))
+    file_path = pathlib.Path(file_path)
     try:
-        # copy2 will attempt to preserve all metadata
-        dst_path = shutil.copy2(str(file_path), tmp_dir)
-        # write the data to the tmp file
-        with open(dst_path, mode) as dfile:
+        file_mode = stat.S_IMODE(file_path.stat().st_mode)
+    except FileNotFoundError:
+        file_mode = None
+    fd, tmp_path = _create_temp_file(file_path)
+    try:
+        with open(fd, mode) as dfile:
             dfile.write(data)
-        # move the tmp file over the original file
-        shutil.move(dst_path, str(file_path))
+            dfile.flush()
+            os.fsync(dfile.fileno())
+        if file_mode is not None:
+            os.chmod(tmp_path, file_mode)
+        os.replace(tmp_path, str(file_path))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    _fsync_dir(file_path.parent)
+
+
+def _create_temp_file(file_path):
+    """Create a temporary file next to file_path, return (fd, path).
+
+    Unlike tempfile.mkstemp the file is created with the default
+    permissions (0o666 less the umask) rather than 0o600.
+    """
+    while True:
+        tmp_path = str(
+            file_path.with_name(
+                ".{}.{}.tmp".format(file_path.name, uuid.uuid4().hex[:8])
+            )
+        )
+        try:
+            fd = os.open(tmp_path, _TEMP_FILE_FLAGS, 0o666)
+        except FileExistsError:
+            continue
+        return fd, tmp_path
+
+
+def _fsync_dir(dir_path):
+    """Flush a directory entry change to disk. Not possible on Windows."""
+    if os.name != "posix":
+        return
+    fd = os.open(str(dir_path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
     finally:
-        shutil.rmtree(tmp_dir)
+        os.close(fd)
 
 
 # This is going to be removed.
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""A local inventory of named devices.
+
+The inventory is a JSON file, INVENTORY_FILE_PATH, holding devices by
+name. Each device has an address, the hostname it was discovered with,
+tags and groups. The inventory also records when each device was last
+seen and how long an SSH connection to it took then, and for a device
+stored by hostname, the addresses the hostname last resolved to.
+
+Devices can be selected by name, and commands can target every device in
+a group, without running discovery. The inventory is indexed by name,
+address, hostname, tag and group when it is loaded.
+
+Use `load` to read the inventory, and `edit` to change it:
+
+    with inventory.edit() as devices:
+        devices.add("hall-sensor", "192.168.1.20", groups=["hall"])
+"""
+
+import contextlib
+import json
+import pathlib
+import time
+from collections import namedtuple
+
+from . import file_handler
+
+INVENTORY_FILE_PATH = pathlib.Path().home() / ".mbl-inventory.json"
+
+# Seconds to wait for another process to finish editing the inventory.
+LOCK_TIMEOUT_S = 30
+
+FORMAT_VERSION = 1
+
+# A device in the inventory. `last_seen` is a time.time() timestamp and
+# `latency_s` the time to connect to the device then, both are None if
+# the device hasn't been seen. `resolved` holds the addresses `address`
+# resolved to when the device was last added, selected or pinged, empty if
+# `address` is an IP address or hasn't been resolved.
+InventoryDevice = namedtuple(
+    "InventoryDevice",
+    "name address hostname tags groups last_seen latency_s resolved",
+)
+
+
+def load(path=None):
+    """Read the inventory, return an empty one if there is no file.
+
+    :param Path path: inventory file, INVENTORY_FILE_PATH if None.
+    """
+    return Inventory(path or INVENTORY_FILE_PATH)
+
+
+@contextlib.contextmanager
+def edit(path=None):
+    """Lock and read the inventory, save it when the context exits.
+
+    Other processes editing the inventory wait for the lock, so they
+    don't overwrite each other's changes. The inventory isn't saved if
+    the context raises.
+
+    :param Path path: inventory file, INVENTORY_FILE_PATH if None.
+    """
+    path = pathlib.Path(path or INVENTORY_FILE_PATH)
+    with file_handler.lock_file(
+        file_handler.lock_path_for(path), LOCK_TIMEOUT_S
+    ):
+        inventory = Inventory(path)
+        yield inventory
+        inventory.save()
+
+
+def record_discovered(devices, path=None):
+    """Update the address and last seen time of discovered devices.
+
+    Devices in the inventory are matched by the hostname they were
+    discovered with. Devices without a hostname are matched by address,
+    and the hostname they were discovered with is recorded, so they are
+    found after their address changes. Does nothing if there is no
+    inventory file.
+
+    :param devices list: a (hostname, address) tuple for each device.
+    """
+    path = pathlib.Path(path or INVENTORY_FILE_PATH)
+    if not path.exists():
+        return
+    with edit(path) as inventory:
+        for hostname, address in devices:
+            for dev in inventory.with_hostname(hostname):
+                inventory.record_seen(dev.name, address=address)
+            dev = inventory.by_address(address)
+            if dev is not None and not dev.hostname:
+                inventory.add(dev.name, address, hostname=hostname)
+                inventory.record_seen(dev.name)
+
+
+class Inventory:
+    """Devices in the inventory, with indexes for lookups.
+
+    Iterating over the inventory gives the devices sorted by name.
+    """
+
+    def __init__(self, path):
+        """Read an inventory file.
+
+        :param Path path: the inventory file, it needn't exist.
+        """
+        self._path = pathlib.Path(path)
+        try:
+            with open(str(self._path)) as ifile:
+                data = json.load(ifile)
+        except FileNotFoundError:
+            data = dict()
+        except ValueError:
+            raise ValueError(
+                "The device inventory {} is not valid JSON.".format(self._path)
+            )
+        self._devices = dict()
+        for name, fields in data.get("devices", dict()).items():
+            # Inventories saved before addresses were resolved lack it.
+            fields.setdefault("resolved", [])
+            self._devices[name] = InventoryDevice(name=name, **fields)
+        self._reindex()
+
+    def get(self, name):
+        """Return the device with a name, raise ValueError if not found."""
+        try:
+            return self._devices[name]
+        except KeyError:
+            raise ValueError(
+                "There is no device named '{}' in the inventory.".format(name)
+            )
+
+    def by_address(self, address):
+        """Return the device with an address, or None.
+
+        Devices stored by hostname are also found by the addresses recorded
+        with `record_resolved`.
+        """
+        return self._by_address.get(address)
+
+    def with_hostname(self, hostname):
+        """Return a list of the devices discovered with a hostname."""
+        return self._lookup(self._by_hostname, hostname)
+
+    def with_tag(self, tag):
+        """Return a list of the devices with a tag, sorted by name."""
+        return self._lookup(self._by_tag, tag)
+
+    def in_group(self, group):
+        """Return a list of the devices in a group, sorted by name."""
+        return self._lookup(self._by_group, group)
+
+    def groups(self):
+        """Return a sorted list of the group names."""
+        return sorted(self._by_group)
+
+    def add(self, name, address, hostname="", tags=(), groups=()):
+        """Add a device, or update it if there is one with the same name.
+
+        The tags and groups of an existing device are kept, new ones are
+        added to them.
+        """
+        old = self._devices.get(name)
+        if old is None:
+            dev = InventoryDevice(
+                name,
+                address,
+                hostname,
+                [],
+                [],
+                last_seen=None,
+                latency_s=None,
+                resolved=[],
+            )
+        else:
+            dev = old._replace(
+                address=address,
+                hostname=hostname or old.hostname,
+                resolved=old.resolved if address == old.address else [],
+            )
+        self._devices[name] = dev._replace(
+            tags=sorted(set(dev.tags) | set(tags)),
+            groups=sorted(set(dev.groups) | set(groups)),
+        )
+        self._reindex()
+        return self._devices[name]
+
+    def remove(self, name):
+        """Remove a device, raise ValueError if there isn't one."""
+        self.get(name)
+        del self._devices[name]
+        self._reindex()
+
+    def record_seen(self, name, address=None, latency_s=None):
+        """Record that a device was seen now.
+
+        :param address str: the device's address, if it has changed.
+        :param latency_s float: time to connect to the device, if known.
+        """
+        dev = self.get(name)
+        if address and address != dev.address:
+            dev = dev._replace(address=address, resolved=[])
+        dev = dev._replace(
+            last_seen=time.time(),
+            latency_s=latency_s if latency_s is not None else dev.latency_s,
+        )
+        self._devices[name] = dev
+        self._reindex()
+
+    def record_resolved(self, name, addresses):
+        """Record the addresses a device's address resolved to.
+
+        Nothing is recorded for a device stored by IP address.
+        """
+        dev = self.get(name)
+        if list(addresses) == [dev.address]:
+            return
+        self._devices[name] = dev._replace(resolved=list(addresses))
+        self._reindex()
+
+    def save(self):
+        """Write the inventory file in one atomic operation."""
+        devices = {
+            dev.name: {k: v for k, v in dev._asdict().items() if k != "name"}
+            for dev in self
+        }
+        file_handler.to_json(
+            self._path, version=FORMAT_VERSION, devices=devices
+        )
+
+    def __iter__(self):
+        """Iterate over the devices sorted by name."""
+        return iter([self._devices[n] for n in sorted(self._devices)])
+
+    def __len__(self):
+        """Return the number of devices."""
+        return len(self._devices)
+
+    def _reindex(self):
+        self._by_address = dict()
+        self._by_hostname = dict()
+        self._by_tag = dict()
+        self._by_group = dict()
+        for dev in self._devices.values():
+            self._by_address[dev.address] = dev
+            if dev.hostname:
+                self._by_hostname.setdefault(dev.hostname, set()).add(dev.name)
+            for tag in dev.tags:
+                self._by_tag.setdefault(tag, set()).add(dev.name)
+            for group in dev.groups:
+                self._by_group.setdefault(group, set()).add(dev.name)
+        # An address stored directly takes precedence over a resolved one.
+        for dev in self._devices.values():
+            for address in dev.resolved:
+                self._by_address.setdefault(address, dev)
+
+    def _lookup(self, index, key):
+        return [self._devices[n] for n in sorted(index.get(key, ()))]
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Collect metrics of device operations for Prometheus.
+
+Counters and summaries are updated by the SSH, transfer and provisioning
+code, labelled with the device address where there is one. They can be
+written in the Prometheus text format, e.g. for the node exporter's
+textfile collector, or in the OpenMetrics text format.
+
+Transfer throughput per device is the rate of
+mbl_cli_transfer_bytes_total over the rate of
+mbl_cli_transfer_seconds_sum, and the connect failure rate is the rate of
+mbl_cli_ssh_connect_failures_total over the rate of
+mbl_cli_ssh_connect_attempts_total.
+"""
+
+import contextlib
+import threading
+import time
+
+from . import file_handler
+
+PROMETHEUS = "prometheus"
+OPENMETRICS = "openmetrics"
+FORMATS = (PROMETHEUS, OPENMETRICS)
+
+# Seconds between writes of the metrics file by long running commands.
+WRITE_INTERVAL_S = 15
+
+COUNTER = "counter"
+SUMMARY = "summary"
+
+# Metric names, their type and help text.
+METRICS = {
+    "mbl_cli_ssh_connect_attempts_total": (
+        COUNTER,
+        "SSH connection attempts.",
+    ),
+    "mbl_cli_ssh_connect_failures_total": (
+        COUNTER,
+        "SSH connection attempts which failed.",
+    ),
+    "mbl_cli_ssh_connect_retries_total": (
+        COUNTER,
+        "SSH connection attempts retried after a failed attempt.",
+    ),
+    "mbl_cli_ssh_connect_seconds": (
+        SUMMARY,
+        "Time to connect and authenticate successful SSH connections.",
+    ),
+    "mbl_cli_transfer_bytes_total": (COUNTER, "Bytes transferred by scp."),
+    "mbl_cli_transfer_files_total": (COUNTER, "Files transferred by scp."),
+    "mbl_cli_transfer_seconds": (SUMMARY, "Duration of scp transfers."),
+    "mbl_cli_provision_seconds": (
+        SUMMARY,
+        "Duration of pelion provisioning, by result.",
+    ),
+}
+
+# Values by metric name, then by a tuple of sorted label items.
+# A counter's value is a number, a summary's is a [count, sum] list.
+_values = {name: dict() for name in METRICS}
+_lock = threading.Lock()
+
+
+def inc(name, amount=1, **labels):
+    """Increase a counter.
+
+    :param name str: name of the counter, in METRICS.
+    :param amount number: amount to add.
+    :param labels: label names and values.
+    """
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        values = _values[name]
+        values[key] = values.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Add an observation, e.g. a duration, to a summary.
+
+    :param name str: name of the summary, in METRICS.
+    :param value number: the observed value.
+    :param labels: label names and values.
+    """
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        summary = _values[name].setdefault(key, [0, 0.0])
+        summary[0] += 1
+        summary[1] += value
+
+
+@contextlib.contextmanager
+def timed(name, **labels):
+    """Observe the duration of the context in a summary.
+
+    The observation has a "result" label, "success" or "failure" if the
+    context raised. Can also be used as a function decorator.
+    """
+    start = time.monotonic()
+    result = "failure"
+    try:
+        yield
+        result = "success"
+    finally:
+        observe(name, time.monotonic() - start, result=result, **labels)
+
+
+def reset():
+    """Discard all the collected values."""
+    with _lock:
+        for values in _values.values():
+            values.clear()
+
+
+def format_metrics(metrics_format=PROMETHEUS):
+    """Return the collected metrics in a text exposition format.
+
+    :param metrics_format str: PROMETHEUS or OPENMETRICS.
+    """
+    openmetrics = metrics_format == OPENMETRICS
+    lines = []
+    with _lock:
+        for name, (metric_type, help_text) in METRICS.items():
+            values = _values[name]
+            family = name
+            if openmetrics and metric_type == COUNTER:
+                # OpenMetrics names counter families without the suffix.
+                family = name[: -len("_total")]
+            lines.append("# HELP {} {}".format(family, help_text))
+            lines.append("# TYPE {} {}".format(family, metric_type))
+            for key in sorted(values):
+                labels = _format_labels(key)
+                if metric_type == COUNTER:
+                    lines.append("{}{} {}".format(name, labels, values[key]))
+                else:
+                    count, total = values[key]
+                    lines.append("{}_count{} {}".format(name, labels, count))
+                    lines.append("{}_sum{} {}".format(name, labels, total))
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write(path, metrics_format=PROMETHEUS):
+    """Write the collected metrics to a file in one atomic operation.
+
+    Readers such as the node exporter never see a partly written file.
+    """
+    file_handler.to_text_file(path, format_metrics(metrics_format))
+
+
+@contextlib.contextmanager
+def write_periodically(path, metrics_format=PROMETHEUS):
+    """Write the metrics every WRITE_INTERVAL_S while in the context.
+
+    :param path str: the metrics file, or None to write nothing.
+    """
+    if path is None:
+        yield
+        return
+    stop = threading.Event()
+
+    def _writer():
+        while not stop.wait(WRITE_INTERVAL_S):
+            write(path, metrics_format)
+
+    thread = threading.Thread(target=_writer, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{{{}}}".format(
+        ",".join('{}="{}"'.format(name, _escape(value)) for name, value in key)
+    )
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
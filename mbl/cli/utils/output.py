@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Write command output as human readable text or JSON records.
+
+In JSON mode each record is written to stdout as a single line of JSON as
+soon as it is produced (newline-delimited JSON), and human readable
+messages are suppressed. Every record has a "type" field.
+"""
+
+import sys
+
+TEXT = "text"
+JSON = "json"
+FORMATS = (TEXT, JSON)
+
+# The output format for the current process, set from the cli args.
+FORMAT = TEXT
+
+
+def is_json():
+    """Return True if records should be written as JSON."""
+    return FORMAT == JSON
+
+
+def echo(*args, **kwargs):
+    """Print a human readable message. Does nothing in JSON mode."""
+    if not is_json():
+        print(*args, **kwargs)
+
+
+def emit(record_type, **fields):
+    """Write a record as a line of JSON. Does nothing in text mode.
+
+    :param record_type str: Value of the record's "type" field.
+    :param fields: The record's other fields, must be JSON serialisable.
+    """
+    if is_json():
+        # Imported here so text mode doesn't pay for importing json.
+        import json
+
+        record = dict(type=record_type)
+        record.update(fields)
+        sys.stdout.write(json.dumps(record) + "\n")
+        sys.stdout.flush()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Resolve device hostnames to addresses, with a cache on disk.
+
+IPv4 and IPv6 addresses are returned as they are, without a lookup.
+Hostnames are resolved with the system resolver, which handles mDNS
+`.local` names on most systems. If it can't resolve a `.local` name, the
+name is queried over mDNS with zeroconf, when the installed version
+supports it.
+
+Resolved addresses are kept in RESOLVE_CACHE_FILE_PATH for TTL_S seconds,
+so commands run by name in scripts don't pay for a lookup every time.
+Failed lookups aren't cached.
+"""
+
+import concurrent.futures
+import ipaddress
+import json
+import pathlib
+import socket
+import time
+
+from . import file_handler, trace
+
+RESOLVE_CACHE_FILE_PATH = pathlib.Path().home() / ".mbl-resolve-cache.json"
+
+# Seconds to keep resolved addresses in the cache.
+TTL_S = 300
+
+# Seconds to wait for an mDNS reply from zeroconf.
+MDNS_TIMEOUT_S = 3
+
+# Maximum number of names to resolve at once.
+MAX_JOBS = 16
+
+
+def resolve(name):
+    """Return a list of the addresses for an address or a hostname.
+
+    :param name str: an IPv4 or IPv6 address or a hostname.
+    :raises ValueError: if the name can't be resolved.
+    """
+    return resolve_all([name])[name]
+
+
+def resolve_all(names):
+    """Resolve several names concurrently.
+
+    The cache is read and written once for all of the names.
+
+    :param names iterable: IPv4 or IPv6 addresses or hostnames.
+    :returns dict: a list of addresses for each name.
+    :raises ValueError: if any of the names can't be resolved.
+    """
+    resolved = dict()
+    lookups = []
+    cache = None
+    now = time.time()
+    for name in names:
+        if name in resolved or name in lookups:
+            continue
+        if is_address(name):
+            resolved[name] = [name]
+            continue
+        if cache is None:
+            cache = _read_cache()
+        entry = cache.get(name.lower())
+        if entry and entry.get("expires", 0) > now:
+            resolved[name] = list(entry["addresses"])
+        else:
+            lookups.append(name)
+    if not lookups:
+        return resolved
+
+    with concurrent.futures.ThreadPoolExecutor(
+        min(len(lookups), MAX_JOBS)
+    ) as pool:
+        found = dict(zip(lookups, pool.map(_lookup, lookups)))
+    unresolved = [name for name in lookups if not found[name]]
+    for name in lookups:
+        if found[name]:
+            resolved[name] = found[name]
+            cache[name.lower()] = dict(
+                addresses=found[name], expires=now + TTL_S
+            )
+    _write_cache({k: v for k, v in cache.items() if v.get("expires", 0) > now})
+    if unresolved:
+        raise ValueError(
+            "Couldn't find the address of {}.".format(", ".join(unresolved))
+        )
+    return resolved
+
+
+def is_address(name):
+    """Return True if name is an IPv4 or an IPv6 address."""
+    try:
+        ipaddress.ip_address(name.split("%", 1)[0])
+    except ValueError:
+        return False
+    return True
+
+
+def _lookup(name):
+    """Return a list of the addresses of a name, empty if not found."""
+    with trace.span("resolve.lookup", "resolve", host=name) as span:
+        addresses = _getaddrinfo(name)
+        if not addresses and name.rstrip(".").endswith(".local"):
+            addresses = _mdns_lookup(name)
+        span.set(addresses=len(addresses))
+    return addresses
+
+
+def _getaddrinfo(name):
+    try:
+        infos = socket.getaddrinfo(name, None, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return []
+    addresses = []
+    for family, _, _, _, sockaddr in infos:
+        address = sockaddr[0]
+        if family == socket.AF_INET6 and sockaddr[3] and "%" not in address:
+            address = "{}%{}".format(address, _interface_name(sockaddr[3]))
+        if address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
+def _interface_name(scope_id):
+    try:
+        return socket.if_indextoname(scope_id)
+    except (AttributeError, OSError):
+        return str(scope_id)
+
+
+def _mdns_lookup(name):
+    """Query a .local name over mDNS, return a list of its addresses.
+
+    Only zeroconf versions with an AddressResolver can query host names,
+    with earlier versions the name isn't found.
+    """
+    # Import here so resolving other names doesn't import zeroconf.
+    import zeroconf
+
+    try:
+        resolver_class = zeroconf.AddressResolver
+    except AttributeError:
+        return []
+    resolver = resolver_class(name.rstrip(".") + ".")
+    zconf = zeroconf.Zeroconf()
+    try:
+        if not resolver.request(zconf, MDNS_TIMEOUT_S * 1000):
+            return []
+        return resolver.parsed_scoped_addresses()
+    finally:
+        zconf.close()
+
+
+def _read_cache():
+    try:
+        with open(str(RESOLVE_CACHE_FILE_PATH)) as cfile:
+            cache = json.load(cfile)
+    except (OSError, ValueError):
+        return dict()
+    return cache if isinstance(cache, dict) else dict()
+
+
+def _write_cache(cache):
+    try:
+        file_handler.to_json(RESOLVE_CACHE_FILE_PATH, **cache)
+    except OSError:
+        # The cache only saves time, don't fail because of it.
+        pass
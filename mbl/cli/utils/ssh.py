@@ -6,25 +6,54 @@
 """Handle ssh connections and data transfer."""
 
 
+import concurrent.futures
 import functools
+import json
 import logging
 import pathlib
 import platform
+import queue
+import re
+import shlex
+import socket
+import threading
 import time
+import uuid
+from collections import namedtuple
 
 import paramiko
 import scp
 
-from . import shell
+from . import file_handler, metrics, output, shell, trace
 
 logging.getLogger("paramiko").setLevel(logging.CRITICAL)
 
 SUPPRESS_PROGRESS = False
 
+# When a device has several addresses, connections to them are started
+# this many seconds apart, as recommended by RFC 8305 (Happy Eyeballs).
+CONNECTION_ATTEMPT_DELAY_S = 0.25
+
+# Seconds to wait for a TCP connection to one of a device's addresses.
+TCP_CONNECT_TIMEOUT_S = 30
+
+# The address of each multi-address device which last won the race to
+# connect. It is tried first the next time.
+PREFERRED_ADDRESS_FILE_PATH = (
+    pathlib.Path().home() / ".mbl-preferred-addresses.json"
+)
+
+# Result of a single command executed as part of a batch.
+# `exit_code` is None if the command never completed on the device.
+CommandResult = namedtuple("CommandResult", "cmd exit_code stdout stderr")
+
+# Totals for an scp transfer.
+TransferSummary = namedtuple("TransferSummary", "files bytes duration_s")
+
 
 def scp_progress(filename, size, sent):
     """Display the progress of an scp transfer."""
-    if sent and not SUPPRESS_PROGRESS:
+    if sent and not (SUPPRESS_PROGRESS or output.is_json()):
         try:
             fname = filename.decode()
         except AttributeError:
@@ -43,18 +72,64 @@ def scp_progress(filename, size, sent):
         print("\x1b[2K", end="")
 
 
+class _TransferProgress:
+    """scp progress callback which records the size and duration of files.
+
+    Display the transfer progress, and emit a record for each file when it
+    has been transferred.
+    """
+
+    def __init__(self):
+        """Start timing the transfer."""
+        self.start_time = time.monotonic()
+        self.files = 0
+        self.bytes = 0
+        self._file_start_time = None
+
+    def __call__(self, filename, size, sent, *args):
+        """Handle a progress update from the SCPClient."""
+        now = time.monotonic()
+        if self._file_start_time is None:
+            self._file_start_time = now
+        scp_progress(filename, size, sent)
+        if sent >= size:
+            try:
+                fname = filename.decode()
+            except AttributeError:
+                fname = filename
+            self.files += 1
+            self.bytes += size
+            output.emit(
+                "file",
+                path=fname,
+                bytes=size,
+                duration_s=now - self._file_start_time,
+            )
+            self._file_start_time = None
+
+    def summary(self):
+        """Return the TransferSummary for all files transferred so far."""
+        return TransferSummary(
+            self.files, self.bytes, time.monotonic() - self.start_time
+        )
+
+
 def _scp_session(transfer_func):
     """Start an scp session on the client.
 
     Teardown the SCP session when the SCPClient context manager exits.
+    Return a TransferSummary for the transfer.
 
     This decorator can only be used with methods of the SSHSession class.
     """
     # retain metadata from the wrapped function 'object'.
     @functools.wraps(transfer_func)
     def wrapper(self, local_path, remote_path, recursive=False):
-        with scp.SCPClient(
-            self._client.get_transport(), progress=scp_progress
+        progress = _TransferProgress()
+        with trace.span(
+            "ssh.scp_{}".format(transfer_func.__name__), "ssh"
+        ) as span, scp.SCPClient(
+            self._client.get_transport(), progress=progress
         ) as scp_client:
             transfer_func(
                 self,
@@ -63,6 +138,17 @@ def _scp_session(transfer_func):
                 scp_client=scp_client,
                 recursive=recursive,
             )
+            summary = progress.summary()
+            span.set(files=summary.files, bytes=summary.bytes)
+        labels = dict(
+            address=self.device.address, direction=transfer_func.__name__
+        )
+        metrics.inc("mbl_cli_transfer_bytes_total", summary.bytes, **labels)
+        metrics.inc("mbl_cli_transfer_files_total", summary.files, **labels)
+        metrics.observe(
+            "mbl_cli_transfer_seconds", summary.duration_s, **labels
+        )
+        return summary
 
     return wrapper
 
@@ -70,20 +156,35 @@ def _scp_session(transfer_func):
 class SSHClientWithNoAuthSupport(paramiko.SSHClient):
     """SSH Client which handles 'no auth' SSH devices."""
 
+    def connect(self, *args, **kwargs):
+        """Connect, tracing the handshake and authentication separately."""
+        self._connect_start_s = time.monotonic()
+        super().connect(*args, **kwargs)
+
     def _auth(self, username, *args):
         """Override to invoke the transport directly when SSH auth is None."""
-        try:
-            self._transport.auth_none(username)
-        except paramiko.SSHException:
-            super()._auth(username, *args)
+        # The TCP connection, banner exchange and key exchange all happen
+        # in SSHClient.connect before authentication.
+        trace.add("ssh.handshake", "ssh", self._connect_start_s)
+        with trace.span("ssh.auth", "ssh"):
+            try:
+                self._transport.auth_none(username)
+            except paramiko.SSHException:
+                super()._auth(username, *args)
 
 
 class SSHSession:
     """Context manager wrapping an SSHClient, handles setup/auth and scp."""
 
-    def __init__(self, device):
-        """:param device DeviceInfo: A device info object."""
+    def __init__(self, device, port=None):
+        """Create a session, connect when entering the context.
+
+        :param device DeviceInfo: A device info object.
+        :param port int: The SSH port, or None to use the port for the
+        device in ~/.ssh/config, or 22.
+        """
         self.device = device
+        self.port = port
         self._client = SSHClientWithNoAuthSupport()
         self._client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
@@ -97,6 +198,11 @@ class SSHSession:
         self._client.close()
         return False
 
+    def is_active(self):
+        """Return True if the session is connected."""
+        transport = self._client.get_transport()
+        return transport is not None and transport.is_active()
+
     @_scp_session
     def put(self, local_path, remote_path, recursive, scp_client=None):
         """Send data via scp."""
@@ -111,10 +217,12 @@ class SSHSession:
 
     def start_shell(self):
         """Start an interactive shell."""
+        with trace.span("ssh.open_shell", "ssh"):
+            channel = self._client.invoke_shell()
         if platform.system() == "Windows":
-            return shell.WindowsSSHShell(self._client.invoke_shell())
+            return shell.WindowsSSHShell(channel)
         else:
-            return shell.PosixSSHShell(self._client.invoke_shell())
+            return shell.PosixSSHShell(channel)
 
     def run_cmd(self, cmd, check=False, writeout=False):
         """Execute a command over SSH.
@@ -146,7 +254,8 @@ class SSHSession:
                     raise SSHCallError(msg, code=exit_status)
 
         try:
-            cmd_output = self._client.exec_command(cmd, timeout=300)
+            with trace.span("ssh.exec", "ssh"):
+                cmd_output = self._client.exec_command(cmd, timeout=300)
         except paramiko.SSHException as ssh_error:
             raise IOError(
                 "The command `{}` failed to execute, "
@@ -156,6 +265,67 @@ class SSHSession:
             _check_print_out(cmd_output, check, writeout)
             return cmd_output
 
+    def run_batch(self, cmds, jobs=1):
+        """Execute several commands over SSH, return a result for each.
+
+        The commands are sent to the device as a single script, so a batch
+        only costs one channel open. Each command runs in its own subshell
+        and its output is delimited so it can be separated from the output
+        of its neighbours.
+
+        If `jobs` is greater than one the commands are distributed between
+        up to `jobs` channels on the same transport, which run
+        concurrently. Only use this for commands which are independent of
+        each other.
+
+        :param cmds list: The shell commands to execute over ssh.
+        :param jobs int: The number of channels to run the commands on.
+        :returns list: A CommandResult for each command, in `cmds` order.
+        """
+        cmds = list(cmds)
+        if not cmds:
+            return []
+        jobs = max(1, min(jobs, len(cmds)))
+        if jobs == 1:
+            return self._run_script(cmds)
+
+        results = [None] * len(cmds)
+        chunks = [range(i, len(cmds), jobs) for i in range(jobs)]
+        with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+            futures = [
+                (pool.submit(self._run_script, [cmds[i] for i in c]), c)
+                for c in chunks
+            ]
+            for future, chunk in futures:
+                for index, result in zip(chunk, future.result()):
+                    results[index] = result
+        return results
+
+    def _run_script(self, cmds):
+        token = uuid.uuid4().hex
+        script = _build_batch_script(cmds, token)
+        try:
+            with trace.span("ssh.exec", "ssh", commands=len(cmds)):
+                _, stdout, stderr = self._client.exec_command(
+                    script, timeout=300
+                )
+        except paramiko.SSHException as ssh_error:
+            raise IOError(
+                "The command batch failed to execute, "
+                "the error was: {}".format(ssh_error)
+            )
+        # Drain stderr in the background so a command writing a lot of
+        # data to stderr can't stall the channel while we read stdout.
+        with trace.span(
+            "ssh.batch_output", "ssh"
+        ), concurrent.futures.ThreadPoolExecutor(1) as pool:
+            stderr_data = pool.submit(stderr.read)
+            stdout_data = stdout.read()
+            stdout.channel.recv_exit_status()
+            return _parse_batch_output(
+                cmds, token, stdout_data, stderr_data.result()
+            )
+
     def _connect(self, retry_limit=3, retry_interval_s=5):
         config = paramiko.SSHConfig()
         conf_path = pathlib.Path().home() / ".ssh" / "config"
@@ -165,30 +335,218 @@ class SSHSession:
             cdict = config.lookup(self.device.hostname)
         else:
             cdict = None
+        port = self.port
+        if port is None:
+            port = int(cdict.get("port", 22)) if cdict else 22
 
         # There are often "SSH Protocol Banner" timeouts while waiting for the
         # server to present us with its SSH protocol banner.
         # We set paramiko's `banner_timeout` parameter, but that rarely solves
         # the problem. Therefore we retry the connection `retry_limit` times
         # to try and decrease the rate of failure.
-        for _ in range(retry_limit):
+        labels = dict(address=self.device.address)
+        for attempt in range(retry_limit):
+            metrics.inc("mbl_cli_ssh_connect_attempts_total", **labels)
+            if attempt:
+                metrics.inc("mbl_cli_ssh_connect_retries_total", **labels)
+            start = time.monotonic()
             try:
-                self._client.connect(
-                    self.device.address,
-                    username=self.device.username,
-                    password=self.device.password
-                    if self.device.password
-                    else None,
-                    key_filename=cdict["identityfile"] if cdict else None,
-                    banner_timeout=60,
-                )
+                with trace.span(
+                    "ssh.connect",
+                    "ssh",
+                    address=self.device.address,
+                    port=port,
+                    attempt=attempt + 1,
+                ) as span:
+                    # Only pass a socket if a device has several addresses,
+                    # otherwise let paramiko connect as it always has.
+                    address, sock_kwargs = self.device.address, dict()
+                    if len(self.device.addresses) > 1:
+                        address, sock = _connect_first(
+                            self.device.addresses, port
+                        )
+                        sock_kwargs = dict(sock=sock)
+                        span.set(connected_address=address)
+                    self._client.connect(
+                        address,
+                        port=port,
+                        username=self.device.username,
+                        password=self.device.password
+                        if self.device.password
+                        else None,
+                        key_filename=cdict["identityfile"] if cdict else None,
+                        banner_timeout=60,
+                        **sock_kwargs
+                    )
             except paramiko.SSHException:
+                metrics.inc("mbl_cli_ssh_connect_failures_total", **labels)
                 time.sleep(retry_interval_s)
                 continue
+            except OSError:
+                metrics.inc("mbl_cli_ssh_connect_failures_total", **labels)
+                raise
             else:
+                metrics.observe(
+                    "mbl_cli_ssh_connect_seconds",
+                    time.monotonic() - start,
+                    **labels
+                )
                 break
 
 
+def _connect_first(addresses, port):
+    """Open a TCP connection to whichever address accepts one first.
+
+    Connections are started in turn, CONNECTION_ATTEMPT_DELAY_S apart or
+    as soon as the previous one fails, so a broken address family doesn't
+    hold up the others. The address which last won is tried first, and
+    the winner is remembered for next time.
+
+    :param addresses tuple: addresses of one device.
+    :returns tuple: (address, connected socket).
+    :raises OSError: the last error if no connection could be made.
+    """
+    addresses = _preferred_first(addresses)
+    results = queue.Queue()
+
+    def _attempt(address):
+        try:
+            sock = socket.create_connection(
+                (address, port), timeout=TCP_CONNECT_TIMEOUT_S
+            )
+        except OSError as error:
+            results.put((address, None, error))
+        else:
+            sock.settimeout(None)
+            results.put((address, sock, None))
+
+    pending = list(addresses)
+    running = 0
+    winner = None
+    error = None
+    while winner is None and (pending or running):
+        if pending:
+            threading.Thread(
+                target=_attempt, args=(pending.pop(0),), daemon=True
+            ).start()
+            running += 1
+        try:
+            address, sock, error = results.get(
+                timeout=CONNECTION_ATTEMPT_DELAY_S if pending else None
+            )
+        except queue.Empty:
+            continue
+        running -= 1
+        if sock is not None:
+            winner = (address, sock)
+
+    if running:
+        # Close the connections which lost the race when they complete.
+        threading.Thread(
+            target=_close_late, args=(results, running), daemon=True
+        ).start()
+    if winner is None:
+        raise error
+    if winner[0] != addresses[0]:
+        _remember_preferred(addresses, winner[0])
+    return winner
+
+
+def _close_late(results, count):
+    for _ in range(count):
+        _, sock, _ = results.get()
+        if sock is not None:
+            sock.close()
+
+
+def _preferred_key(addresses):
+    return " ".join(sorted(addresses))
+
+
+def _preferred_first(addresses):
+    """Return the addresses with the last winner of a race first."""
+    preferred = _read_preferred().get(_preferred_key(addresses))
+    if preferred not in addresses:
+        return tuple(addresses)
+    return (preferred,) + tuple(a for a in addresses if a != preferred)
+
+
+def _remember_preferred(addresses, address):
+    preferred = _read_preferred()
+    preferred[_preferred_key(addresses)] = address
+    try:
+        file_handler.to_json(PREFERRED_ADDRESS_FILE_PATH, **preferred)
+    except OSError:
+        # Remembering the address only saves time, don't fail because
+        # of it.
+        pass
+
+
+def _read_preferred():
+    try:
+        with open(str(PREFERRED_ADDRESS_FILE_PATH)) as pfile:
+            preferred = json.load(pfile)
+    except (OSError, ValueError):
+        return dict()
+    return preferred if isinstance(preferred, dict) else dict()
+
+
+def _build_batch_script(cmds, token):
+    """Build a shell script which runs `cmds` with delimited output.
+
+    Each command's stdout and stderr are wrapped in begin/end markers
+    containing `token`. The end marker also holds the exit code.
+    """
+    lines = []
+    for index, cmd in enumerate(cmds):
+        begin = shlex.quote("{}:B:{}:".format(token, index))
+        end = shlex.quote("{}:E:{}:".format(token, index))
+        lines.append("printf %s {0}; printf %s {0} >&2".format(begin))
+        # Run in a subshell so `exit` or `cd` can't affect the next command.
+        # The newlines keep a trailing comment from swallowing the bracket.
+        lines.append("(\n{}\n) </dev/null".format(cmd))
+        lines.append(
+            'rc=$?; printf %s {0}"$rc:"; printf %s {0}"$rc:" >&2'.format(end)
+        )
+    return "\n".join(lines)
+
+
+def _parse_batch_output(cmds, token, stdout, stderr):
+    """Split the output of a batch script into a CommandResult per command.
+
+    :param cmds list: The commands the batch script was built from.
+    :param token str: The token used to build the batch script.
+    :param stdout bytes: stdout from the batch script.
+    :param stderr bytes: stderr from the batch script.
+    """
+    pattern = re.compile(
+        rb"%s:B:(\d+):(.*?)%s:E:\1:(\d+):" % (token.encode(), token.encode()),
+        flags=re.DOTALL,
+    )
+
+    def _sections(data):
+        return {
+            int(m.group(1)): (m.group(2), int(m.group(3)))
+            for m in pattern.finditer(data)
+        }
+
+    out_sections = _sections(stdout)
+    err_sections = _sections(stderr)
+    results = []
+    for index, cmd in enumerate(cmds):
+        out, exit_code = out_sections.get(index, (b"", None))
+        err, _ = err_sections.get(index, (b"", None))
+        results.append(
+            CommandResult(
+                cmd=cmd,
+                exit_code=exit_code,
+                stdout=out.decode(errors="replace"),
+                stderr=err.decode(errors="replace"),
+            )
+        )
+    return results
+
+
 class SCPValidationFailed(Exception):
     """SCP transfer md5 validation failed."""
 
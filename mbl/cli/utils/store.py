@@ -25,15 +25,36 @@ store's config.json.
 
 * `Store` class representing a storage location on disk.
 * `StoreLocationsRecord` class is an interface for STORE_LOCATIONS_FILE i/o.
+* `get_store` returns the process-wide `Store` of a type. It reads each
+  config file once, and again only when the file is changed on disk.
 
 Exceptions:
 ----
 * `StoreNoteFoundError` Specified store location does not exist.
 """
 
+import contextlib
+import copy
+import hashlib
+import logging
+import os
 import pathlib
 import shutil
-from . import file_handler
+import threading
+import time
+from . import cert_bundle, file_handler, trace
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds to wait for another process to finish saving a store.
+LOCK_TIMEOUT_S = 30
+
+# Names used by the store itself, which certificates can't be called.
+_RESERVED_NAMES = ("objects", "config.json", ".config.json.lock")
+
+# Config keys describing the stored certificates. Changes to these are
+# journaled, rather than merged as a whole, when saving a store.
+_CERTIFICATE_KEYS = ("dev_certs", "cert_fields", "objects")
 
 DEFAULT_STORE_RECORD = {
     "user": str(pathlib.Path().home() / pathlib.Path(".mbl-store", "user")),
@@ -48,21 +69,56 @@ class Store:
     about the store itself, and information on objects within the store.
 
     This object provides an interface to access the store config file data.
+
+    Certificate changes can be grouped with `batch()`, so they are saved
+    together, or not at all.
+
+    Saving takes a lock on the store, so processes sharing a store don't
+    overwrite each other's changes. If the config changed on disk since it
+    was read, it is read again and this object's changes are applied to
+    it before it is saved. Reading doesn't take the lock, files are
+    replaced atomically so readers always see a complete file.
     """
 
-    def __init__(self, store_type):
+    def __init__(self, store_type, path_to_store=None):
         """Build a store object from a path based on the store_type.
 
         The path_to_store on disk must exist before instantiating this class.
 
         :params str store_type: The type of store to build (team or user).
+        :params Path path_to_store: The store location, or None to look it
+        up in the StoreLocationsRecord.
         """
-        path_to_store = _get_or_create_store(store_type)
-        self._config = file_handler.from_json(path_to_store / "config.json")
+        if path_to_store is None:
+            path_to_store = _get_or_create_store(store_type)
+        self._path = path_to_store
+        # Staged certificate changes while in a batch, otherwise None.
+        self._journal = None
+        # Held for the duration of a batch by the thread running it.
+        self._lock = threading.RLock()
+        self.reload()
+
+    @property
+    def changed_on_disk(self):
+        """True if config.json changed since the store last read or saved it.
+
+        Saving replaces the file, so the inode changes even if the
+        modification time doesn't.
+        """
+        return _stat_key(self._path / "config.json") != self._config_stat
+
+    def reload(self):
+        """Read the config from disk, discarding unsaved changes."""
+        config_path = self._path / "config.json"
+        with trace.span("store.load", "store", path=str(config_path)):
+            self._config = file_handler.from_json(config_path)
         if not self._config:
             self._config = dict(
-                location=str(path_to_store), api_key="", dev_certs=dict()
+                location=str(self._path), api_key="", dev_certs=dict()
             )
+        self._config_stat = _stat_key(config_path)
+        # The config as last read or saved, to find what changed since.
+        self._base_config = copy.deepcopy(self._config)
 
     @property
     def api_key(self):
@@ -78,37 +134,145 @@ class Store:
 
     @property
     def certificate_paths(self):
-        """List of all developer certificate binary files in the store.
+        """List of all developer certificate files in the store.
+
+        Certificate fields are stored once per content, in object files
+        named by their SHA-256 hash. Stores written by older versions hold
+        a bundle file, or a binary file per certificate field.
 
         :returns dict: developer cert file paths in the form
-        `{name: [bin_path_1, bin_path_2 ...]}`
+        `{name: [object_path_1, object_path_2 ...]}`, `{name: [bundle_path]}`
+        or `{name: [bin_path_1, bin_path_2 ...]}`
         """
         return self._config["dev_certs"]
 
+    @property
+    def _certificate_fields(self):
+        """Map certificate names to their {field name: object hash}."""
+        return self._config.setdefault("cert_fields", dict())
+
+    @property
+    def _object_refcounts(self):
+        """Map object hashes to the number of fields referencing them."""
+        return self._config.setdefault("objects", dict())
+
+    @property
+    def pelion_cert_cache(self):
+        """Cached Pelion certificate metadata, see cloudapi.CertificateCache.
+
+        :returns dict: the cache data, modified in place by the cache.
+        """
+        return self._config.setdefault("pelion_cert_cache", dict())
+
     @property
     def config_path(self):
         """Path to the store config file."""
         return pathlib.Path(self._config["location"], "config.json")
 
     def save(self):
-        """Save config data to a file."""
-        file_handler.to_json(self.config_path, **self._config)
+        """Save config data to a file.
+
+        In a batch the config is saved when the batch is committed.
+        """
+        if self._journal is None:
+            with self.batch():
+                pass
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Group certificate changes into a single transaction.
+
+        `add_certificate` and `delete_certificate` calls in the context
+        change the store config in memory, the changes are saved when the
+        context exits: new objects are written, config.json is saved once,
+        then objects and files no longer used are removed.
+        If the context raises, or saving config.json fails, the store is
+        left as it was. Once config.json is saved the changes are kept: a
+        file which can't be removed afterwards is logged and left behind.
+        Nested batches join the outermost batch.
+        """
+        with self._lock:
+            if self._journal is not None:
+                yield self
+                return
+            snapshot = (
+                copy.deepcopy(self._config),
+                self._base_config,
+                self._config_stat,
+            )
+            self._journal = []
+            try:
+                yield self
+                lock_start = time.monotonic()
+                with file_handler.lock_file(
+                    file_handler.lock_path_for(self.config_path),
+                    LOCK_TIMEOUT_S,
+                ):
+                    trace.add("store.lock_wait", "store", lock_start)
+                    with trace.span(
+                        "store.commit", "store", changes=len(self._journal)
+                    ):
+                        self._commit(self._journal)
+            except BaseException:
+                self._config, self._base_config, self._config_stat = snapshot
+                raise
+            finally:
+                self._journal = None
 
     def add_certificate(self, name, certificate):
-        """Add a certificate object to the store as a set of binary files.
+        """Add a certificate object to the store.
+
+        Each field is stored as an object named by the hash of its
+        contents, so identical fields are stored once. Adding a
+        certificate which is already stored changes nothing.
 
         :param str name: name of the dev certificate.
         :param dict credentials: credentials object.
+        :raises ValueError: if the name can't be used in the store.
         """
-        p_list = []
-        for item in certificate:
-            c_path = pathlib.Path(self._config["location"], name)
-            c_path.mkdir(exist_ok=True, parents=True)
-            c_path = c_path / "{}.bin".format(item)
-            file_handler.to_binary_file(c_path, certificate[item])
-            p_list.append(str(c_path))
-        self.certificate_paths[name] = p_list
-        self.save()
+        _check_certificate_name(name)
+        objects = {
+            hashlib.sha256(data).hexdigest(): data
+            for data in certificate.values()
+        }
+        fields = {
+            field: hashlib.sha256(data).hexdigest()
+            for field, data in certificate.items()
+        }
+        if self._certificate_fields.get(name) == fields:
+            return
+        with self.batch():
+            old_paths = self.certificate_paths.get(name)
+            self._journal.append(("add", name, fields, objects, old_paths))
+            self._set_certificate_fields(name, fields)
+
+    def get_certificate(self, name):
+        """Read a certificate object from the store.
+
+        Objects are verified against their hash, so a corrupt store is
+        detected before a certificate is used.
+
+        :param str name: name of the dev certificate.
+        :returns dict: credentials object.
+        """
+        try:
+            paths = self.certificate_paths[name]
+        except KeyError:
+            raise ValueError(
+                "Certificate '{}' not found in the store.".format(name)
+            )
+        fields = self._certificate_fields.get(name)
+        if fields is not None:
+            return {
+                field: self._read_object(digest)
+                for field, digest in fields.items()
+            }
+        if len(paths) == 1 and cert_bundle.is_bundle(paths[0]):
+            return cert_bundle.read(paths[0])
+        return {
+            pathlib.Path(path).stem: pathlib.Path(path).read_bytes()
+            for path in paths
+        }
 
     def delete_certificate(self, name):
         """Delete a certificate from the store."""
@@ -117,19 +281,125 @@ class Store:
                 "Certificate '{}' not found in the store, so could not be"
                 " deleted.".format(name)
             )
-        try:
-            shutil.rmtree(
-                str(pathlib.Path(self._config["location"], name).resolve())
+        with self.batch():
+            self._journal.append(
+                ("delete", name, None, None, self.certificate_paths[name])
             )
-        except OSError:
-            raise OSError(
-                "There was an error removing the certificate files."
-                " The certificate has been removed from the store config."
-                " Please check and delete the files manually."
+            self._set_certificate_fields(name, None)
+
+    def _set_certificate_fields(self, name, fields):
+        """Point a certificate at its objects, or remove it if fields is None.
+
+        Keep the object reference counts up to date.
+        """
+        refcounts = self._object_refcounts
+        for digest in self._certificate_fields.pop(name, dict()).values():
+            refcounts[digest] -= 1
+            if not refcounts[digest]:
+                del refcounts[digest]
+        if fields is None:
+            self.certificate_paths.pop(name, None)
+            return
+        self._certificate_fields[name] = fields
+        for digest in fields.values():
+            refcounts[digest] = refcounts.get(digest, 0) + 1
+        self.certificate_paths[name] = [
+            str(self._object_path(digest)) for digest in fields.values()
+        ]
+
+    def _object_path(self, digest):
+        return self._location / "objects" / digest
+
+    def _read_object(self, digest):
+        data = self._object_path(digest).read_bytes()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(
+                "Store object {} is corrupt, its contents don't match its "
+                "hash.".format(self._object_path(digest))
             )
-        finally:
-            del self.certificate_paths[name]
-            self.save()
+        return data
+
+    def _write_config(self):
+        file_handler.to_json(self.config_path, **self._config)
+        self._config_stat = _stat_key(self.config_path)
+        self._base_config = copy.deepcopy(self._config)
+
+    def _rebase(self, journal):
+        """Read the config from disk again and reapply our changes to it.
+
+        Settings changed since the config was last read replace the ones
+        on disk, and the journaled certificate changes are replayed.
+        """
+        ours, base = self._config, self._base_config
+        self.reload()
+        for key, value in ours.items():
+            if key not in _CERTIFICATE_KEYS and value != base.get(key):
+                self._config[key] = value
+        for operation, name, fields, _, _ in journal:
+            self._set_certificate_fields(name, fields)
+
+    @property
+    def _location(self):
+        return pathlib.Path(self._config["location"])
+
+    def _commit(self, journal):
+        """Write the objects and config for the changes in `journal`.
+
+        Journal entries are ("add", name, fields, {hash: data}, old_paths)
+        or ("delete", name, None, None, old_paths), where old_paths are the
+        certificate's paths before the change, or None. New objects are
+        removed again if the config can't be saved. Objects and files no
+        longer referenced by the config are removed last, on a best effort
+        basis: the config is already saved, so a file which can't be
+        removed is left behind. The caller holds the store lock.
+        """
+        if self.changed_on_disk:
+            self._rebase(journal)
+        unused_objects = set(self._base_config.get("objects", dict()))
+        unused_objects.difference_update(self._object_refcounts)
+        written = []
+        removals = [self._object_path(digest) for digest in unused_objects]
+        try:
+            for operation, name, _, data, old_paths in journal:
+                # Remove a certificate saved in an older format.
+                removals.extend(
+                    _certificate_files(old_paths or [], self._location)
+                )
+                if operation == "add":
+                    for digest, object_data in data.items():
+                        path = self._object_path(digest)
+                        if (
+                            digest not in self._object_refcounts
+                            or path.exists()
+                        ):
+                            continue
+                        path.parent.mkdir(exist_ok=True)
+                        file_handler.to_binary_file(path, object_data)
+                        written.append(path)
+            if journal or self._config != self._base_config:
+                self._write_config()
+        except BaseException:
+            for path in written:
+                path.unlink()
+            raise
+        referenced = set(
+            p for paths in self.certificate_paths.values() for p in paths
+        )
+        for path in removals:
+            if str(path) in referenced or not path.exists():
+                continue
+            try:
+                if path.is_dir():
+                    shutil.rmtree(str(path.resolve()))
+                else:
+                    path.unlink()
+            except OSError as error:
+                _LOGGER.warning(
+                    "Couldn't remove %s, which the store no longer uses: %s."
+                    " Please delete it manually.",
+                    path,
+                    error,
+                )
 
 
 class StoreLocationsRecord:
@@ -189,6 +459,102 @@ class StoreNotFoundError(Exception):
     """The specified store does not exist."""
 
 
+_stores = dict()
+_locations_record = None
+_registry_lock = threading.RLock()
+
+
+def get_store(store_type):
+    """Return the shared Store object for a store type.
+
+    The store is created once per process. It is reloaded if its
+    config.json has been changed on disk, e.g. by another mbl-cli process,
+    unless it is in a batch. The StoreLocationsRecord is cached the same
+    way.
+
+    :param str store_type: The type of store to get (team or user).
+    """
+    with _registry_lock:
+        path_to_store = _get_locations_record().get(store_type)
+        key = (store_type, str(path_to_store))
+        store = _stores.get(key)
+        if store is None:
+            _create_store_dir(store_type, path_to_store)
+            store = _stores[key] = Store(store_type, path_to_store)
+        elif store.changed_on_disk and store._journal is None:
+            store.reload()
+        return store
+
+
+def clear_store_cache():
+    """Forget the shared Store objects, so they are read again."""
+    global _locations_record
+    with _registry_lock:
+        _stores.clear()
+        _locations_record = None
+
+
+def _get_locations_record():
+    """Return the shared StoreLocationsRecord, reread if it has changed."""
+    global _locations_record
+    path = StoreLocationsRecord.STORE_LOCATIONS_FILE_PATH
+    stat_key = _stat_key(path)
+    cached = _locations_record
+    if cached is None or cached[0] != (str(path), stat_key):
+        record = StoreLocationsRecord()
+        # The record may have just been created, stat it again.
+        cached = _locations_record = ((str(path), _stat_key(path)), record)
+    return cached[1]
+
+
+def _stat_key(path):
+    """Return a key which changes when the file at path is replaced."""
+    try:
+        st = os.stat(str(path))
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _certificate_files(paths, location):
+    """Return the file or directory holding a certificate in an old format.
+
+    Only a bundle file or a directory of field files directly in the store
+    location are returned. Objects are removed when they are no longer
+    referenced instead.
+
+    :param list paths: the paths recorded for the certificate.
+    :param Path location: the store location.
+    """
+    if len(paths) == 1 and cert_bundle.is_bundle(paths[0]):
+        candidate = pathlib.Path(paths[0])
+    elif paths:
+        candidate = pathlib.Path(paths[0]).parent
+    else:
+        return []
+    if (
+        candidate.parent.resolve() != location.resolve()
+        or candidate.name in _RESERVED_NAMES
+    ):
+        return []
+    return [candidate]
+
+
+def _check_certificate_name(name):
+    """Raise ValueError if a certificate name can't be used in the store."""
+    separators = [sep for sep in (os.sep, os.altsep, "/") if sep]
+    if (
+        not name
+        or name in (".", "..")
+        or name in _RESERVED_NAMES
+        or name.endswith(".lock")
+        or any(sep in name for sep in separators)
+    ):
+        raise ValueError(
+            "'{}' can't be used as a certificate name.".format(name)
+        )
+
+
 def _get_or_create_store(store_type):
     """Get the store path from the StoreLocationsRecord.
 
@@ -201,6 +567,10 @@ def _get_or_create_store(store_type):
     :param str store_type: type of store to get/create.
     """
     store_path = StoreLocationsRecord().get(store_type)
+    _create_store_dir(store_type, store_path)
+    return store_path
+
+
+def _create_store_dir(store_type, store_path):
     mode = 0o700 if store_type == "user" else 0o750
     store_path.mkdir(mode=mode, parents=True, exist_ok=True)
-    return store_path
@@ -3,18 +3,81 @@
 #
 # SPDX-License-Identifier: BSD-3-Clause
 
-"""Creates an enumerated list of strings."""
+"""Creates an enumerated list of devices."""
 
-from collections import UserList
+import bisect
+import ipaddress
+import re
+from collections.abc import Sequence
 
 
-class IndexedTextList(UserList):
-    """List of strings. Numbered according to index."""
+def format_device(dev):
+    """Return a "hostname: address" line for a device."""
+    return "{}: {}".format(dev.hostname, dev.address)
+
+
+def sort_key(dev):
+    """Return a key which orders devices by address, then by hostname.
+
+    IPv4 addresses come first in numerical order, then IPv6 addresses,
+    then anything which isn't an IP address. Numbers in hostnames, IPv6
+    scope IDs and other addresses are compared by value, so
+    "mbed-linux-os-9" comes before "mbed-linux-os-10".
+    """
+    address, _, scope = dev.address.partition("%")
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        address_key = (2, 0, _natural_key(dev.address))
+    else:
+        address_key = (ip.version == 6, int(ip), _natural_key(scope))
+    return (address_key, _natural_key(dev.hostname))
+
+
+def _natural_key(text):
+    """Split text into a list of strings and numbers to compare by value."""
+    return [
+        (1, int(part), "") if part.isdigit() else (0, 0, part)
+        for part in re.split(r"(\d+)", text)
+    ]
+
+
+class IndexedTextList(Sequence):
+    """Devices, sorted by address and numbered from 1 when displayed.
+
+    Devices are kept in order as they are added, and each device's line of
+    text is formatted once, so displaying the list only joins the lines.
+    Index the list to get back the device shown with a number.
+    """
+
+    def __init__(self, devices=()):
+        """:param devices iterable: DeviceInfo objects to add."""
+        self._keys = []
+        self._devices = []
+        self._lines = []
+        for dev in devices:
+            self.append(dev)
+
+    def append(self, dev):
+        """Add a device in its sorted position, return its index."""
+        key = sort_key(dev)
+        index = bisect.bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self._devices.insert(index, dev)
+        self._lines.insert(index, format_device(dev))
+        return index
+
+    def __getitem__(self, index):
+        """Return the device, or a list of devices for a slice."""
+        return self._devices[index]
+
+    def __len__(self):
+        """Return the number of devices."""
+        return len(self._devices)
 
     def __str__(self):
-        """Return all list items as multi-line string."""
-        self.sort(key=lambda x: x.split(": ")[1])
-        output_string = str()
-        for index, item in enumerate(self):
-            output_string += "{}: {}\n".format(index + 1, item)
-        return output_string
+        """Return all the devices as a numbered, multi-line string."""
+        return "".join(
+            "{}: {}\n".format(number, line)
+            for number, line in enumerate(self._lines, 1)
+        )
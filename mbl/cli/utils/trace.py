@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Time the phases of a command with trace spans.
+
+A span records the name, start time and duration of a phase, such as
+opening an SSH connection or making a Pelion API request, using the
+monotonic clock.
+
+Tracing is disabled unless `enable` is called. When it is disabled
+`span` returns a shared span which does nothing, so instrumented code
+only pays for a function call.
+
+Usage:
+
+    with trace.span("ssh.connect", "ssh", address=address) as span:
+        ...
+        span.set(attempts=attempts)
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+# A completed span. Times are in seconds from the monotonic clock.
+Span = namedtuple("Span", "name category start_s duration_s thread args")
+
+# Set by enable(), instrumented code checks this before recording spans.
+ENABLED = False
+
+# Completed spans, in the order they ended.
+SPANS = []
+
+
+def enable():
+    """Start recording spans, discarding any recorded before."""
+    global ENABLED
+    SPANS.clear()
+    ENABLED = True
+
+
+def disable():
+    """Stop recording spans."""
+    global ENABLED
+    ENABLED = False
+
+
+def span(name, category, **args):
+    """Return a context manager which records a span while it is active.
+
+    :param name str: name of the phase, e.g. "ssh.connect".
+    :param category str: group of related phases, e.g. "ssh".
+    :param args: details of the span, must be JSON serialisable.
+    """
+    if not ENABLED:
+        return _DISABLED_SPAN
+    return _ActiveSpan(name, category, args)
+
+
+def add(name, category, start_s, end_s=None, **args):
+    """Record a span which was timed by the caller.
+
+    :param start_s float: start time from time.monotonic().
+    :param end_s float: end time from time.monotonic(), None for now.
+    """
+    if ENABLED:
+        if end_s is None:
+            end_s = time.monotonic()
+        SPANS.append(
+            Span(
+                name,
+                category,
+                start_s,
+                end_s - start_s,
+                threading.get_ident(),
+                args,
+            )
+        )
+
+
+def summary():
+    """Summarise the recorded spans by name.
+
+    :returns list: a (name, count, total_s, max_s) tuple for each name,
+    in the order the names were first started.
+    """
+    totals = dict()
+    for s in sorted(SPANS, key=lambda s: s.start_s):
+        count, total_s, max_s = totals.get(s.name, (0, 0.0, 0.0))
+        totals[s.name] = (
+            count + 1,
+            total_s + s.duration_s,
+            max(max_s, s.duration_s),
+        )
+    return [(name,) + values for name, values in totals.items()]
+
+
+def format_summary():
+    """Return the span summary as a text table."""
+    lines = [
+        "{:<28} {:>6} {:>11} {:>11} {:>11}".format(
+            "Phase", "Count", "Total ms", "Mean ms", "Max ms"
+        )
+    ]
+    for name, count, total_s, max_s in summary():
+        lines.append(
+            "{:<28} {:>6} {:>11.2f} {:>11.2f} {:>11.2f}".format(
+                name, count, total_s * 1e3, total_s / count * 1e3, max_s * 1e3
+            )
+        )
+    return "\n".join(lines)
+
+
+def chrome_trace():
+    """Return the recorded spans in the Chrome trace event format.
+
+    The result can be loaded in chrome://tracing or Perfetto.
+    """
+    origin = min((s.start_s for s in SPANS), default=0.0)
+    pid = os.getpid()
+    events = [
+        dict(
+            name=s.name,
+            cat=s.category,
+            ph="X",
+            ts=(s.start_s - origin) * 1e6,
+            dur=s.duration_s * 1e6,
+            pid=pid,
+            tid=s.thread,
+            args=s.args,
+        )
+        for s in SPANS
+    ]
+    return dict(traceEvents=events, displayTimeUnit="ms")
+
+
+def write_chrome_trace(path):
+    """Write the recorded spans to a Chrome trace JSON file."""
+    # Imported here so commands run without tracing don't import json.
+    import json
+
+    from . import file_handler
+
+    file_handler.to_text_file(path, json.dumps(chrome_trace()))
+
+
+class _ActiveSpan:
+    """Record a span between entering and exiting the context."""
+
+    __slots__ = ("name", "category", "args", "_start_s")
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self._start_s = None
+
+    def __enter__(self):
+        self._start_s = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, *exception_info):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        add(self.name, self.category, self._start_s, **self.args)
+        return False
+
+    def set(self, **args):
+        """Add details to the span."""
+        self.args.update(args)
+
+
+class _DisabledSpan:
+    """Span which records nothing, used when tracing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_info):
+        return False
+
+    def set(self, **args):
+        """Do nothing."""
+
+
+_DISABLED_SPAN = _DisabledSpan()
@@ -5,6 +5,8 @@
 
 """Setuptools entry point."""
 
+import re
+
 from setuptools import setup, find_packages
 
 
@@ -14,6 +16,13 @@ def read(file_name):
         return readme.read()
 
 
+def read_version(file_name):
+    """Read the __version__ string from a python file."""
+    return re.search(
+        r'^__version__ = "(.+)"$', read(file_name), re.MULTILINE
+    ).group(1)
+
+
 def readlines(file_name):
     """Read a file, return the contents as a list."""
     with open(file_name, "r") as txt_file:
@@ -22,7 +31,7 @@ def readlines(file_name):
 
 setup(
     name="mbl-cli",
-    version="2.0.1",
+    version=read_version("mbl/cli/__init__.py"),
     description="Mbed Linux OS Command Line Tool",
     long_description=read("README.md"),
     author="Arm Ltd.",
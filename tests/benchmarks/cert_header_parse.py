@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Benchmark the certificate header parser.
+
+Generate developer certificate headers with byte arrays of increasing
+size and report the median time to parse them with the current parser
+and with the parser used up to mbl-cli 2.0.1.
+
+Usage: python tests/benchmarks/cert_header_parse.py [--runs N] [--json PATH]
+"""
+
+import argparse
+import array
+import json
+import os
+import statistics
+import time
+
+from mbl.cli.utils import cloudapi
+
+ARRAY_SIZES = (1024, 16 * 1024, 256 * 1024)
+MATCH_STR_PRE = "#include <inttypes.h>"
+MATCH_STR_VAR = "MBED_CLOUD_DEV_"
+
+
+def generate_header(array_size):
+    """Generate a certificate header with three arrays of `array_size`."""
+    lines = ["#ifndef __CREDS_H__", "#define __CREDS_H__", MATCH_STR_PRE]
+    lines.append('const char MBED_CLOUD_DEV_ACCOUNT_ID[] = "0123456789";')
+    for name in ("CERTIFICATE", "ROOT_CA_CERTIFICATE", "PRIVATE_KEY"):
+        data = os.urandom(array_size)
+        lines.append("const uint8_t MBED_CLOUD_DEV_{}[] = ".format(name))
+        lines.append("{")
+        for i in range(0, len(data), 16):
+            row = data[i : i + 16]  # noqa: E203
+            lines.append(" " + ", ".join("0x{:02x}".format(b) for b in row))
+            lines[-1] += ","
+        lines[-1] = lines[-1].rstrip(",")
+        lines.append("};")
+        lines.append(
+            "const uint32_t MBED_CLOUD_DEV_{0}_SIZE = "
+            "sizeof(MBED_CLOUD_DEV_{0});".format(name)
+        )
+    lines.append("const uint32_t MBED_CLOUD_DEV_MEMORY_TOTAL_KB = 0;")
+    lines.append("#endif //__CREDS_H__")
+    return "\n".join(lines)
+
+
+def legacy_parse_cert_header(cert_header, match_str_pre, match_str_var):
+    """Parse a certificate header the way mbl-cli 2.0.1 did."""
+    cert_header = cert_header.strip()
+    _, body = cert_header.split(match_str_pre)
+    out_map = dict()
+    for statement in body.split(";"):
+        statement = statement.replace("\n", "")
+        if "=" not in statement:
+            continue
+        var_name_and_type, raw_val = statement.split(" = ")
+        if "sizeof(" in raw_val:
+            continue
+        var_name_begin = var_name_and_type.find(match_str_var)
+        if var_name_begin == -1:
+            raise ValueError("{} var match not found.".format(match_str_var))
+        processed_name = (
+            var_name_and_type[var_name_begin:].replace(r"[]", "").strip()
+        )
+        processed_value = (
+            raw_val.replace(r" '", "")
+            .replace(r'"', "")
+            .replace(" ", "")
+            .strip(r"{} \r")
+        )
+        values = processed_value.split(",")
+        if len(values) > 1:
+            out_val = array.array("B", [int(v, 16) for v in values]).tobytes()
+        else:
+            out_val = values[0].encode()
+        out_map[processed_name] = out_val
+    return out_map
+
+
+def median_time(parse, header, runs):
+    """Return the median time in seconds to parse `header` with `parse`."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        parse(header, MATCH_STR_PRE, MATCH_STR_VAR)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def run(runs):
+    """Time both parsers on each header size, return the results."""
+    results = dict()
+    for size in ARRAY_SIZES:
+        header = generate_header(size)
+        expected = legacy_parse_cert_header(
+            header, MATCH_STR_PRE, MATCH_STR_VAR
+        )
+        actual = cloudapi._parse_cert_header(
+            header, MATCH_STR_PRE, MATCH_STR_VAR
+        )
+        assert actual == expected, "parsers disagree"
+        results[size] = dict(
+            header_bytes=len(header),
+            parse_s=median_time(cloudapi._parse_cert_header, header, runs),
+            legacy_parse_s=median_time(legacy_parse_cert_header, header, runs),
+        )
+    return results
+
+
+def main():
+    """Run the benchmark and print or save the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+    results = run(args.runs)
+    for size, result in results.items():
+        print(
+            "arrays {:>7} B  header {:>9} B  parse {:8.2f} ms  "
+            "legacy {:8.2f} ms".format(
+                size,
+                result["header_bytes"],
+                result["parse_s"] * 1000,
+                result["legacy_parse_s"] * 1000,
+            )
+        )
+    if args.json:
+        with open(args.json, "w") as jfile:
+            json.dump(results, jfile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
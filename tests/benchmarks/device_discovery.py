@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Benchmark device discovery with many services on the network.
+
+Discovery is measured with two sources of `_ssh._tcp` services:
+
+- avahi: synthetic `avahi-browse -p --resolve` output is given to
+  do_discovery in place of running avahi-browse.
+- zeroconf: a responder in a child process advertises the services over
+  mDNS on the loopback interface, and discovery browses for them with
+  zeroconf.
+
+One in `--mbl-every` services has the mblos TXT property. The benchmark
+reports the time to find the first and the last of these devices,
+counted from the start of discovery, and the CPU time used by this
+process during discovery.
+
+Usage: python tests/benchmarks/device_discovery.py [--services N [N ...]]
+           [--source {avahi,zeroconf}] [--mbl-every K] [--json PATH]
+"""
+
+import argparse
+import concurrent.futures
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+from unittest import mock
+
+import zeroconf
+
+from mbl.cli.utils import discovery
+
+SERVICE_COUNTS = (100, 500, 2000)
+SOURCES = ("avahi", "zeroconf")
+MBL_EVERY = 4
+TIMEOUT = 60
+
+
+def _host_name(index, mbl_every):
+    if index % mbl_every == 0:
+        return "mbed-linux-os-{}".format(index)
+    return "host-{}".format(index)
+
+
+def generate_avahi_output(services, mbl_every):
+    """Generate `avahi-browse -p --resolve` output for `services` hosts.
+
+    Like avahi, every service is listed when it is found, then again
+    with an IPv4 and an IPv6 address once it is resolved.
+    """
+    names = [_host_name(i, mbl_every) for i in range(services)]
+    lines = [
+        "+;eth0;IPv4;{};SSH Remote Terminal;local".format(name)
+        for name in names
+    ]
+    for index, name in enumerate(names):
+        prop = '"mblos"' if index % mbl_every == 0 else '"model=generic"'
+        for family, address in (
+            ("IPv4", "10.{}.{}.{}".format(*index.to_bytes(3, "big"))),
+            ("IPv6", "fe80::{:x}".format(index + 1)),
+        ):
+            lines.append(
+                "=;eth0;{};{};SSH Remote Terminal;local;{}.local;{};22;{}"
+                "".format(family, name, name, address, prop)
+            )
+    return "\n".join(lines).encode() + b"\n"
+
+
+class _Found:
+    """Discovery listener which records when devices are found."""
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.times = []
+        self.all_found = threading.Event()
+
+    def __call__(self, message):
+        self.times.append(time.perf_counter())
+        if len(self.times) >= self.expected:
+            self.all_found.set()
+
+    def result(self, start, cpu_start):
+        return dict(
+            devices=self.expected,
+            found=len(self.times),
+            time_to_first_s=self.times[0] - start if self.times else None,
+            time_to_all_s=(
+                self.times[-1] - start
+                if len(self.times) >= self.expected
+                else None
+            ),
+            cpu_s=time.process_time() - cpu_start,
+        )
+
+
+def bench_avahi(services, mbl_every):
+    """Time discovery of devices from avahi-browse output."""
+    raw_output = generate_avahi_output(services, mbl_every)
+    found = _Found(len(range(0, services, mbl_every)))
+    with mock.patch.object(
+        discovery, "_avahi_browse", return_value=raw_output
+    ):
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        discovery.do_discovery(found)
+        result = found.result(start, cpu_start)
+    result.update(services=services)
+    return result
+
+
+def bench_zeroconf(services, mbl_every, timeout):
+    """Time discovery of devices advertised with mDNS by a responder.
+
+    Discovery returns as soon as it has found a device, so the browsers
+    it started are left running to find the remaining devices.
+    """
+    found = _Found(len(range(0, services, mbl_every)))
+    with _responder(services, mbl_every), mock.patch.object(
+        discovery, "_avahi_browse", side_effect=FileNotFoundError
+    ):
+        notifier = discovery.DeviceDiscoveryNotifier()
+        notifier.add_listener(found)
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        with discovery.DeviceGetter() as getter:
+            getter.discover_all(notifier)
+            found.all_found.wait(max(0, start + timeout - time.perf_counter()))
+            result = found.result(start, cpu_start)
+    result.update(services=services)
+    return result
+
+
+class _responder:
+    """Run a zeroconf responder in a child process."""
+
+    def __init__(self, services, mbl_every):
+        self._args = [
+            sys.executable,
+            __file__,
+            "--respond",
+            str(services),
+            "--mbl-every",
+            str(mbl_every),
+        ]
+
+    def __enter__(self):
+        self._proc = subprocess.Popen(
+            self._args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if self._proc.stdout.readline().strip() != "ready":
+            raise RuntimeError("The zeroconf responder failed to start.")
+        return self
+
+    def __exit__(self, *exception_info):
+        self._proc.stdin.close()
+        self._proc.wait()
+        return False
+
+
+def _service_info(index, mbl_every):
+    host = _host_name(index, mbl_every)
+    properties = {b"mblos": b""} if index % mbl_every == 0 else {}
+    properties[b"model"] = b"generic"
+    kwargs = dict(
+        type_=discovery.DeviceGetter.ADDR,
+        name="{}.{}".format(host, discovery.DeviceGetter.ADDR),
+        port=22,
+        properties=properties,
+        server="{}.local.".format(host),
+    )
+    address = socket.inet_aton("127.0.0.1")
+    try:
+        return zeroconf.ServiceInfo(addresses=[address], **kwargs)
+    except TypeError:
+        # zeroconf before 0.23 takes a single address.
+        return zeroconf.ServiceInfo(address=address, **kwargs)
+
+
+def respond(services, mbl_every):
+    """Advertise services until stdin is closed."""
+    zconf = zeroconf.Zeroconf(interfaces=["127.0.0.1"])
+    infos = [_service_info(i, mbl_every) for i in range(services)]
+    # Registering a service waits for the name to be probed, so register
+    # the services concurrently.
+    with concurrent.futures.ThreadPoolExecutor(256) as pool:
+        list(pool.map(zconf.register_service, infos))
+    print("ready", flush=True)
+    sys.stdin.read()
+    zconf.close()
+
+
+def run(service_counts, sources, mbl_every, timeout):
+    """Run the benchmarks, return the results."""
+    results = dict()
+    for source in sources:
+        results[source] = dict()
+        for services in service_counts:
+            if source == "avahi":
+                result = bench_avahi(services, mbl_every)
+            else:
+                result = bench_zeroconf(services, mbl_every, timeout)
+            results[source][str(services)] = result
+    return results
+
+
+def _format_s(seconds):
+    return "{:9.3f} s".format(seconds) if seconds is not None else "      - s"
+
+
+def main():
+    """Run the benchmarks and print or save the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--services", type=int, nargs="+", default=SERVICE_COUNTS
+    )
+    parser.add_argument(
+        "--source", choices=SOURCES, action="append", dest="sources"
+    )
+    parser.add_argument("--mbl-every", type=int, default=MBL_EVERY)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT)
+    parser.add_argument("--respond", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+    if args.respond is not None:
+        respond(args.respond, args.mbl_every)
+        return
+    results = run(
+        args.services, args.sources or SOURCES, args.mbl_every, args.timeout
+    )
+    for source, source_results in results.items():
+        for services, result in source_results.items():
+            print(
+                "{:<8} {:>5} services {:>5}/{:<5} found first {} all {} "
+                "cpu {}".format(
+                    source,
+                    services,
+                    result["found"],
+                    result["devices"],
+                    _format_s(result["time_to_first_s"]),
+                    _format_s(result["time_to_all_s"]),
+                    _format_s(result["cpu_s"]),
+                )
+            )
+    if args.json:
+        with open(args.json, "w") as jfile:
+            json.dump(results, jfile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
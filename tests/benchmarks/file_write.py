@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Benchmark small safe file writes.
+
+Write a small JSON config file many times with the atomic write used by
+file_handler and with the copy-modify-move write used up to mbl-cli
+2.0.1, and report the median time per write. The atomic write is also
+timed with fsync disabled, to separate the cost of the syscalls saved
+from the cost of flushing to disk, which the old write didn't do.
+
+Usage: python tests/benchmarks/file_write.py [--writes N] [--dir DIR]
+                                             [--json PATH]
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import shutil
+import statistics
+import tempfile
+import time
+from unittest import mock
+
+from mbl.cli.utils import file_handler
+
+DATA = json.dumps(dict(location="/home/user/.mbl-store/user", api_key="x"))
+
+
+def legacy_write_with_copy_modify_move(file_path, data, mode="w"):
+    """Write a file the way mbl-cli 2.0.1 did."""
+    file_path.touch(exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=str(file_path.parent))
+    try:
+        dst_path = shutil.copy2(str(file_path), tmp_dir)
+        with open(dst_path, mode) as dfile:
+            dfile.write(data)
+        shutil.move(dst_path, str(file_path))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def time_writes(write, directory, writes):
+    """Write a file `writes` times, return the median time per write."""
+    path = pathlib.Path(directory, "config.json")
+    samples = []
+    for _ in range(writes):
+        start = time.perf_counter()
+        write(path, DATA)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def run(writes, directory):
+    """Time the write functions, return the results."""
+    results = dict()
+    for name, write, fsync in (
+        ("atomic", file_handler._write_atomically, os.fsync),
+        ("atomic_without_fsync", file_handler._write_atomically, _no_fsync),
+        (
+            "legacy_copy_modify_move",
+            legacy_write_with_copy_modify_move,
+            os.fsync,
+        ),
+    ):
+        with tempfile.TemporaryDirectory(dir=directory) as tmp_dir:
+            with mock.patch.object(file_handler.os, "fsync", fsync):
+                write_s = time_writes(write, tmp_dir, writes)
+        results[name] = dict(write_s=write_s, writes=writes)
+    return results
+
+
+def _no_fsync(fd):
+    pass
+
+
+def main():
+    """Run the benchmark and print or save the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writes", type=int, default=1000)
+    parser.add_argument(
+        "--dir", help="Directory to write in, the file system matters."
+    )
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+    results = run(args.writes, args.dir)
+    for name, result in results.items():
+        print("{:<25} {:8.1f} us/write".format(name, result["write_s"] * 1e6))
+    if args.json:
+        with open(args.json, "w") as jfile:
+            json.dump(results, jfile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Benchmark the start up time of mbl-cli commands.
+
+Run each command in a fresh interpreter with `-X importtime` and report
+the median wall clock time, the median cumulative import time of the
+mbl.cli modules, and the slowest imports.
+
+Usage: python tests/benchmarks/import_time.py [--runs N] [--json PATH]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+COMMANDS = (["--version"], ["which"], ["list", "--help"], ["shell", "--help"])
+
+
+def measure(argv, home):
+    """Run a command once, return (wall time, {module: cumulative us})."""
+    code = (
+        "import sys; from mbl.cli import mbl_cli; "
+        "sys.argv = {!r}; mbl_cli._main()".format(["mbl-cli"] + argv)
+    )
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env={"HOME": home, "PATH": ""},
+    )
+    wall_time = time.perf_counter() - start
+    imports = dict()
+    for line in proc.stderr.decode().splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split(":", 1)[1].split("|")
+        if cumulative.strip().isdigit():
+            imports[name.strip()] = int(cumulative)
+    return wall_time, imports
+
+
+def run(runs):
+    """Measure each command `runs` times, return the results."""
+    results = dict()
+    with tempfile.TemporaryDirectory() as home:
+        for argv in COMMANDS:
+            samples = [measure(argv, home) for _ in range(runs)]
+            mbl_imports = [
+                imports.get("mbl.cli.mbl_cli", 0) for _, imports in samples
+            ]
+            slowest = sorted(
+                samples[-1][1].items(), key=lambda i: i[1], reverse=True
+            )
+            results[" ".join(argv)] = dict(
+                wall_time_s=statistics.median(s[0] for s in samples),
+                mbl_import_us=statistics.median(mbl_imports),
+                slowest_imports=slowest[:10],
+            )
+    return results
+
+
+def main():
+    """Run the benchmark and print or save the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+    results = run(args.runs)
+    for cmd, result in results.items():
+        print(
+            "mbl-cli {:<15} wall {:7.1f} ms  mbl imports {:7.1f} ms".format(
+                cmd,
+                result["wall_time_s"] * 1000,
+                result["mbl_import_us"] / 1000,
+            )
+        )
+    if args.json:
+        with open(args.json, "w") as jfile:
+            json.dump(results, jfile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
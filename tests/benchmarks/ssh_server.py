@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""A local SSH server standing in for a device in benchmarks.
+
+The server is built on paramiko. It accepts any user without
+authentication, like an MBL development image, and runs exec requests
+and shells as local `sh` subprocesses, so scp works using the local scp
+binary.
+
+Usage:
+
+    with LocalSSHServer() as server:
+        with ssh.SSHSession(device, port=server.port) as session:
+            ...
+"""
+
+import socket
+import subprocess
+import threading
+
+import paramiko
+
+_HOST_KEY = None
+_HOST_KEY_LOCK = threading.Lock()
+
+
+def _host_key():
+    """Generate the server's host key once per process."""
+    global _HOST_KEY
+    with _HOST_KEY_LOCK:
+        if _HOST_KEY is None:
+            _HOST_KEY = paramiko.RSAKey.generate(2048)
+        return _HOST_KEY
+
+
+class LocalSSHServer:
+    """SSH server on a free localhost port, serving in background threads."""
+
+    def __init__(self, cwd=None):
+        """:param cwd str: working directory of the commands run."""
+        self.cwd = cwd
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self.port = self._sock.getsockname()[1]
+        self._transports = []
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        """Start serving."""
+        self._sock.listen(64)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exception_info):
+        """Stop serving and close all connections."""
+        self._sock.close()
+        for transport in self._transports:
+            transport.close()
+        return False
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(_host_key())
+            self._transports.append(transport)
+            try:
+                transport.start_server(server=_ServerInterface(self.cwd))
+            except (paramiko.SSHException, EOFError):
+                transport.close()
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    """Allow sessions without authentication, run commands locally."""
+
+    def __init__(self, cwd):
+        self._cwd = cwd
+
+    def get_allowed_auths(self, username):
+        return "none,password"
+
+    def check_auth_none(self, username):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        _start_process(channel, ["sh"], self._cwd)
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        _start_process(channel, ["sh", "-c", command.decode()], self._cwd)
+        return True
+
+
+def _start_process(channel, argv, cwd):
+    """Run a process with its stdio connected to an SSH channel."""
+    proc = subprocess.Popen(
+        argv,
+        cwd=cwd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    def pump_stdin():
+        while True:
+            data = channel.recv(65536)
+            if not data:
+                break
+            try:
+                proc.stdin.write(data)
+                proc.stdin.flush()
+            except BrokenPipeError:
+                break
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    def pump_output(stream, send):
+        while True:
+            data = stream.read1(65536)
+            if not data:
+                break
+            send(data)
+
+    def wait():
+        stderr_pump.join()
+        stdout_pump.join()
+        # Leave closing the channel to the client. If the server closes it
+        # before paramiko has replied to the exec request the client sees
+        # the request fail.
+        channel.shutdown_write()
+        channel.send_exit_status(proc.wait())
+
+    threading.Thread(target=pump_stdin, daemon=True).start()
+    stdout_pump = threading.Thread(
+        target=pump_output, args=(proc.stdout, channel.sendall), daemon=True
+    )
+    stderr_pump = threading.Thread(
+        target=pump_output,
+        args=(proc.stderr, channel.sendall_stderr),
+        daemon=True,
+    )
+    stdout_pump.start()
+    stderr_pump.start()
+    threading.Thread(target=wait, daemon=True).start()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Benchmark SSH sessions against a local SSH server.
+
+Start a paramiko SSH server on localhost (see ssh_server.py) standing in
+for a device, and measure:
+
+- connect: time to connect and authenticate an SSHSession.
+- run_cmd: round trip time of running `true` with run_cmd.
+- run_batch: time per command of a batch of `true` commands.
+- put/get: scp throughput for a few distributions of file sizes, sent
+  as a directory with `recursive`.
+- shell: output throughput of an interactive shell.
+
+Loopback has no latency, so the results show the CPU cost of the client
+and server, not what a device on a network will achieve.
+
+Usage: python tests/benchmarks/ssh_session.py [--runs N] [--json PATH]
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import shutil
+import statistics
+import tempfile
+import time
+
+from mbl.cli.utils import device, ssh
+from ssh_server import LocalSSHServer
+
+# (name, number of files, size of each file in bytes)
+FILE_DISTRIBUTIONS = (
+    ("100x1KiB", 100, 1024),
+    ("20x64KiB", 20, 64 * 1024),
+    ("1x8MiB", 1, 8 * 1024 * 1024),
+)
+SHELL_OUTPUT_BYTES = 16 * 1024 * 1024
+BATCH_SIZE = 50
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return dict(
+        median_s=statistics.median(samples),
+        p95_s=samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        runs=len(samples),
+    )
+
+
+def _time(func, runs, setup=None):
+    samples = []
+    for _ in range(runs):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_connect(dev, port, runs):
+    """Time connecting and authenticating a session."""
+
+    def connect():
+        with ssh.SSHSession(dev, port=port):
+            pass
+
+    return _summary(_time(connect, runs))
+
+
+def bench_run_cmd(session, runs):
+    """Time run_cmd round trips."""
+
+    def run_cmd():
+        _, stdout, _ = session.run_cmd("true")
+        stdout.channel.recv_exit_status()
+
+    return _summary(_time(run_cmd, runs))
+
+
+def bench_run_batch(session, runs):
+    """Time a batch of commands, per command."""
+    samples = _time(lambda: session.run_batch(["true"] * BATCH_SIZE), runs)
+    result = _summary([s / BATCH_SIZE for s in samples])
+    result["batch_size"] = BATCH_SIZE
+    return result
+
+
+def bench_transfers(session, work_dir, runs):
+    """Time put and get of each file distribution."""
+    results = dict()
+    for name, count, size in FILE_DISTRIBUTIONS:
+        src = pathlib.Path(work_dir, "src", name)
+        src.mkdir(parents=True)
+        for index in range(count):
+            src.joinpath("file{}".format(index)).write_bytes(os.urandom(size))
+        remote = pathlib.Path(work_dir, "remote", name)
+        fetched = pathlib.Path(work_dir, "fetched", name)
+        remote.parent.mkdir(exist_ok=True)
+        fetched.parent.mkdir(exist_ok=True)
+
+        def put():
+            session.put(
+                local_path=str(src), remote_path=str(remote), recursive=True
+            )
+
+        def get():
+            session.get(
+                remote_path=str(remote),
+                local_path=str(fetched),
+                recursive=True,
+            )
+
+        # Copy to a new directory each run, rather than into the copy made
+        # by the previous run.
+        put_s = _time(put, runs, setup=lambda: _remove_tree(remote))
+        get_s = _time(get, runs, setup=lambda: _remove_tree(fetched))
+        total = count * size
+        for direction, samples in (("put", put_s), ("get", get_s)):
+            result = _summary(samples)
+            result.update(
+                files=count,
+                bytes=total,
+                mib_per_s=total / result["median_s"] / 2 ** 20,
+            )
+            results["{}_{}".format(direction, name)] = result
+    return results
+
+
+def _remove_tree(path):
+    shutil.rmtree(str(path), ignore_errors=True)
+
+
+def bench_shell(session, runs):
+    """Time reading a large amount of output from an interactive shell."""
+
+    def read_output():
+        channel = session._client.invoke_shell()
+        channel.sendall(
+            "head -c {} /dev/zero; exit\n".format(SHELL_OUTPUT_BYTES)
+        )
+        received = 0
+        while True:
+            data = channel.recv(65536)
+            if not data:
+                break
+            received += len(data)
+        channel.close()
+        if received < SHELL_OUTPUT_BYTES:
+            raise RuntimeError("Shell output was truncated.")
+
+    result = _summary(_time(read_output, runs))
+    result.update(
+        bytes=SHELL_OUTPUT_BYTES,
+        mib_per_s=SHELL_OUTPUT_BYTES / result["median_s"] / 2 ** 20,
+    )
+    return result
+
+
+def run(runs):
+    """Run all SSH benchmarks, return the results."""
+    ssh.SUPPRESS_PROGRESS = True
+    dev = device.create_device("localhost", "127.0.0.1")
+    results = dict()
+    with tempfile.TemporaryDirectory() as work_dir:
+        with LocalSSHServer(cwd=work_dir) as server:
+            results["connect"] = bench_connect(dev, server.port, runs)
+            with ssh.SSHSession(dev, port=server.port) as session:
+                results["run_cmd"] = bench_run_cmd(session, runs)
+                results["run_batch"] = bench_run_batch(session, runs)
+                results.update(bench_transfers(session, work_dir, runs))
+                results["shell"] = bench_shell(session, runs)
+    return results
+
+
+def main():
+    """Run the benchmarks and print or save the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+    results = run(args.runs)
+    for name, result in results.items():
+        line = "{:<16} {:9.2f} ms median {:9.2f} ms p95".format(
+            name, result["median_s"] * 1e3, result["p95_s"] * 1e3
+        )
+        if "mib_per_s" in result:
+            line += " {:8.1f} MiB/s".format(result["mib_per_s"])
+        print(line)
+    if args.json:
+        with open(args.json, "w") as jfile:
+            json.dump(results, jfile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
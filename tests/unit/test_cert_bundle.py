@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+
+"""Tests for certificate bundles."""
+
+import hashlib
+import io
+import subprocess
+import tarfile
+
+import pytest
+
+from mbl.cli.utils import cert_bundle
+
+CERTIFICATE = {
+    "MBED_CLOUD_DEV_ACCOUNT_ID": b"000000",
+    "MBED_CLOUD_DEV_BOOTSTRAP_DEVICE_PRIVATE_KEY": bytes(range(256)),
+    "arm_uc_vendor_id": b"",
+}
+
+
+class TestCertBundle:
+    def test_pack_unpack_round_trip(self):
+        bundle = cert_bundle.pack(CERTIFICATE)
+        assert cert_bundle.unpack(bundle) == CERTIFICATE
+
+    def test_pack_is_reproducible(self):
+        assert cert_bundle.pack(CERTIFICATE) == cert_bundle.pack(
+            dict(reversed(list(CERTIFICATE.items())))
+        )
+
+    def test_manifest_is_first_member(self):
+        bundle = cert_bundle.pack(CERTIFICATE)
+        with tarfile.open(fileobj=io.BytesIO(bundle)) as tar:
+            names = tar.getnames()
+        assert names[:2] == [
+            cert_bundle.MANIFEST_NAME,
+            cert_bundle.CHECKSUMS_NAME,
+        ]
+        assert sorted(names[2:]) == sorted(
+            "{}.bin".format(field) for field in CERTIFICATE
+        )
+
+    def test_corrupt_bundle_raises(self):
+        data = CERTIFICATE["MBED_CLOUD_DEV_BOOTSTRAP_DEVICE_PRIVATE_KEY"]
+        bundle = cert_bundle.pack(CERTIFICATE).replace(data, data[::-1])
+        with pytest.raises(ValueError, match="checksum"):
+            cert_bundle.unpack(bundle)
+
+    def test_invalid_bundle_raises(self):
+        with pytest.raises(ValueError):
+            cert_bundle.unpack(b"not a bundle")
+
+    def test_write_read(self, tmp_path):
+        path = tmp_path / ("cert" + cert_bundle.SUFFIX)
+        cert_bundle.write(path, CERTIFICATE)
+        assert cert_bundle.is_bundle(path)
+        assert cert_bundle.read(path) == CERTIFICATE
+
+    def test_checksums_verify_with_sha256sum(self, tmp_path):
+        with tarfile.open(
+            fileobj=io.BytesIO(cert_bundle.pack(CERTIFICATE))
+        ) as tar:
+            tar.extractall(str(tmp_path))
+        try:
+            subprocess.check_call(
+                ["sha256sum", "-c", cert_bundle.CHECKSUMS_NAME],
+                cwd=str(tmp_path),
+                stdout=subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            pytest.skip("sha256sum is not available.")
+        key_path = tmp_path / "MBED_CLOUD_DEV_ACCOUNT_ID.bin"
+        assert hashlib.sha256(key_path.read_bytes()).digest() == (
+            hashlib.sha256(b"000000").digest()
+        )
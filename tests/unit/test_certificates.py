@@ -5,6 +5,7 @@
 
 """Tests for Pelion certificate management."""
 import pathlib
+import time
 import pytest
 
 from unittest import mock
@@ -17,8 +18,10 @@ INVALID_CERT_NAMES = ["blah", "invalid", "name"]
 SRC_PATH = pathlib.Path(__file__).parent.absolute()
 
 
-class CertID:
-    id = "1"
+class CertSummary:
+    def __init__(self, name):
+        self.id = "id-{}".format(name)
+        self.name = name
 
 
 class CertData:
@@ -27,6 +30,7 @@ class CertData:
             SRC_PATH / "mbed_cloud_dev_credentials.c"
         ).read_text()
         self.name = name
+        self.id = "id-{}".format(name)
 
 
 @pytest.fixture
@@ -34,29 +38,55 @@ def _mock_cert_api():
     with mock.patch(
         "mbl.cli.utils.cloudapi.CertificatesAPI", autospec=True
     ) as cert_api:
-        cert_api.return_value.list_certificates.return_value = [
-            CertID() for c in VALID_CERT_NAMES
-        ]
+        cert_api.return_value.api_clients = dict()
+        cert_api.return_value.list_certificates.side_effect = _list_certs
+        cert_api.return_value.get_certificate.side_effect = lambda cert_id: (
+            CertData(cert_id.replace("id-", "", 1))
+        )
         yield cert_api()
+    cloudapi.close_clients()
+
+
+def _list_certs(filter=None, **kwargs):
+    """Mock CertificatesAPI.list_certificates with name filtering."""
+    return [
+        CertSummary(name)
+        for name in VALID_CERT_NAMES
+        if not filter or filter["name"] == name
+    ]
 
 
 class TestDeveloperCertificates:
     @pytest.mark.parametrize("name", VALID_CERT_NAMES)
     def test_get_dev_credentials(self, name, _mock_cert_api):
-        _mock_cert_api.get_certificate.return_value = CertData(name)
         dev_creds = cloudapi.DevCredentialsAPI("")
         assert isinstance(dev_creds.get_dev_credentials(name), dict)
+        # Only the matching certificate's details are fetched.
+        _mock_cert_api.get_certificate.assert_called_once_with(
+            "id-{}".format(name)
+        )
 
     @pytest.mark.parametrize("name", INVALID_CERT_NAMES)
     def test_get_dev_credentials_invalid_cert_names(
         self, name, _mock_cert_api
     ):
         dev_creds = cloudapi.DevCredentialsAPI("")
-        _mock_cert_api.get_certificate.return_value = CertData(
-            VALID_CERT_NAMES[0]
-        )
         with pytest.raises(ValueError):
             dev_creds.get_dev_credentials(name)
+        assert not _mock_cert_api.get_certificate.called
+
+    def test_existing_cert_names_uses_list_results(self, _mock_cert_api):
+        dev_creds = cloudapi.DevCredentialsAPI("")
+        assert dev_creds.existing_cert_names == VALID_CERT_NAMES
+        assert _mock_cert_api.list_certificates.call_count == 1
+        assert not _mock_cert_api.get_certificate.called
+
+    def test_delete_developer_certificate(self, _mock_cert_api):
+        dev_creds = cloudapi.DevCredentialsAPI("")
+        dev_creds.delete_developer_certificate(VALID_CERT_NAMES[1])
+        _mock_cert_api.delete_certificate.assert_called_once_with(
+            "id-{}".format(VALID_CERT_NAMES[1])
+        )
 
     def test_create_dev_credentials(self, _mock_cert_api):
         _mock_cert_api.add_developer_certificate.return_value = CertData(
@@ -66,3 +96,177 @@ class TestDeveloperCertificates:
         dev_creds = cloudapi.DevCredentialsAPI("")
         crt = dev_creds.create_dev_credentials("test_cert")
         assert isinstance(crt, dict)
+
+
+class TestSharedClients:
+    @pytest.fixture(autouse=True)
+    def _close_clients(self):
+        yield
+        cloudapi.close_clients()
+
+    def test_client_reused_per_api_key(self):
+        client = cloudapi.get_client(cloudapi.CertificatesAPI, "key")
+        assert cloudapi.get_client(cloudapi.CertificatesAPI, "key") is client
+        assert (
+            cloudapi.get_client(cloudapi.CertificatesAPI, "other key")
+            is not client
+        )
+
+    def test_connection_pool_shared_between_clients(self):
+        pool_managers = {
+            id(api_client.rest_client.pool_manager)
+            for api_class in (
+                cloudapi.CertificatesAPI,
+                cloudapi.AccountManagementAPI,
+            )
+            for api_client in cloudapi.get_client(
+                api_class, "key"
+            ).api_clients.values()
+        }
+        assert len(pool_managers) == 1
+
+    def test_request_timing_recorded(self):
+        client = cloudapi.get_client(cloudapi.CertificatesAPI, "key")
+        api_client = next(iter(client.api_clients.values()))
+        session = api_client.rest_client.pool_manager
+        with mock.patch.object(session, "_pool_manager") as pool_manager:
+            pool_manager.request.return_value.status = 200
+            session.request("GET", "https://example.com/v3/x")
+        timing = cloudapi.REQUEST_TIMINGS[-1]
+        assert timing.method == "GET"
+        assert timing.status == 200
+        assert timing.duration_s >= 0
+
+
+class FakeUserStore:
+    def __init__(self):
+        self.pelion_cert_cache = dict()
+        self.save = mock.MagicMock()
+
+
+class TestCertificateCache:
+    @pytest.fixture
+    def cache(self):
+        yield cloudapi.CertificateCache(FakeUserStore(), "key")
+
+    def test_listing_is_reused(self, cache, _mock_cert_api):
+        dev_creds = cloudapi.DevCredentialsAPI("key", cache=cache)
+        assert dev_creds.existing_cert_names == VALID_CERT_NAMES
+        assert dev_creds.existing_cert_names == VALID_CERT_NAMES
+        assert _mock_cert_api.list_certificates.call_count == 1
+
+    def test_cached_id_used_to_get_certificate(self, cache, _mock_cert_api):
+        dev_creds = cloudapi.DevCredentialsAPI("key", cache=cache)
+        dev_creds.existing_cert_names
+        dev_creds.get_dev_credentials(VALID_CERT_NAMES[0])
+        assert _mock_cert_api.list_certificates.call_count == 1
+        assert cache.get(VALID_CERT_NAMES[0])["header_sha256"]
+
+    def test_stale_cache_is_revalidated(self, cache, _mock_cert_api):
+        dev_creds = cloudapi.DevCredentialsAPI("key", cache=cache)
+        dev_creds.existing_cert_names
+        with mock.patch.object(
+            cloudapi.time, "time", return_value=time.time() + cache.TTL_S
+        ):
+            dev_creds.existing_cert_names
+        assert _mock_cert_api.list_certificates.call_count == 2
+
+    def test_delete_removes_entry(self, cache, _mock_cert_api):
+        dev_creds = cloudapi.DevCredentialsAPI("key", cache=cache)
+        dev_creds.existing_cert_names
+        dev_creds.delete_developer_certificate(VALID_CERT_NAMES[0])
+        assert VALID_CERT_NAMES[0] not in dev_creds.existing_cert_names
+
+    def test_delete_with_stale_cached_id(self, cache, _mock_cert_api):
+        dev_creds = cloudapi.DevCredentialsAPI("key", cache=cache)
+        dev_creds.existing_cert_names
+        cache.get(VALID_CERT_NAMES[0])["id"] = "id-old"
+
+        def _delete(cert_id):
+            if cert_id == "id-old":
+                raise cloudapi.CloudApiException("gone", status=404)
+
+        _mock_cert_api.delete_certificate.side_effect = _delete
+        dev_creds.delete_developer_certificate(VALID_CERT_NAMES[0])
+        _mock_cert_api.delete_certificate.assert_called_with(
+            "id-" + VALID_CERT_NAMES[0]
+        )
+        assert cache.get(VALID_CERT_NAMES[0]) is None
+
+    def test_failed_delete_keeps_entry(self, cache, _mock_cert_api):
+        dev_creds = cloudapi.DevCredentialsAPI("key", cache=cache)
+        dev_creds.existing_cert_names
+        _mock_cert_api.delete_certificate.side_effect = (
+            cloudapi.CloudApiException("denied", status=403)
+        )
+        with pytest.raises(cloudapi.CloudApiException):
+            dev_creds.delete_developer_certificate(VALID_CERT_NAMES[0])
+        assert cache.get(VALID_CERT_NAMES[0]) is not None
+
+    def test_cache_reset_for_new_api_key(self, _mock_cert_api):
+        user_store = FakeUserStore()
+        cache = cloudapi.CertificateCache(user_store, "key")
+        cloudapi.DevCredentialsAPI("key", cache=cache).existing_cert_names
+        other_cache = cloudapi.CertificateCache(user_store, "other key")
+        assert not other_cache.fresh
+        assert other_cache.names == []
+
+
+class TestParseCertHeader:
+    def test_parse_dev_credentials(self):
+        creds = cloudapi._parse_cert_header(
+            CertData("cert").header_file,
+            "#include <inttypes.h>",
+            "MBED_CLOUD_DEV_",
+        )
+        assert creds["MBED_CLOUD_DEV_ACCOUNT_ID"] == b"000000"
+        assert creds["MBED_CLOUD_DEV_MEMORY_TOTAL_KB"] == b"0"
+        assert creds["MBED_CLOUD_DEV_BOOTSTRAP_DEVICE_PRIVATE_KEY"] == bytes(8)
+        assert "MBED_CLOUD_DEV_BOOTSTRAP_DEVICE_CERTIFICATE_SIZE" not in creds
+
+    def test_comments_and_preprocessor_lines_ignored(self):
+        header = "\n".join(
+            [
+                "#include <stdint.h>",
+                "#ifdef MBED_CLOUD_DEV_UPDATE_ID",
+                "const uint8_t arm_uc_vendor_id[] = {",
+                "    0x01, 0xAB, // 0xff;",
+                "    0x7f /* 0xff */",
+                "};",
+                "/* const uint8_t arm_uc_old[] = { 0x00 }; */",
+                'const char arm_uc_url[] = "http://example.com";',
+                "#endif",
+                "#include <stdint.h>",
+                "const uint8_t arm_uc_empty[] = {};",
+            ]
+        )
+        creds = cloudapi._parse_cert_header(
+            header, "#include <stdint.h>", "arm_uc_"
+        )
+        assert creds == {
+            "arm_uc_vendor_id": b"\x01\xab\x7f",
+            "arm_uc_url": b"http://example.com",
+            "arm_uc_empty": b"",
+        }
+
+    def test_mixed_width_values(self):
+        creds = cloudapi._parse_cert_header(
+            "#include <stdint.h>\nconst uint8_t arm_uc_x[] = {0x1, 0x02, 3};",
+            "#include <stdint.h>",
+            "arm_uc_",
+        )
+        assert creds == {"arm_uc_x": b"\x01\x02\x03"}
+
+    def test_missing_include_raises(self):
+        with pytest.raises(ValueError):
+            cloudapi._parse_cert_header(
+                "const char arm_uc_x[] = 1;", "#include <stdint.h>", "arm_uc_"
+            )
+
+    def test_unexpected_variable_name_raises(self):
+        with pytest.raises(ValueError):
+            cloudapi._parse_cert_header(
+                "#include <stdint.h>\nconst char other[] = 1;",
+                "#include <stdint.h>",
+                "arm_uc_",
+            )
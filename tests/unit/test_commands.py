@@ -8,6 +8,10 @@
 
 from unittest import mock
 
+import json
+import threading
+import time
+
 import pytest
 
 from mbl.cli.actions import (
@@ -17,7 +21,19 @@ from mbl.cli.actions import (
     select_action,
     shell_action,
 )
-from mbl.cli.utils import device
+from mbl.cli.utils import completion, device, inventory, output, ssh
+from mbl.cli.utils import discovery as discovery_module
+
+
+@pytest.fixture(autouse=True)
+def completion_index(tmp_path):
+    """Keep the completion index and inventory out of the home directory."""
+    with mock.patch.object(
+        completion, "INDEX_FILE_PATH", tmp_path / "completion.json"
+    ), mock.patch.object(
+        inventory, "INVENTORY_FILE_PATH", tmp_path / "inventory.json"
+    ):
+        yield
 
 
 @pytest.fixture
@@ -60,8 +76,12 @@ class Args:
     dst_path = ""
     recursive = False
     cmd = ""
+    script = None
+    jobs = 1
     quiet = False
     config_hostname = "*"
+    group = None
+    live = False
 
 
 class TestListCommand:
@@ -70,40 +90,92 @@ class TestListCommand:
     def test_list_command_produces_text_list(self, discovery):
         """Check a text list is produced and formatted correctly."""
         text_list = list_action.execute(Args())
-        assert text_list == [
-            r"mbed-linux-os-9999: fe80::d079:8191:9140:c56%eth3"
+        assert list(text_list) == [
+            device.create_device(
+                "mbed-linux-os-9999", "fe80::d079:8191:9140:c56%eth3"
+            )
+        ]
+        assert str(text_list) == (
+            "1: mbed-linux-os-9999: fe80::d079:8191:9140:c56%eth3\n"
+        )
+
+    def test_live_list_shows_devices_as_found(self, discovery, capsys):
+        """Check devices are shown when found, and until the timeout."""
+        args = Args()
+        args.live = True
+        with mock.patch.object(discovery_module, "TIMEOUT", 0.1):
+            devices = list_action.execute(args)
+        assert len(devices) == 1
+        assert capsys.readouterr().out.splitlines()[1:] == [
+            "1: mbed-linux-os-9999: fe80::d079:8191:9140:c56%eth3"
         ]
 
 
+class TestJsonOutput:
+    """Test commands emit JSON records when the output format is json."""
+
+    @pytest.fixture
+    def json_output(self):
+        """Set the output format to json for the duration of a test."""
+        with mock.patch.object(output, "FORMAT", output.JSON):
+            yield
+
+    def test_list_emits_device_records(self, discovery, json_output, capsys):
+        """Test a record is written for each discovered device."""
+        list_action.execute(Args())
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 1
+        record = json.loads(lines[0])
+        assert record["type"] == "device"
+        assert record["hostname"] == "mbed-linux-os-9999"
+        assert record["address"] == "fe80::d079:8191:9140:c56%eth3"
+        assert "elapsed_s" in record
+
+    def test_shell_emits_command_record(self, mock_ssh, json_output, capsys):
+        """Test a single command is run as a batch and reported as JSON."""
+        _ssh, _scp = mock_ssh
+        _ssh.run_batch.return_value = [
+            ssh.CommandResult("whoami", 0, "root\n", "")
+        ]
+        args = Args()
+        args.address = "168.254.56.92"
+        args.cmd = "whoami"
+        shell_action.execute(args)
+        record = json.loads(capsys.readouterr().out)
+        assert record["type"] == "command"
+        assert record["stdout"] == "root\n"
+        assert record["exit_code"] == 0
+
+
 class TestSelectCommand:
     """Select cmd tests."""
 
     @pytest.fixture
     def mock_input(self):
-        """Mock the input() builtin."""
+        """Mock input() to answer once discovery has found a device."""
+        found = threading.Event()
+        show_device = list_action.LiveList.__call__
+
+        def _show_device(live_list, dev):
+            show_device(live_list, dev)
+            found.set()
+
         input_mock = mock.MagicMock(spec=input)
+        input_mock.side_effect = lambda prompt: (
+            found.wait(5) and input_mock.answer
+        )
         with mock.patch.object(
+            list_action.LiveList, "__call__", _show_device
+        ), mock.patch.object(
             select_action, "input", input_mock, create=True
         ) as _mock_input:
             yield _mock_input
 
-    @pytest.fixture
-    def mock_list(self):
-        """Mock the list command function."""
-        list_mock = mock.MagicMock()
-        with mock.patch.object(
-            select_action, "list_action", list_mock, create=True
-        ) as _mock_list:
-            yield _mock_list
-
     def test_select_saves_device(
-        self, save_dev_info_mock, mock_input, mock_list
+        self, discovery, save_dev_info_mock, mock_input
     ):
         """Test save_device_info called with correct args."""
-        mock_list.execute.return_value = [
-            r"mbed-linux-os-9999: fe80::d079:8191:9140:c56%eth3"
-        ]
-        mock_input.return_value = "1"
+        mock_input.answer = "1"
         select_action.execute(Args())
         save_dev_info_mock.assert_called_once_with(
             device.create_device(
@@ -111,16 +183,44 @@ class TestSelectCommand:
             )
         )
 
+    def test_select_before_discovery_finishes(
+        self, discovery, save_dev_info_mock, mock_input
+    ):
+        """Test a device can be selected while discovery is running."""
+        mock_input.answer = "1"
+        with mock.patch.object(discovery_module, "TIMEOUT", 600):
+            start_time = time.monotonic()
+            select_action.execute(Args())
+        assert time.monotonic() - start_time < 60
+        assert save_dev_info_mock.called
+
+    def test_select_reports_no_devices(self, discovery):
+        """Test the user is told when discovery ends without devices."""
+        discovery.return_value = b""
+        told = threading.Event()
+        input_mock = mock.MagicMock(spec=input)
+        input_mock.side_effect = lambda prompt: told.wait(5) and ""
+        with mock.patch.object(
+            discovery_module, "TIMEOUT", 0.1
+        ), mock.patch.object(
+            select_action, "input", input_mock, create=True
+        ), mock.patch.object(
+            select_action.output, "echo"
+        ) as echo:
+            echo.side_effect = (
+                lambda text: "Press Enter" in text and told.set()
+            )
+            with pytest.raises(IOError):
+                select_action.execute(Args())
+        echo.assert_called_with("No devices found! Press Enter to exit.")
+
     @pytest.mark.parametrize("input_val", ["0", "a", "-1", "2"])
     def test_select_raises_on_invalid_input(
-        self, save_dev_info_mock, mock_input, mock_list, input_val
+        self, discovery, save_dev_info_mock, mock_input, input_val
     ):
         """Test appropriate errors are raised on invalid device selections."""
         with pytest.raises(IndexError):
-            mock_list.execute.return_value = [
-                r"1: mbed-linux-os-9999: fe80::d079:8191:9140:c56%eth3"
-            ]
-            mock_input.return_value = input_val
+            mock_input.answer = input_val
             select_action.execute(Args())
 
 
@@ -206,9 +306,45 @@ class TestShellCommand:
                 shell_action.execute(args)
                 client().connect.assert_called_once_with(
                     args.address,
+                    port=22,
                     username="root",
                     password=None,
                     key_filename=None,
                     banner_timeout=60,
                 )
                 assert client().invoke_shell.called
+
+
+class TestShellScriptCommand:
+    """Test the shell command's script mode."""
+
+    @pytest.fixture
+    def args(self, tmp_path):
+        """Args fixture with a script file."""
+        script = tmp_path / "script.sh"
+        script.write_text("# health check\nuptime\n\ndf -h\n")
+        _args = Args()
+        _args.address = "168.254.56.92"
+        _args.script = str(script)
+        yield _args
+
+    def test_script_commands_run_as_batch(self, mock_ssh, args):
+        """Test each command in the script is sent in a single batch."""
+        _ssh, _scp = mock_ssh
+        _ssh.run_batch.return_value = [
+            ssh.CommandResult("uptime", 0, "", ""),
+            ssh.CommandResult("df -h", 0, "", ""),
+        ]
+        shell_action.execute(args)
+        _ssh.run_batch.assert_called_once_with(["uptime", "df -h"], jobs=1)
+
+    def test_script_raises_on_failed_command(self, mock_ssh, args):
+        """Test the exit code of the first failing command is returned."""
+        _ssh, _scp = mock_ssh
+        _ssh.run_batch.return_value = [
+            ssh.CommandResult("uptime", 0, "", ""),
+            ssh.CommandResult("df -h", 3, "", "df: failed"),
+        ]
+        with pytest.raises(ssh.SSHCallError) as err:
+            shell_action.execute(args)
+        assert err.value.return_code == 3
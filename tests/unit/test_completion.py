@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Shell completion tests."""
+
+import json
+from unittest import mock
+
+import pytest
+
+from mbl.cli import mbl_cli
+from mbl.cli.utils import completion, file_handler, store
+
+
+@pytest.fixture
+def index_files(tmp_path):
+    """Point the completion index, device file and store record at tmp."""
+    team_path = tmp_path / "team"
+    team_path.mkdir()
+    (team_path / "config.json").write_text(
+        json.dumps(dict(dev_certs={"team-cert": []}))
+    )
+    stores_path = tmp_path / "stores.json"
+    stores_path.write_text(json.dumps(dict(team=str(team_path))))
+    device_path = tmp_path / "dev.json"
+    device_path.write_text(json.dumps(dict(address="169.254.1.1")))
+    with mock.patch.object(
+        completion, "INDEX_FILE_PATH", tmp_path / "index.json"
+    ), mock.patch.object(
+        file_handler, "DEVICE_FILE_PATH", str(device_path)
+    ), mock.patch.object(
+        store.StoreLocationsRecord, "STORE_LOCATIONS_FILE_PATH", stores_path
+    ):
+        yield tmp_path
+
+
+class TestComplete:
+    """Test candidates are produced for each kind of word."""
+
+    @pytest.mark.parametrize(
+        "line, expected",
+        [
+            ("mbl-cli li", ["list", "list-certificates"]),
+            ("mbl-cli -q sh", ["shell"]),
+            ("mbl-cli shell --sc", ["--script"]),
+            ("mbl-cli -o ", ["json", "text"]),
+            ("mbl-cli which ", []),
+        ],
+    )
+    def test_commands_and_options(self, index_files, line, expected):
+        """Test subcommands, options and choices are completed."""
+        assert completion.complete(line) == expected
+
+    def test_device_addresses(self, index_files):
+        """Test addresses come from the index and the selected device."""
+        completion.remember_devices(["fe80::1%eth0"])
+        assert completion.complete("mbl-cli -a ") == [
+            "169.254.1.1",
+            "fe80::1%eth0",
+        ]
+        assert completion.complete("mbl-cli --address fe") == ["fe80::1%eth0"]
+
+    def test_certificate_names(self, index_files):
+        """Test names come from the team store and the cached listing."""
+        completion.remember_certificates(["pelion-cert", "old-cert"])
+        completion.forget_certificate("old-cert")
+        assert completion.complete("mbl-cli provision-pelion ") == [
+            "pelion-cert",
+            "team-cert",
+        ]
+        assert completion.complete("mbl-cli provision-pelion a t") == [
+            "team-cert"
+        ]
+        assert completion.complete("mbl-cli provision-pelion a b ") == []
+
+    def test_missing_files(self, tmp_path):
+        """Test completion works before any files have been written."""
+        with mock.patch.object(
+            completion, "INDEX_FILE_PATH", tmp_path / "index.json"
+        ):
+            assert completion.read_index() == dict(devices=[], certificates=[])
+
+    @pytest.mark.parametrize("point", ["", "x", None])
+    def test_bad_cursor_position(self, index_files, capsys, point):
+        """Test the whole line is completed if the cursor isn't a number."""
+        assert mbl_cli._complete("mbl-cli -q sh", point) == 0
+        assert capsys.readouterr().out == "shell\n"
@@ -11,7 +11,7 @@ from mbl.cli.utils import device
 
 
 class TestDeviceInfo:
-    """Test DeviceInfo's eq/ne operators."""
+    """Test DeviceInfo's eq/ne operators and hash."""
 
     def test_compares_eq(self):
         """Test equivalent devices compare equal."""
@@ -34,37 +34,69 @@ class TestDeviceInfo:
         assert dev_a != dev_b
 
     @pytest.mark.parametrize(
-        "dev_a, dev_b",
-        [
-            (
-                device.create_device("john", "103.2034.04.05"),
-                ("john", "102.2034.04.05"),
-            ),
-            (
-                device.create_device("jim", "103.2034.04.05"),
-                ["john", "102.2034.04.05"],
-            ),
-        ],
+        "other", [("john", "103.2034.04.05"), ["john", "103.2034.04.05"]]
     )
-    def test_eq_raises_on_invalid_types(self, dev_a, dev_b):
-        """Test raises a TypeError when trying to compare invalid types."""
-        with pytest.raises(TypeError):
-            dev_a == dev_b
+    def test_not_equal_to_other_types(self, other):
+        """Test devices compare unequal to objects of other types."""
+        dev = device.create_device("john", "103.2034.04.05")
+        assert not dev == other
+        assert dev != other
 
-    @pytest.mark.parametrize(
-        "dev_a, dev_b",
-        [
-            (
-                device.create_device("john", "103.2034.04.05"),
-                ("john", "102.2034.04.05"),
-            ),
-            (
-                device.create_device("jim", "103.2034.04.05"),
-                ["john", "102.2034.04.05"],
-            ),
-        ],
-    )
-    def test_ne_raises_on_invalid_types(self, dev_a, dev_b):
-        """Test raises a TypeError when trying to compare invalid types."""
-        with pytest.raises(TypeError):
-            dev_a != dev_b
+    def test_hash_is_consistent_with_eq(self):
+        """Test devices which compare equal have the same hash."""
+        dev_a = device.create_device("john", "102.2034.04.05", "root", "")
+        dev_b = device.create_device("john", "102.2034.04.05", "user", "pw")
+        assert dev_a == dev_b
+        assert len({dev_a, dev_b}) == 1
+
+    def test_addresses_start_with_address(self):
+        """Test the address is first in addresses, and not repeated."""
+        dev = device.create_device(
+            "john", "10.0.0.1", addresses=["fe80::1%eth0", "10.0.0.1"]
+        )
+        assert dev.addresses == ("10.0.0.1", "fe80::1%eth0")
+        assert dev._asdict()["addresses"] == ["10.0.0.1", "fe80::1%eth0"]
+        assert dev == device.create_device("john", "10.0.0.1")
+
+    def test_is_immutable(self):
+        """Test device fields can't be changed or added."""
+        dev = device.create_device("john", "102.2034.04.05")
+        with pytest.raises(AttributeError):
+            dev.address = "102.2034.04.06"
+        with pytest.raises(AttributeError):
+            dev.port = 22
+
+
+class TestDeviceRegistry:
+    """Test the DeviceRegistry indexes."""
+
+    def test_add_ignores_equal_devices(self):
+        """Test adding an equal device doesn't add it again."""
+        registry = device.DeviceRegistry()
+        assert registry.add(device.create_device("a", "10.0.0.1"))
+        assert not registry.add(device.create_device("a", "10.0.0.1"))
+        assert len(registry) == 1
+
+    def test_lookup_by_address_and_hostname(self):
+        """Test devices are found by address and by hostname."""
+        dev_a = device.create_device("a", "10.0.0.1")
+        dev_b = device.create_device("a", "fe80::1%eth0")
+        dev_c = device.create_device("c", "10.0.0.3")
+        registry = device.DeviceRegistry([dev_a, dev_b, dev_c])
+        assert list(registry) == [dev_a, dev_b, dev_c]
+        assert registry.by_address("10.0.0.3") is dev_c
+        assert registry.by_address("10.0.0.4") is None
+        assert registry.by_hostname("a") == [dev_a, dev_b]
+        assert dev_b in registry
+
+    def test_remove(self):
+        """Test removed devices are removed from the indexes."""
+        dev_a = device.create_device("a", "10.0.0.1")
+        dev_b = device.create_device("b", "10.0.0.1")
+        registry = device.DeviceRegistry([dev_a, dev_b])
+        registry.remove(dev_a)
+        assert registry.by_address("10.0.0.1") is dev_b
+        assert registry.by_hostname("a") == []
+        assert dev_a not in registry
+        with pytest.raises(KeyError):
+            registry.remove(dev_a)
@@ -21,7 +21,6 @@ def discovery():
     with mock.patch("mbl.cli.utils.discovery.zeroconf") as zconf:
         device_listener = d.DeviceDiscoveryNotifier()
         yield device_listener, zconf
-        d.DeviceDiscoveryNotifier.devices = list()
 
 
 class TestDeviceDiscovery:
@@ -61,8 +60,8 @@ class TestDeviceDiscovery:
     ):
         """Test a single device is discovered."""
         # Define a callback
-        def callbk(item):
-            assert item.split(":")[0] == name.split("." + service_type)[0]
+        def callbk(dev):
+            assert dev.hostname == name.split("." + service_type)[0]
 
         device_listener, zconf = discovery
         data = namedtuple("ServiceInfo", "properties address")
@@ -123,7 +122,8 @@ class TestDeviceDiscovery:
         device_listener.add_service(zconf, service_type, name[1])
 
         assert len(device_listener.devices) == 2
-        assert device_listener.devices[0] != device_listener.devices[1]
+        first, second = device_listener.devices
+        assert first != second
 
     @pytest.mark.parametrize(
         "properties, address, service_type, name",
@@ -211,3 +211,90 @@ class TestDeviceDiscovery:
         device_listener.add_service(zconf, service_type, name)
 
         assert len(device_listener.devices) == 0
+
+    def test_devices_are_not_shared_between_notifiers(self, discovery):
+        """Test each notifier has its own registry of devices."""
+        device_listener, zconf = discovery
+        info = namedtuple("ServiceInfo", "properties address")
+        info.properties = {b"mblos": True}
+        info.address = socket.inet_aton("192.168.0.1")
+        zconf.get_service_info.return_value = info
+        device_listener.add_service(zconf, "_ssh._tcp.local.", "a")
+        assert len(device_listener.devices) == 1
+        assert len(d.DeviceDiscoveryNotifier().devices) == 0
+
+    def test_all_addresses_kept(self, discovery):
+        """Test a device listed by avahi with two addresses is one device."""
+        device_listener, _ = discovery
+        found = []
+        device_listener.add_listener(found.append)
+        for info in d._parse_avahi_output(
+            b"=;eth0;IPv6;mbed-linux-os-1;SSH;local;h.local;fe80::1;22;mblos\n"
+            b"=;eth0;IPv4;mbed-linux-os-1;SSH;local;h.local;10.0.0.1;22;x\n"
+        ):
+            device_listener.add_service(
+                d.AvahiZeroconf(**info), "local", info["name"].decode()
+            )
+        assert len(found) == 1
+        assert found[0].addresses == ("fe80::1%eth0", "10.0.0.1")
+
+    def test_address_order_changes(self, discovery):
+        """Test a service is reported once when its addresses reorder."""
+        device_listener, _ = discovery
+        found = []
+        device_listener.add_listener(found.append)
+        for addresses in (["10.0.0.1", "fe80::1"], ["fe80::1", "10.0.0.1"]):
+            info = d.AvahiZeroconf.ServiceInfo(
+                b"mbed-linux-os-1", {b"mblos": False}, addresses
+            )
+            device_listener.add_service(
+                mock.Mock(**{"get_service_info.return_value": info}),
+                "local",
+                "mbed-linux-os-1",
+            )
+        assert len(found) == 1
+        assert len(device_listener.devices) == 1
+
+    @pytest.mark.parametrize(
+        "info",
+        [
+            None,
+            d.AvahiZeroconf.ServiceInfo(b"m", {b"mblos": False}, []),
+        ],
+    )
+    def test_unresolved_services_skipped(self, discovery, info):
+        """Test services without info or addresses are skipped."""
+        device_listener, zconf = discovery
+        zconf.get_service_info.return_value = info
+        device_listener.add_service(zconf, "_ssh._tcp.local.", "m")
+        assert len(device_listener.devices) == 0
+
+    def test_packed_ipv6_addresses(self):
+        """Test packed addresses from zeroconf are formatted."""
+        info = mock.Mock(spec=["addresses"])
+        info.addresses = [
+            socket.inet_aton("10.0.0.1"),
+            socket.inet_pton(socket.AF_INET6, "fd00::1"),
+        ]
+        assert d._service_addresses(info) == ["10.0.0.1", "fd00::1"]
+
+
+class TestBackgroundDiscovery:
+    """Test discovery in a background thread."""
+
+    def test_error_raised_on_exit(self):
+        """Test an error in the discovery thread is raised in the caller."""
+        with mock.patch.object(
+            d, "do_discovery", side_effect=OSError("no network")
+        ):
+            with pytest.raises(OSError):
+                with d.BackgroundDiscovery(print) as background:
+                    assert background.finished.wait(5)
+
+    def test_stopped_on_exit(self):
+        """Test discovery is stopped when the context exits."""
+        with mock.patch.object(d, "_avahi_browse", return_value=b""):
+            with mock.patch.object(d, "TIMEOUT", 600):
+                with d.BackgroundDiscovery(print) as background:
+                    assert not background.finished.is_set()
+            assert background.finished.is_set()
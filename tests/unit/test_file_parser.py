@@ -5,6 +5,8 @@
 
 """File io tests."""
 
+import os
+import stat
 from io import StringIO
 from unittest import mock
 
@@ -54,3 +56,51 @@ class TestFileHandler:
         """Test json.load is called."""
         fh.from_file()
         assert mock_json.load.called
+
+
+class TestAtomicWrite:
+    """Atomic file write tests."""
+
+    def test_write_new_file(self, tmp_path):
+        """Test a new file is written with the default permissions."""
+        path = tmp_path / "config.json"
+        file_handler.to_json(path, a=1)
+        assert file_handler.from_json(path) == dict(a=1)
+        umask = os.umask(0)
+        os.umask(umask)
+        assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~umask
+
+    def test_read_does_not_touch_file(self, tmp_path):
+        """Test reading a file doesn't change its modification time."""
+        path = tmp_path / "config.json"
+        file_handler.to_json(path, a=1)
+        os.utime(str(path), ns=(0, 0))
+        assert file_handler.from_json(path) == dict(a=1)
+        assert path.stat().st_mtime_ns == 0
+
+    def test_read_creates_missing_file(self, tmp_path):
+        """Test a missing file is created empty."""
+        path = tmp_path / "config.json"
+        assert file_handler.from_json(path) == dict()
+        assert path.exists()
+
+    def test_write_preserves_mode(self, tmp_path):
+        """Test the permission bits of an existing file are kept."""
+        path = tmp_path / "cert.bin"
+        path.write_bytes(b"old data")
+        path.chmod(0o640)
+        file_handler.to_binary_file(path, b"new")
+        assert path.read_bytes() == b"new"
+        assert stat.S_IMODE(path.stat().st_mode) == 0o640
+
+    def test_failed_write_keeps_old_file(self, tmp_path):
+        """Test the file is unchanged and no temp file is left on error."""
+        path = tmp_path / "config.json"
+        path.write_text("old")
+        with mock.patch.object(
+            file_handler.os, "replace", side_effect=OSError
+        ):
+            with pytest.raises(OSError):
+                file_handler.to_text_file(path, "new")
+        assert path.read_text() == "old"
+        assert os.listdir(str(tmp_path)) == ["config.json"]
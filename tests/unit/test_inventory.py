@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Device inventory tests."""
+
+import json
+import sys
+from unittest import mock
+
+import pytest
+
+from mbl.cli.actions import (
+    inventory_action,
+    select_action,
+    utils,
+    which_action,
+)
+from mbl.cli.args import parser
+from mbl.cli.utils import completion, device, inventory, resolve
+
+
+@pytest.fixture
+def inventory_path(tmp_path):
+    """Keep the inventory out of the user's home directory."""
+    path = tmp_path / "inventory.json"
+    with mock.patch.object(inventory, "INVENTORY_FILE_PATH", path):
+        yield path
+
+
+@pytest.fixture
+def devices(inventory_path):
+    """Create an inventory with three devices in two groups."""
+    with inventory.edit() as inv:
+        inv.add("hall-1", "10.0.0.1", "mbed-linux-os-1", groups=["hall"])
+        inv.add("hall-2", "10.0.0.2", tags=["rpi"], groups=["hall"])
+        inv.add("lab", "fe80::1%eth0", tags=["rpi", "imx"], groups=["lab"])
+    yield inventory_path
+
+
+class TestInventory:
+    """Test adding, looking up and saving devices."""
+
+    def test_lookups(self, devices):
+        """Test devices are found by name, address, tag and group."""
+        inv = inventory.load()
+        assert len(inv) == 3
+        assert inv.get("lab").address == "fe80::1%eth0"
+        assert inv.by_address("10.0.0.2").name == "hall-2"
+        assert inv.by_address("10.0.0.9") is None
+        assert [d.name for d in inv.with_hostname("mbed-linux-os-1")] == [
+            "hall-1"
+        ]
+        assert [d.name for d in inv.with_tag("rpi")] == ["hall-2", "lab"]
+        assert [d.name for d in inv.in_group("hall")] == ["hall-1", "hall-2"]
+        assert inv.groups() == ["hall", "lab"]
+
+    def test_get_raises_if_missing(self, devices):
+        """Test a ValueError is raised for an unknown name."""
+        with pytest.raises(ValueError):
+            inventory.load().get("nope")
+
+    def test_add_merges_tags_and_groups(self, devices):
+        """Test adding a known device keeps its tags and groups."""
+        with inventory.edit() as inv:
+            inv.add("lab", "10.0.0.3", tags=["new"], groups=["hall"])
+        dev = inventory.load().get("lab")
+        assert dev.address == "10.0.0.3"
+        assert dev.tags == ["imx", "new", "rpi"]
+        assert dev.groups == ["hall", "lab"]
+        assert inventory.load().by_address("fe80::1%eth0") is None
+
+    def test_remove(self, devices):
+        """Test removed devices are no longer indexed."""
+        with inventory.edit() as inv:
+            inv.remove("hall-1")
+        inv = inventory.load()
+        assert [d.name for d in inv.in_group("hall")] == ["hall-2"]
+        with pytest.raises(ValueError):
+            inv.remove("hall-1")
+
+    def test_file_format(self, devices):
+        """Test the file holds the devices by name."""
+        data = json.loads(devices.read_text())
+        assert data["version"] == inventory.FORMAT_VERSION
+        assert data["devices"]["hall-2"] == dict(
+            address="10.0.0.2",
+            hostname="",
+            tags=["rpi"],
+            groups=["hall"],
+            last_seen=None,
+            latency_s=None,
+            resolved=[],
+        )
+
+    def test_file_without_resolved_addresses(self, inventory_path):
+        """Test files written before addresses were resolved are read."""
+        inventory_path.write_text(
+            json.dumps(
+                dict(
+                    version=1,
+                    devices=dict(
+                        pi=dict(
+                            address="pi.example",
+                            hostname="",
+                            tags=[],
+                            groups=[],
+                            last_seen=None,
+                            latency_s=None,
+                        )
+                    ),
+                )
+            )
+        )
+        assert inventory.load().get("pi").resolved == []
+
+    def test_lock_file_name(self, tmp_path):
+        """Test a hidden inventory file's lock doesn't get a second dot."""
+        path = tmp_path / ".mbl-inventory.json"
+        with inventory.edit(path):
+            pass
+        assert (tmp_path / ".mbl-inventory.json.lock").exists()
+        assert not (tmp_path / "..mbl-inventory.json.lock").exists()
+
+    def test_not_saved_on_error(self, devices):
+        """Test changes are discarded if the edit raises."""
+        with pytest.raises(RuntimeError):
+            with inventory.edit() as inv:
+                inv.remove("lab")
+                raise RuntimeError
+        assert "lab" in [d.name for d in inventory.load()]
+
+    def test_record_discovered(self, devices):
+        """Test discovery updates the address of devices by hostname."""
+        inventory.record_discovered(
+            [("mbed-linux-os-1", "10.0.0.5"), ("unknown", "10.0.0.6")]
+        )
+        dev = inventory.load().get("hall-1")
+        assert dev.address == "10.0.0.5"
+        assert dev.last_seen is not None
+        assert len(inventory.load()) == 3
+
+    @pytest.mark.parametrize("active", [True, False])
+    def test_ping_counts_only_active_sessions(self, devices, active):
+        """Test a device is unreachable if its session didn't connect."""
+        args = Args()
+        args.names = ["hall-1"]
+        with mock.patch(
+            "mbl.cli.utils.ssh.SSHSession", autospec=True
+        ) as ssh_session:
+            session = ssh_session.return_value.__enter__.return_value
+            session.is_active.return_value = active
+            if active:
+                inventory_action._ping(args)
+            else:
+                with pytest.raises(IOError):
+                    inventory_action._ping(args)
+        dev = inventory.load().get("hall-1")
+        assert (dev.latency_s is not None) == active
+
+    def test_record_discovered_by_address(self, devices):
+        """Test devices without a hostname are matched by address."""
+        inventory.record_discovered([("mbed-linux-os-2", "10.0.0.2")])
+        dev = inventory.load().get("hall-2")
+        assert dev.hostname == "mbed-linux-os-2"
+        assert dev.last_seen is not None
+        inventory.record_discovered([("mbed-linux-os-2", "10.0.0.7")])
+        assert inventory.load().get("hall-2").address == "10.0.0.7"
+
+    def test_record_discovered_keeps_other_hostnames(self, devices):
+        """Test a device with another hostname isn't matched by address."""
+        inventory.record_discovered([("mbed-linux-os-9", "10.0.0.1")])
+        dev = inventory.load().get("hall-1")
+        assert dev.hostname == "mbed-linux-os-1"
+        assert dev.last_seen is None
+
+    def test_record_discovered_without_inventory(self, inventory_path):
+        """Test no inventory file is created by discovery."""
+        inventory.record_discovered([("mbed-linux-os-1", "10.0.0.5")])
+        assert not inventory_path.exists()
+
+
+class Args:
+    """Mock args namespace."""
+
+    address = None
+    config_hostname = "mbl-device"
+    group = None
+    name = None
+
+
+class TestTargeting:
+    """Test commands target devices by name and group."""
+
+    def test_target_group(self, devices):
+        """Test a device is returned for each member of the group."""
+        args = Args()
+        args.group = "hall"
+        assert [d.address for d in utils.target_devices(args)] == [
+            "10.0.0.1",
+            "10.0.0.2",
+        ]
+
+    def test_target_empty_group(self, devices):
+        """Test an unknown group is an error."""
+        args = Args()
+        args.group = "nope"
+        with pytest.raises(ValueError):
+            utils.target_devices(args)
+
+    def test_for_each_device_continues_after_failure(self, devices):
+        """Test every device is tried, and the failures are reported."""
+        args = Args()
+        args.group = "hall"
+        called = []
+
+        def _func(dev):
+            called.append(dev.address)
+            if dev.address == "10.0.0.1":
+                raise IOError("unreachable")
+
+        with pytest.raises(IOError) as error:
+            utils.for_each_device(utils.target_devices(args), _func)
+        assert called == ["10.0.0.1", "10.0.0.2"]
+        assert "1 of 2 devices failed: 10.0.0.1" in str(error.value)
+
+    def test_select_by_name(self, devices):
+        """Test a device is selected from the inventory without discovery."""
+        args = Args()
+        args.name = "hall-1"
+        with mock.patch(
+            "mbl.cli.utils.file_handler.save_device_info"
+        ) as save, mock.patch.object(select_action, "list_action") as lister:
+            select_action.execute(args)
+        assert not lister.execute.called
+        saved = save.call_args[0][0]
+        assert (saved.hostname, saved.address) == (
+            "mbed-linux-os-1",
+            "10.0.0.1",
+        )
+
+    @pytest.mark.parametrize(
+        "argv, ok",
+        [
+            (["-g", "hall", "shell", "uptime"], True),
+            (["-g", "hall", "put", "a", "b"], True),
+            (["-g", "hall", "inventory", "ping"], True),
+            (["-g", "hall", "get", "a", "b"], False),
+            (["-g", "hall", "inventory", "list"], False),
+        ],
+    )
+    def test_group_commands(self, argv, ok):
+        """Test --group is only accepted by commands which take a group."""
+        with mock.patch.object(sys, "argv", ["mbl-cli"] + argv):
+            if ok:
+                assert parser.parse_args("").group == "hall"
+            else:
+                with pytest.raises(SystemExit):
+                    parser.parse_args("")
+
+    def test_add_with_hostname(self, inventory_path):
+        """Test inventory add records the hostname given."""
+        argv = ["inventory", "add", "x", "10.0.0.8", "--hostname", "mbl-x"]
+        with mock.patch.object(sys, "argv", ["mbl-cli"] + argv):
+            args = parser.parse_args("")
+        inventory_action.execute(args)
+        assert [d.name for d in inventory.load().with_hostname("mbl-x")] == [
+            "x"
+        ]
+
+    @pytest.mark.parametrize(
+        "addresses, name",
+        [
+            (["10.0.0.5", "10.0.0.2"], "hall-2"),
+            (["10.0.0.7"], "pi"),
+            (["10.0.0.8"], None),
+        ],
+    )
+    def test_which_shows_name(self, devices, addresses, name):
+        """Test which finds devices by any address, and by hostname."""
+        with inventory.edit() as inv:
+            inv.add("pi", "pi.example")
+            inv.record_resolved("pi", ["10.0.0.7"])
+            inv.add("gone", "gone.local")
+        dev = device.create_device("", addresses[0], addresses=addresses)
+        with mock.patch.object(
+            resolve, "_lookup", side_effect=AssertionError("lookup")
+        ), mock.patch.object(
+            utils, "create_device", return_value=dev
+        ), mock.patch.object(
+            which_action.output, "emit"
+        ) as emit:
+            which_action.execute(Args())
+        assert emit.call_args[1]["name"] == name
+
+    def test_select_records_resolved_addresses(self, devices):
+        """Test selecting a device by hostname records its addresses."""
+        with inventory.edit() as inv:
+            inv.add("pi", "pi.example")
+        args = Args()
+        args.name = "pi"
+        with mock.patch.object(
+            resolve, "resolve", return_value=["10.0.0.7", "fe80::7%eth0"]
+        ), mock.patch("mbl.cli.utils.file_handler.save_device_info"):
+            select_action.execute(args)
+        assert inventory.load().by_address("fe80::7%eth0").name == "pi"
+        with inventory.edit() as inv:
+            inv.add("pi", "pi2.example")
+        assert inventory.load().by_address("10.0.0.7") is None
+
+    def test_completion(self, devices):
+        """Test device names and groups are completed."""
+        assert completion.complete("mbl-cli select h") == ["hall-1", "hall-2"]
+        assert completion.complete("mbl-cli -g ") == ["hall", "lab"]
+        assert completion.complete("mbl-cli inventory p") == ["ping"]
+        assert completion.complete("mbl-cli inventory remove l") == ["lab"]
+        assert completion.complete("mbl-cli inventory ping ") == [
+            "hall-1",
+            "hall-2",
+            "lab",
+        ]
+        assert completion.complete("mbl-cli inventory ping lab h") == [
+            "hall-1",
+            "hall-2",
+        ]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Metrics tests."""
+
+import time
+from unittest import mock
+
+import paramiko
+import pytest
+
+from mbl.cli.utils import device, metrics, ssh
+
+
+@pytest.fixture(autouse=True)
+def _reset_metrics():
+    """Start each test without any collected metrics."""
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def _samples(metrics_format=metrics.PROMETHEUS):
+    """Return the sample lines of the formatted metrics."""
+    return [
+        line
+        for line in metrics.format_metrics(metrics_format).splitlines()
+        if not line.startswith("#")
+    ]
+
+
+class TestFormat:
+    """Metrics text formats."""
+
+    def test_prometheus_format(self):
+        """Test counters and summaries are written with their labels."""
+        metrics.inc("mbl_cli_transfer_bytes_total", 10, address="a")
+        metrics.inc("mbl_cli_transfer_bytes_total", 5, address="a")
+        metrics.observe("mbl_cli_transfer_seconds", 0.5, address="a")
+        metrics.observe("mbl_cli_transfer_seconds", 1.5, address="a")
+        text = metrics.format_metrics()
+        assert "# TYPE mbl_cli_transfer_bytes_total counter" in text
+        assert "# TYPE mbl_cli_transfer_seconds summary" in text
+        assert _samples() == [
+            'mbl_cli_transfer_bytes_total{address="a"} 15',
+            'mbl_cli_transfer_seconds_count{address="a"} 2',
+            'mbl_cli_transfer_seconds_sum{address="a"} 2.0',
+        ]
+        assert not text.rstrip().endswith("# EOF")
+
+    def test_openmetrics_format(self):
+        """Test counter families drop the suffix and the output ends."""
+        metrics.inc("mbl_cli_ssh_connect_attempts_total")
+        text = metrics.format_metrics(metrics.OPENMETRICS)
+        assert "# TYPE mbl_cli_ssh_connect_attempts counter" in text
+        assert "mbl_cli_ssh_connect_attempts_total 1" in text
+        assert text.endswith("# EOF\n")
+
+    def test_label_values_are_escaped(self):
+        """Test quotes, backslashes and newlines in labels are escaped."""
+        metrics.inc("mbl_cli_transfer_files_total", address='a"b\\c\nd')
+        assert _samples() == [
+            r'mbl_cli_transfer_files_total{address="a\"b\\c\nd"} 1'
+        ]
+
+    def test_timed_records_result(self):
+        """Test timed observes successes and failures separately."""
+        with metrics.timed("mbl_cli_provision_seconds"):
+            pass
+        with pytest.raises(ValueError):
+            with metrics.timed("mbl_cli_provision_seconds"):
+                raise ValueError
+        samples = _samples()
+        assert 'mbl_cli_provision_seconds_count{result="failure"} 1' in samples
+        assert 'mbl_cli_provision_seconds_count{result="success"} 1' in samples
+
+    def test_write_periodically(self, tmp_path):
+        """Test the metrics file is written while in the context."""
+        path = tmp_path / "mbl.prom"
+        metrics.inc("mbl_cli_ssh_connect_attempts_total")
+        with mock.patch.object(metrics, "WRITE_INTERVAL_S", 0.01):
+            with metrics.write_periodically(str(path)):
+                for _ in range(500):
+                    if path.exists():
+                        break
+                    time.sleep(0.01)
+        assert "mbl_cli_ssh_connect_attempts_total 1" in path.read_text()
+
+
+class TestSSHMetrics:
+    """Metrics collected by SSH sessions."""
+
+    def test_connect_retries_and_failures(self):
+        """Test failed connection attempts are counted."""
+        dev = device.create_device("mbl", "192.168.0.1")
+        with mock.patch.object(ssh, "SSHClientWithNoAuthSupport") as client:
+            client().connect.side_effect = [
+                paramiko.SSHException,
+                paramiko.SSHException,
+                None,
+            ]
+            with mock.patch.object(ssh.time, "sleep"):
+                with ssh.SSHSession(dev):
+                    pass
+        samples = _samples()
+        for sample in (
+            "attempts_total{} 3",
+            "failures_total{} 2",
+            "retries_total{} 2",
+            "seconds_count{} 1",
+        ):
+            labels = '{address="192.168.0.1"}'
+            assert "mbl_cli_ssh_connect_" + sample.format(labels) in samples
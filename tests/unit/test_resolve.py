@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Hostname resolution tests."""
+
+import json
+import socket
+import threading
+from unittest import mock
+
+import pytest
+
+from mbl.cli.actions import utils
+from mbl.cli.utils import resolve
+
+HOSTS = {
+    "board.example": ["192.168.1.20"],
+    "mbed-linux-os-1.local": ["192.168.1.21", "fe80::1%lo"],
+}
+
+
+def _addrinfo(name, port, proto=0):
+    if name.lower() not in HOSTS:
+        raise socket.gaierror(socket.EAI_NONAME, "Name not known")
+    infos = []
+    for address in HOSTS[name.lower()]:
+        if ":" in address:
+            addr, scope = address.split("%")
+            sockaddr = (addr, 0, 0, socket.if_nametoindex(scope))
+            infos.append(
+                (socket.AF_INET6, socket.SOCK_STREAM, 6, "", sockaddr)
+            )
+        else:
+            infos.append(
+                (socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, 0))
+            )
+    return infos
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    """Fake the system resolver, and keep the cache in tmp."""
+    with mock.patch.object(
+        resolve.socket, "getaddrinfo", side_effect=_addrinfo
+    ) as getaddrinfo, mock.patch.object(
+        resolve, "_mdns_lookup", return_value=[]
+    ), mock.patch.object(
+        resolve, "RESOLVE_CACHE_FILE_PATH", tmp_path / "cache.json"
+    ):
+        yield getaddrinfo
+
+
+class TestResolve:
+    """Test names are resolved and cached."""
+
+    @pytest.mark.parametrize("address", ["10.0.0.1", "fe80::1%eth0"])
+    def test_addresses_are_not_looked_up(self, resolver, address):
+        """Test IP addresses are returned without a lookup."""
+        assert resolve.resolve(address) == [address]
+        assert not resolver.called
+
+    def test_all_addresses_returned(self, resolver):
+        """Test every address of a name is returned, with IPv6 scopes."""
+        assert resolve.resolve("mbed-linux-os-1.local") == [
+            "192.168.1.21",
+            "fe80::1%lo",
+        ]
+
+    def test_cached(self, resolver):
+        """Test a resolved name isn't looked up again until it expires."""
+        resolve.resolve("board.example")
+        resolve.resolve("board.example")
+        assert resolver.call_count == 1
+        with mock.patch.object(
+            resolve.time, "time", return_value=resolve.time.time() + 301
+        ):
+            resolve.resolve("board.example")
+        assert resolver.call_count == 2
+
+    def test_cache_file(self, resolver):
+        """Test the cache holds the addresses and expiry time."""
+        resolve.resolve("Board.Example")
+        cache = json.loads(resolve.RESOLVE_CACHE_FILE_PATH.read_text())
+        assert cache["board.example"]["addresses"] == ["192.168.1.20"]
+
+    def test_not_found(self, resolver):
+        """Test a ValueError is raised, and the failure isn't cached."""
+        with pytest.raises(ValueError):
+            resolve.resolve("nope.local")
+        assert resolve._mdns_lookup.called
+        with pytest.raises(ValueError):
+            resolve.resolve("nope.local")
+        assert resolver.call_count == 2
+
+    def test_resolved_concurrently(self, resolver):
+        """Test several names are looked up at the same time."""
+        barrier = threading.Barrier(2, timeout=5)
+
+        def _wait_for_both(name, *args, **kwargs):
+            barrier.wait()
+            return _addrinfo(name, *args, **kwargs)
+
+        resolver.side_effect = _wait_for_both
+        assert resolve.resolve_all(
+            ["board.example", "mbed-linux-os-1.local", "10.0.0.1"]
+        ) == {
+            "board.example": ["192.168.1.20"],
+            "mbed-linux-os-1.local": ["192.168.1.21", "fe80::1%lo"],
+            "10.0.0.1": ["10.0.0.1"],
+        }
+
+    def test_create_device_with_hostname(self, resolver):
+        """Test -a accepts a hostname."""
+        dev = utils.create_device("mbed-linux-os-1.local", "mbl-device")
+        assert dev.address == "192.168.1.21"
+        assert dev.addresses == ("192.168.1.21", "fe80::1%lo")
+        assert dev.hostname == "mbl-device"
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Tests for the Python API and JSON-RPC server."""
+
+import os
+import stat
+import threading
+from unittest import mock
+
+import pytest
+
+from mbl.cli import api, server
+from mbl.cli.utils import device, ssh
+
+
+@pytest.fixture
+def mock_session():
+    """Mock SSHSession, return the mock class."""
+    with mock.patch(
+        "mbl.cli.utils.ssh.SSHSession", autospec=True
+    ) as ssh_session:
+        session = ssh_session.return_value.__enter__.return_value
+        session.is_active.return_value = True
+        session.run_batch.side_effect = lambda cmds, jobs: [
+            ssh.CommandResult(c, 0, c, "") for c in cmds
+        ]
+        yield ssh_session
+
+
+@pytest.fixture
+def rpc_server(tmp_path, mock_session):
+    """Run a server on a Unix socket in a background thread."""
+    socket_path = str(tmp_path / "mbl-cli.sock")
+    with api.Client() as client:
+        rpc_server = server.create_server(client, socket_path=socket_path)
+        thread = threading.Thread(target=rpc_server.serve_forever)
+        thread.start()
+        yield socket_path
+        rpc_server.shutdown()
+        rpc_server.server_close()
+        thread.join()
+
+
+class TestClient:
+    """Test the api.Client."""
+
+    def test_sessions_are_reused(self, mock_session):
+        """Test one SSH session is opened per device address."""
+        with api.Client() as client:
+            client.run("169.254.1.2", "uptime")
+            client.run("169.254.1.2", "whoami")
+            client.run("169.254.1.3", "uptime")
+        assert mock_session.call_count == 2
+
+    def test_inactive_session_reconnects(self, mock_session):
+        """Test a new session is opened if the connection was lost."""
+        session = mock_session.return_value.__enter__.return_value
+        with api.Client() as client:
+            client.run("169.254.1.2", "uptime")
+            session.is_active.return_value = False
+            client.run("169.254.1.2", "uptime")
+            assert session.__exit__.called
+        assert mock_session.call_count == 2
+
+    def test_discovery_results_are_kept(self):
+        """Test devices are only discovered again when asked to."""
+        with mock.patch.object(api.discovery, "do_discovery") as browse:
+            browse.side_effect = lambda listener: listener(
+                device.create_device("mbed-linux-os-1", "169.254.1.2")
+            )
+            with api.Client() as client:
+                first = client.list_devices()
+                assert client.list_devices() == first
+                assert browse.call_count == 1
+                assert client.list_devices(refresh=True) == first
+                assert browse.call_count == 2
+        assert first == [
+            dict(hostname="mbed-linux-os-1", address="169.254.1.2")
+        ]
+
+
+class TestServer:
+    """Test requests are handled by the server."""
+
+    def test_calls_over_one_connection(self, rpc_server):
+        """Test several requests can be made on one connection."""
+        with server.Connection(rpc_server) as conn:
+            for cmd in ("uptime", "whoami"):
+                result = conn.call("run", address="169.254.1.2", cmd=cmd)
+                assert result == dict(
+                    cmd=cmd, exit_code=0, stdout=cmd, stderr=""
+                )
+
+    def test_unknown_method(self, rpc_server):
+        """Test methods not in RPC_METHODS can't be called."""
+        with server.Connection(rpc_server) as conn:
+            with pytest.raises(server.RemoteCallError) as err:
+                conn.call("_session", "169.254.1.2")
+        assert err.value.code == server.METHOD_NOT_FOUND
+
+    def test_invalid_params(self, rpc_server):
+        """Test calls with the wrong arguments are rejected."""
+        with server.Connection(rpc_server) as conn:
+            with pytest.raises(server.RemoteCallError) as err:
+                conn.call("run", address="169.254.1.2")
+        assert err.value.code == server.INVALID_PARAMS
+
+    def test_notification_has_no_response(self, mock_session):
+        """Test requests without an id don't get a response."""
+        request = dict(jsonrpc="2.0", method="disconnect", params=["::1"])
+        with api.Client() as client:
+            assert server.handle_request(client, request) is None
+
+    def test_port_requires_token(self, tmp_path, mock_session):
+        """Test requests on a port must hold the token from the file."""
+        token_path = str(tmp_path / "mbl-cli.token")
+        with api.Client() as client:
+            rpc_server = server.create_server(
+                client, port=0, token_path=token_path
+            )
+            thread = threading.Thread(target=rpc_server.serve_forever)
+            thread.start()
+            try:
+                port = rpc_server.server_address[1]
+                assert stat.S_IMODE(os.stat(token_path).st_mode) == 0o600
+                with open(token_path) as token_file:
+                    token = token_file.read()
+                for bad_token in ("", "0" * len(token)):
+                    with server.Connection(port=port, token=bad_token) as conn:
+                        with pytest.raises(server.RemoteCallError) as err:
+                            conn.call("run", address="::1", cmd="uptime")
+                    assert err.value.code == server.UNAUTHORIZED
+                assert not mock_session.called
+                with server.Connection(port=port, token=token) as conn:
+                    result = conn.call("run", address="::1", cmd="uptime")
+                assert result["exit_code"] == 0
+            finally:
+                rpc_server.shutdown()
+                rpc_server.server_close()
+                thread.join()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""SSH helper tests."""
+
+import subprocess
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from mbl.cli.utils import device, ssh
+
+TOKEN = "0123456789abcdef"
+
+
+def _run_locally(cmds, cwd=None):
+    """Run a batch script with the local shell, return the parsed results."""
+    script = ssh._build_batch_script(cmds, TOKEN)
+    proc = subprocess.run(
+        ["sh", "-c", script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+    )
+    return ssh._parse_batch_output(cmds, TOKEN, proc.stdout, proc.stderr)
+
+
+class TestBatchScript:
+    """Test batch scripts are built and parsed correctly."""
+
+    def test_results_are_separated_per_command(self):
+        """Test each command gets its own output and exit code."""
+        results = _run_locally(
+            ["echo one", "echo two >&2; exit 3", "printf 'no newline'"]
+        )
+        assert results == [
+            ssh.CommandResult("echo one", 0, "one\n", ""),
+            ssh.CommandResult("echo two >&2; exit 3", 3, "", "two\n"),
+            ssh.CommandResult("printf 'no newline'", 0, "no newline", ""),
+        ]
+
+    def test_commands_do_not_affect_each_other(self, tmp_path):
+        """Test state changes and comments don't leak into later commands."""
+        results = _run_locally(
+            ["cd / # go to root", "pwd", "exit 1", "true"], cwd=str(tmp_path)
+        )
+        assert results[1].stdout == "{}\n".format(tmp_path)
+        assert [r.exit_code for r in results] == [0, 0, 1, 0]
+
+    def test_incomplete_batch(self):
+        """Test commands which didn't run have no exit code."""
+        cmds = ["echo one", "echo two"]
+        script = ssh._build_batch_script(cmds[:1], TOKEN)
+        proc = subprocess.run(["sh", "-c", script], stdout=subprocess.PIPE)
+        results = ssh._parse_batch_output(cmds, TOKEN, proc.stdout, b"")
+        assert results[0].exit_code == 0
+        assert results[1] == ssh.CommandResult("echo two", None, "", "")
+
+
+class TestRunBatch:
+    """Test SSHSession.run_batch."""
+
+    @pytest.fixture
+    def session(self):
+        """SSHSession with a mocked client."""
+        with mock.patch(
+            "mbl.cli.utils.ssh.SSHClientWithNoAuthSupport", autospec=True
+        ):
+            session = ssh.SSHSession(mock.MagicMock())
+            with mock.patch.object(session, "_run_script") as run_script:
+                run_script.side_effect = lambda cmds: [
+                    ssh.CommandResult(c, 0, c, "") for c in cmds
+                ]
+                yield session, run_script
+
+    @pytest.mark.parametrize("jobs, channels", [(1, 1), (2, 2), (8, 3)])
+    def test_commands_split_between_channels(self, session, jobs, channels):
+        """Test results keep the order of the commands."""
+        session, run_script = session
+        results = session.run_batch(["a", "b", "c"], jobs=jobs)
+        assert [r.stdout for r in results] == ["a", "b", "c"]
+        assert run_script.call_count == channels
+
+
+class TestConnectFirst:
+    """Test connections are raced across a device's addresses."""
+
+    @pytest.fixture
+    def network(self, tmp_path):
+        """Fake TCP connections, where "slow" never connects."""
+        never = threading.Event()
+
+        def _create_connection(address_port, timeout=None):
+            address, _ = address_port
+            if address == "slow":
+                never.wait(5)
+                raise OSError("timed out")
+            if address == "broken":
+                raise OSError("unreachable")
+            return mock.MagicMock(name=address)
+
+        with mock.patch.object(
+            ssh.socket, "create_connection", side_effect=_create_connection
+        ) as create_connection, mock.patch.object(
+            ssh, "PREFERRED_ADDRESS_FILE_PATH", tmp_path / "preferred.json"
+        ):
+            yield create_connection
+        never.set()
+
+    def test_slow_address_does_not_block(self, network):
+        """Test the next address is tried after the attempt delay."""
+        start = time.monotonic()
+        address, _ = ssh._connect_first(("slow", "fast"), 22)
+        assert address == "fast"
+        assert time.monotonic() - start < 2
+
+    def test_broken_address_is_skipped_at_once(self, network):
+        """Test a failed attempt starts the next one immediately."""
+        with mock.patch.object(ssh, "CONNECTION_ATTEMPT_DELAY_S", 60):
+            address, _ = ssh._connect_first(("broken", "fast"), 22)
+        assert address == "fast"
+
+    def test_winner_is_tried_first_next_time(self, network):
+        """Test the address which won is remembered."""
+        ssh._connect_first(("broken", "fast"), 22)
+        network.reset_mock()
+        ssh._connect_first(("broken", "fast"), 22)
+        assert network.call_args_list == [mock.call(("fast", 22), timeout=30)]
+
+    def test_raises_if_all_fail(self, network):
+        """Test the last error is raised if no address connects."""
+        with pytest.raises(OSError):
+            ssh._connect_first(("broken", "broken"), 22)
+
+    def test_socket_passed_to_paramiko(self, network):
+        """Test a session for a device with several addresses races them."""
+        dev = device.create_device("mbl", "slow", addresses=["slow", "fast"])
+        with mock.patch(
+            "mbl.cli.utils.ssh.SSHClientWithNoAuthSupport", autospec=True
+        ) as client:
+            ssh.SSHSession(dev, port=22)._connect()
+        args, kwargs = client().connect.call_args
+        assert args == ("fast",)
+        assert kwargs["sock"]._mock_name == "fast"
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Test commands only import the dependencies they need."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = (
+    "paramiko",
+    "scp",
+    "zeroconf",
+    "mbed_cloud",
+    "cryptography",
+    "pkg_resources",
+)
+
+
+def _imported_modules(argv, home):
+    """Run mbl-cli with -X importtime, return the modules it imported."""
+    code = (
+        "import sys; from mbl.cli import mbl_cli; "
+        "sys.argv = {!r}; mbl_cli._main()".format(["mbl-cli"] + argv)
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=dict(os.environ, HOME=str(home)),
+    )
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in proc.stderr.decode().splitlines()
+        if line.startswith("import time:")
+    }
+
+
+class TestStartupImports:
+    """Guard against slow imports creeping into light-weight commands."""
+
+    @pytest.mark.parametrize(
+        "argv", [["--version"], ["which"], ["__complete", "mbl-cli -a ", "11"]]
+    )
+    def test_no_heavy_imports(self, argv, tmp_path):
+        """Test commands which don't need them skip the heavy imports."""
+        modules = _imported_modules(argv, tmp_path)
+        assert "mbl.cli.mbl_cli" in modules
+        assert not {m.split(".")[0] for m in modules} & set(HEAVY_MODULES)
@@ -6,10 +6,17 @@
 
 """Tests for the Store classes."""
 
+import hashlib
+import json
+import pathlib
+import subprocess
+import sys
+import threading
 from unittest import mock
 
 import pytest
-from mbl.cli.utils import store
+from mbl.cli.actions import import_certs_action
+from mbl.cli.utils import cert_bundle, file_handler, store
 
 
 class TestStore:
@@ -33,3 +40,319 @@ class TestStore:
             mock_fh.from_json.return_value = dict()
             with pytest.raises(store.StoreNotFoundError):
                 store.Store(store_type=store_type)
+
+
+CERTIFICATE = {"MBED_CLOUD_DEV_ACCOUNT_ID": b"000000", "arm_uc_id": b"\x01"}
+
+
+@pytest.fixture
+def team_store(tmp_path):
+    """A team store in a temporary directory."""
+    stores_path = tmp_path / "stores.json"
+    stores_path.write_text(json.dumps(dict(team=str(tmp_path / "team"))))
+    with mock.patch.object(
+        store.StoreLocationsRecord, "STORE_LOCATIONS_FILE_PATH", stores_path
+    ):
+        yield store.Store("team")
+    store.clear_store_cache()
+
+
+class TestStoreCertificates:
+    def test_certificate_saved_as_objects(self, team_store):
+        team_store.add_certificate("cert", CERTIFICATE)
+        paths = team_store.certificate_paths["cert"]
+        assert sorted(pathlib.Path(p).name for p in paths) == sorted(
+            hashlib.sha256(data).hexdigest() for data in CERTIFICATE.values()
+        )
+        assert store.Store("team").get_certificate("cert") == CERTIFICATE
+
+    def test_identical_fields_stored_once(self, team_store):
+        team_store.add_certificate("cert", CERTIFICATE)
+        team_store.add_certificate("copy", CERTIFICATE)
+        objects_dir = team_store.config_path.parent / "objects"
+        assert len(list(objects_dir.iterdir())) == len(CERTIFICATE)
+        team_store.delete_certificate("cert")
+        assert store.Store("team").get_certificate("copy") == CERTIFICATE
+        team_store.delete_certificate("copy")
+        assert list(objects_dir.iterdir()) == []
+
+    def test_resave_is_noop(self, team_store):
+        team_store.add_certificate("cert", CERTIFICATE)
+        with mock.patch.object(file_handler, "to_json") as to_json:
+            with mock.patch.object(
+                file_handler, "to_binary_file"
+            ) as to_binary_file:
+                team_store.add_certificate("cert", dict(CERTIFICATE))
+        assert not to_json.called
+        assert not to_binary_file.called
+
+    def test_corrupt_object_detected(self, team_store):
+        team_store.add_certificate("cert", CERTIFICATE)
+        pathlib.Path(team_store.certificate_paths["cert"][0]).write_bytes(
+            b"corrupt"
+        )
+        with pytest.raises(ValueError, match="corrupt"):
+            team_store.get_certificate("cert")
+
+    def test_bundle_certificate_read(self, team_store):
+        bundle_path = team_store.config_path.parent / (
+            "cert" + cert_bundle.SUFFIX
+        )
+        cert_bundle.write(bundle_path, CERTIFICATE)
+        team_store.certificate_paths["cert"] = [str(bundle_path)]
+        assert team_store.get_certificate("cert") == CERTIFICATE
+        team_store.add_certificate("cert", CERTIFICATE)
+        assert not bundle_path.exists()
+        assert team_store.get_certificate("cert") == CERTIFICATE
+
+    def test_legacy_certificate_read(self, team_store):
+        cert_dir = team_store.config_path.parent / "cert"
+        cert_dir.mkdir()
+        paths = []
+        for field, data in CERTIFICATE.items():
+            path = cert_dir / "{}.bin".format(field)
+            path.write_bytes(data)
+            paths.append(str(path))
+        team_store.certificate_paths["cert"] = paths
+        assert team_store.get_certificate("cert") == CERTIFICATE
+        team_store.delete_certificate("cert")
+        assert not cert_dir.exists()
+
+    def test_add_replaces_legacy_certificate(self, team_store):
+        cert_dir = team_store.config_path.parent / "cert"
+        cert_dir.mkdir()
+        (cert_dir / "arm_uc_id.bin").write_bytes(b"\x01")
+        team_store.certificate_paths["cert"] = [
+            str(cert_dir / "arm_uc_id.bin")
+        ]
+        team_store.add_certificate("cert", CERTIFICATE)
+        assert not cert_dir.exists()
+
+    def test_add_keeps_unrecorded_files(self, team_store):
+        team_store.add_certificate("a", CERTIFICATE)
+        other = team_store.config_path.parent / "other"
+        other.mkdir()
+        team_store.add_certificate("other", CERTIFICATE)
+        assert other.exists()
+        for name in ("a", "other"):
+            assert store.Store("team").get_certificate(name) == CERTIFICATE
+
+    @pytest.mark.parametrize(
+        "name",
+        ["objects", "config.json", ".config.json.lock", "x.lock", "a/b", ""],
+    )
+    def test_reserved_names_rejected(self, team_store, name):
+        team_store.add_certificate("a", CERTIFICATE)
+        with pytest.raises(ValueError):
+            team_store.add_certificate(name, CERTIFICATE)
+        assert store.Store("team").get_certificate("a") == CERTIFICATE
+
+    def test_legacy_paths_outside_store_kept(self, team_store, tmp_path):
+        outside = tmp_path / "outside"
+        outside.mkdir()
+        (outside / "arm_uc_id.bin").write_bytes(b"\x01")
+        team_store.certificate_paths["cert"] = [str(outside / "arm_uc_id.bin")]
+        team_store.delete_certificate("cert")
+        assert outside.exists()
+
+    def test_delete_certificate(self, team_store):
+        team_store.add_certificate("cert", CERTIFICATE)
+        paths = team_store.certificate_paths["cert"]
+        team_store.delete_certificate("cert")
+        assert "cert" not in store.Store("team").certificate_paths
+        assert not any(pathlib.Path(path).exists() for path in paths)
+
+    def test_get_missing_certificate_raises(self, team_store):
+        with pytest.raises(ValueError):
+            team_store.get_certificate("missing")
+
+
+class TestStoreBatch:
+    def test_config_saved_once(self, team_store):
+        with mock.patch.object(
+            file_handler, "to_json", wraps=file_handler.to_json
+        ) as to_json:
+            with team_store.batch():
+                for i in range(5):
+                    team_store.add_certificate(str(i), CERTIFICATE)
+                team_store.delete_certificate("0")
+        assert to_json.call_count == 1
+        assert sorted(store.Store("team").certificate_paths) == [
+            "1",
+            "2",
+            "3",
+            "4",
+        ]
+
+    def test_rollback_on_error(self, team_store):
+        team_store.add_certificate("kept", CERTIFICATE)
+        with pytest.raises(RuntimeError):
+            with team_store.batch():
+                team_store.add_certificate("new", CERTIFICATE)
+                team_store.delete_certificate("kept")
+                raise RuntimeError
+        assert list(team_store.certificate_paths) == ["kept"]
+        assert team_store.get_certificate("kept") == CERTIFICATE
+        assert store.Store("team").certificate_paths == (
+            team_store.certificate_paths
+        )
+
+    def test_rollback_on_save_error(self, team_store):
+        team_store.add_certificate("cert", CERTIFICATE)
+        new_certificate = dict(CERTIFICATE, arm_uc_id=b"\x02")
+        with mock.patch.object(file_handler, "to_json", side_effect=OSError):
+            with pytest.raises(OSError):
+                with team_store.batch():
+                    team_store.add_certificate("cert", new_certificate)
+                    team_store.add_certificate("other", new_certificate)
+        assert team_store.get_certificate("cert") == CERTIFICATE
+        assert list(team_store.certificate_paths) == ["cert"]
+        objects_dir = team_store.config_path.parent / "objects"
+        assert len(list(objects_dir.iterdir())) == len(CERTIFICATE)
+
+    def test_removal_error_keeps_saved_changes(self, team_store, caplog):
+        team_store.add_certificate("cert", CERTIFICATE)
+        with mock.patch.object(
+            pathlib.Path, "unlink", side_effect=PermissionError
+        ):
+            team_store.delete_certificate("cert")
+        assert "cert" not in team_store.certificate_paths
+        assert store.Store("team").certificate_paths == (
+            team_store.certificate_paths
+        )
+        assert "Couldn't remove" in caplog.text
+
+    def test_delete_then_add_keeps_bundle(self, team_store):
+        team_store.add_certificate("cert", CERTIFICATE)
+        with team_store.batch():
+            team_store.delete_certificate("cert")
+            team_store.add_certificate("cert", CERTIFICATE)
+        assert store.Store("team").get_certificate("cert") == CERTIFICATE
+
+
+class TestImportCertificatesCommand:
+    def test_import_certificates(self, team_store, tmp_path):
+        src = pathlib.Path(__file__).parent / "mbed_cloud_dev_credentials.c"
+        dev_path = tmp_path / "dev.c"
+        dev_path.write_text(src.read_text())
+        bundle_path = tmp_path / ("update" + cert_bundle.SUFFIX)
+        cert_bundle.write(bundle_path, CERTIFICATE)
+        args = mock.Mock(files=[str(dev_path), str(bundle_path)])
+        import_certs_action.execute(args)
+        imported = store.Store("team")
+        assert sorted(imported.certificate_paths) == ["dev", "update"]
+        assert imported.get_certificate("update") == CERTIFICATE
+        dev_cert = imported.get_certificate("dev")
+        assert dev_cert["MBED_CLOUD_DEV_ACCOUNT_ID"] == b"000000"
+
+    def test_invalid_file_imports_nothing(self, team_store, tmp_path):
+        bundle_path = tmp_path / ("update" + cert_bundle.SUFFIX)
+        cert_bundle.write(bundle_path, CERTIFICATE)
+        bad_path = tmp_path / "bad.c"
+        bad_path.write_text("int main(void) { return 0; }")
+        args = mock.Mock(files=[str(bundle_path), str(bad_path)])
+        with pytest.raises(ValueError):
+            import_certs_action.execute(args)
+        assert store.Store("team").certificate_paths == {}
+
+
+class TestStoreRegistry:
+    def test_store_is_shared(self, team_store):
+        shared_store = store.get_store("team")
+        assert store.get_store("team") is shared_store
+        store.clear_store_cache()
+        assert store.get_store("team") is not shared_store
+
+    def test_config_read_once(self, team_store):
+        store.get_store("team")
+        with mock.patch.object(
+            file_handler, "from_json", wraps=file_handler.from_json
+        ) as from_json:
+            shared_store = store.get_store("team")
+            shared_store.add_certificate("cert", CERTIFICATE)
+            assert store.get_store("team") is shared_store
+        assert not from_json.called
+
+    def test_reloaded_when_changed_on_disk(self, team_store):
+        shared_store = store.get_store("team")
+        # Another process adds a certificate.
+        team_store.add_certificate("cert", CERTIFICATE)
+        assert store.get_store("team") is shared_store
+        assert list(shared_store.certificate_paths) == ["cert"]
+
+    def test_not_reloaded_in_batch(self, team_store):
+        shared_store = store.get_store("team")
+        with shared_store.batch():
+            shared_store.add_certificate("staged", CERTIFICATE)
+            team_store.add_certificate("cert", CERTIFICATE)
+            store.get_store("team")
+            assert list(shared_store.certificate_paths) == ["staged"]
+
+
+ADD_CERTIFICATES_SCRIPT = """
+import pathlib, sys
+from mbl.cli.utils import store
+store.StoreLocationsRecord.STORE_LOCATIONS_FILE_PATH = pathlib.Path(
+    sys.argv[1]
+)
+for i in range(10):
+    store.get_store("team").add_certificate(
+        "{}-{}".format(sys.argv[2], i), {"field": b"data"}
+    )
+"""
+
+
+class TestStoreLocking:
+    def test_concurrent_processes_keep_all_certificates(
+        self, team_store, tmp_path
+    ):
+        workers = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "-c",
+                    ADD_CERTIFICATES_SCRIPT,
+                    str(tmp_path / "stores.json"),
+                    "worker{}".format(n),
+                ],
+                cwd=str(pathlib.Path(__file__).parents[2]),
+            )
+            for n in range(4)
+        ]
+        assert [worker.wait() for worker in workers] == [0] * 4
+        saved_store = store.Store("team")
+        assert len(saved_store.certificate_paths) == 40
+        # All the certificates share one object.
+        assert list(saved_store._object_refcounts.values()) == [40]
+
+    def test_changes_merged_with_other_writers(self, team_store):
+        other_store = store.Store("team")
+        team_store.add_certificate("mine", CERTIFICATE)
+        other_store.api_key = "key"
+        other_store.add_certificate("theirs", CERTIFICATE)
+        team_store.delete_certificate("mine")
+        saved_store = store.Store("team")
+        assert list(saved_store.certificate_paths) == ["theirs"]
+        assert saved_store.api_key == "key"
+
+    def test_lock_timeout(self, team_store):
+        lock_path = team_store.config_path.with_name(".config.json.lock")
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            with file_handler.lock_file(lock_path, timeout=1):
+                locked.set()
+                release.wait()
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        locked.wait()
+        try:
+            with mock.patch.object(store, "LOCK_TIMEOUT_S", 0.05):
+                with pytest.raises(TimeoutError):
+                    team_store.add_certificate("cert", CERTIFICATE)
+        finally:
+            release.set()
+            holder.join()
+        assert "cert" not in team_store.certificate_paths
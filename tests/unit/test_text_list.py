@@ -5,20 +5,22 @@
 
 """Text list tests."""
 
-import re
-
 import pytest
 
-from mbl.cli.utils import text_list
+from mbl.cli.utils import device, text_list
+
+
+def _devices(*addresses):
+    return [
+        device.create_device("mbed-linux-os-{}".format(i), address)
+        for i, address in enumerate(addresses)
+    ]
 
 
-@pytest.fixture(params=[("blah", "haha", "jajaja"), ()])
+@pytest.fixture(params=[("10.0.0.2", "fe80::1%eth0", "10.0.0.10"), ()])
 def _text_list(request):
-    """Create TextList with all args in params."""
-    the_list = text_list.IndexedTextList()
-    for p in request.param:
-        the_list.append(p)
-    yield the_list
+    """Create an IndexedTextList with a device for each address."""
+    yield text_list.IndexedTextList(_devices(*request.param))
 
 
 class TestTextList:
@@ -26,11 +28,49 @@ class TestTextList:
 
     def test_item_can_be_added(self, _text_list):
         """Check an item is added to the list."""
-        initial_len = len(_text_list.data)
-        _text_list.append("yep")
-        assert len(_text_list.data) > initial_len
+        initial_len = len(_text_list)
+        _text_list.append(device.create_device("yep", "10.0.0.1"))
+        assert len(_text_list) == initial_len + 1
+        assert _text_list[0].hostname == "yep"
 
     def test_list_formatted_correctly(self, _text_list):
-        """Check the formatting is correct."""
-        for returned_item in _text_list:
-            assert re.match(r"[a-zA-Z]*", returned_item) is not None
+        """Check each device is shown on a numbered line."""
+        lines = str(_text_list).splitlines()
+        assert len(lines) == len(_text_list)
+        for number, (line, dev) in enumerate(zip(lines, _text_list), 1):
+            assert line == "{}: {}: {}".format(
+                number, dev.hostname, dev.address
+            )
+
+    def test_addresses_sorted_by_value(self):
+        """Check IPv4 addresses sort numerically, before IPv6 addresses."""
+        devices = text_list.IndexedTextList(
+            _devices(
+                "fe80::10%eth0",
+                "10.0.0.10",
+                "fe80::9%eth0",
+                "not-an-ip",
+                "10.0.0.9",
+                "fe80::9%eth10",
+                "fe80::9%eth2",
+            )
+        )
+        assert [dev.address for dev in devices] == [
+            "10.0.0.9",
+            "10.0.0.10",
+            "fe80::9%eth0",
+            "fe80::9%eth2",
+            "fe80::9%eth10",
+            "fe80::10%eth0",
+            "not-an-ip",
+        ]
+
+    def test_hostnames_sorted_naturally(self):
+        """Check devices with the same address sort by hostname number."""
+        devices = text_list.IndexedTextList(
+            [
+                device.create_device(name, "10.0.0.1")
+                for name in ("os-10", "os-9", "os-100")
+            ]
+        )
+        assert [dev.hostname for dev in devices] == ["os-9", "os-10", "os-100"]
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Arm Limited and Contributors. All rights reserved.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Trace span tests."""
+
+import argparse
+import json
+
+import pytest
+
+from mbl.cli import mbl_cli
+from mbl.cli.utils import trace
+
+
+@pytest.fixture
+def tracing():
+    """Enable tracing for a test."""
+    trace.enable()
+    yield
+    trace.disable()
+    trace.SPANS.clear()
+
+
+class TestSpans:
+    """Recording spans."""
+
+    def test_disabled_spans_record_nothing(self):
+        """Test spans are shared no-ops when tracing is disabled."""
+        with trace.span("a", "test") as span:
+            span.set(x=1)
+        trace.add("b", "test", 0.0)
+        assert trace.span("c", "test") is span
+        assert trace.SPANS == []
+
+    def test_span_records_timing_and_args(self, tracing):
+        """Test a span records its duration and details."""
+        with trace.span("a", "test", x=1) as span:
+            span.set(y=2)
+        [recorded] = trace.SPANS
+        assert recorded.name == "a"
+        assert recorded.category == "test"
+        assert recorded.duration_s >= 0
+        assert recorded.args == dict(x=1, y=2)
+
+    def test_span_records_error(self, tracing):
+        """Test a span ended by an exception records the exception type."""
+        with pytest.raises(ValueError):
+            with trace.span("a", "test"):
+                raise ValueError
+        assert trace.SPANS[0].args == dict(error="ValueError")
+
+    def test_summary_groups_spans_by_name(self, tracing):
+        """Test the summary totals spans with the same name."""
+        trace.add("a", "test", 1.0, 2.0)
+        trace.add("b", "test", 1.5, 2.0)
+        trace.add("a", "test", 3.0, 6.0)
+        assert trace.summary() == [("a", 2, 4.0, 3.0), ("b", 1, 0.5, 0.5)]
+        assert "a" in trace.format_summary()
+
+    def test_chrome_trace(self, tracing, tmp_path):
+        """Test spans are written as Chrome trace complete events."""
+        trace.add("a", "test", 1.0, 1.5, x=1)
+        trace.add("b", "test", 1.25, 1.5)
+        trace_path = tmp_path / "trace.json"
+        trace.write_chrome_trace(trace_path)
+        events = json.loads(trace_path.read_text())["traceEvents"]
+        assert [(e["name"], e["ph"], e["ts"], e["dur"]) for e in events] == [
+            ("a", "X", 0.0, 500000.0),
+            ("b", "X", 250000.0, 250000.0),
+        ]
+        assert events[0]["args"] == dict(x=1)
+
+
+class TestProfileOption:
+    """The --profile and --profile-trace options."""
+
+    def test_profile_prints_summary(self, tmp_path, capsys):
+        """Test the summary and trace file cover the command's spans."""
+
+        def command(args):
+            with trace.span("command", "test"):
+                pass
+
+        trace_path = tmp_path / "trace.json"
+        args = argparse.Namespace(
+            func=command,
+            profile=True,
+            profile_trace=str(trace_path),
+            metrics_file=None,
+        )
+        try:
+            mbl_cli._run(args)
+        finally:
+            trace.disable()
+        assert "command" in capsys.readouterr().err
+        events = json.loads(trace_path.read_text())["traceEvents"]
+        assert [e["name"] for e in events] == ["command"]